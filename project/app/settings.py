@@ -72,11 +72,19 @@ if DEBUG:
     INSTALLED_APPS.append('debug_toolbar')
 
 MIDDLEWARE = [
+    # first, so its total covers the rest of the stack; a no-op unless PERF_SAMPLE_RATE > 0
+    'common.perf.PerfMiddleware',
+    'common.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # staff-only, signed ?_profile=<token> (common.profiling)
+    'common.profiling.ProfilerMiddleware',
+    'common.slow_queries.SlowQueryMiddleware',
+    # only active when DATABASES['replica'] is configured (common.db.routers)
+    'common.db.routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -88,7 +96,8 @@ ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates + render timing for sampled requests (common.perf)
+        'BACKEND': 'common.perf.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -110,22 +119,69 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # django.db.backends.postgresql + connection metrics and idle-aware health checks
+        'ENGINE': 'common.db.postgresql',
         'NAME': os.environ.get('DB_NAME', 'grdbhome'),
         'USER': os.environ.get('DB_USER', 'home'),
         'PASSWORD': os.environ.get('DB_PASSWORD', 'home'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        # Persistent connections: each gunicorn worker reuses one connection for up to
+        # DB_CONN_MAX_AGE seconds instead of connecting (TLS + auth) on every request; 0 disables.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        # Check a reused connection before the first query of a request (and after
+        # DB_HEALTH_CHECK_IDLE seconds of idling in long-running commands)
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'True').lower() in ('1', 'true', 'yes', 'on'),
+        'HEALTH_CHECK_IDLE': int(os.environ.get('DB_HEALTH_CHECK_IDLE', '30')),
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+        },
     }
 }
 
+# Connection pool (Django >= 5.1 with psycopg 3 and psycopg-pool): replaces persistent connections
+if os.environ.get('DB_POOL', 'False').lower() in ('1', 'true', 'yes', 'on'):
+    import django
+
+    if django.VERSION >= (5, 1):
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '1')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '4')),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800')),
+        }
+
+# Optional read replica for catalog/search/product/home reads (common.db.routers).
+# Unset DB_REPLICA_* values fall back to the primary's; in tests the alias mirrors 'default'.
+if os.environ.get('DB_REPLICA_HOST') or os.environ.get('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.environ.get('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.environ.get('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['common.db.routers.ReplicaRouter']
+# After a write the client reads from the primary for this long (replication lag)
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', '5'))
+
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        # FileBasedCache + hit/miss counting for sampled requests (common.perf)
+        "BACKEND": "common.perf.FileBasedCache",
         "LOCATION": BASE_DIR / "cache",
     }
 }
 
+# Sessions: cached_db reads from the cache and falls back to the DB (writes go to both);
+# "django.contrib.sessions.backends.cache" skips the DB entirely. Anonymous visitors get
+# a session only once they add something to the cart (carts.utils.get_user_carts).
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -171,11 +227,141 @@ STATICFILES_DIRS = [
 _static_storage = os.environ.get('STATICFILES_STORAGE', '').strip()
 if _static_storage:
     STATICFILES_STORAGE = _static_storage
+# Media: app.storage.DedupFileSystemStorage stores uploads content-addressed (one copy + one set of
+# variants per distinct image; `manage.py dedup_media` moves existing uploads in). Uploads under a
+# MEDIA_ACCESS_RULES prefix (below) are exempt: cas/ is served publicly.
+_media_storage = os.environ.get('DEFAULT_FILE_STORAGE', '').strip()
+if _media_storage:
+    DEFAULT_FILE_STORAGE = _media_storage
+# app.storage.S3MediaStorage (DEFAULT_FILE_STORAGE=app.storage.S3MediaStorage): any S3-compatible bucket,
+# served from MEDIA_S3_PUBLIC_URL (CDN / public bucket endpoint) instead of MEDIA_URL
+MEDIA_S3_ENDPOINT = os.environ.get('MEDIA_S3_ENDPOINT', '')
+MEDIA_S3_BUCKET = os.environ.get('MEDIA_S3_BUCKET', '')
+MEDIA_S3_REGION = os.environ.get('MEDIA_S3_REGION', 'us-east-1')
+MEDIA_S3_ACCESS_KEY = os.environ.get('MEDIA_S3_ACCESS_KEY', '')
+MEDIA_S3_SECRET_KEY = os.environ.get('MEDIA_S3_SECRET_KEY', '')
+MEDIA_S3_PUBLIC_URL = os.environ.get('MEDIA_S3_PUBLIC_URL', '')
+MEDIA_S3_PART_SIZE_MB = int(os.environ.get('MEDIA_S3_PART_SIZE_MB', '8'))
+MEDIA_S3_POOL_SIZE = int(os.environ.get('MEDIA_S3_POOL_SIZE', '10'))
+MEDIA_S3_CACHE_CONTROL = os.environ.get('MEDIA_S3_CACHE_CONTROL', 'public, max-age=2592000')
+# app.storage.Compressed*: .gz/.br siblings for nginx gzip_static/brotli_static (0 workers = CPU count)
+STATIC_COMPRESS_WORKERS = int(os.environ.get('STATIC_COMPRESS_WORKERS', '0')) or None
+STATIC_COMPRESS_MIN_SIZE = int(os.environ.get('STATIC_COMPRESS_MIN_SIZE', '512'))
+
+# CSS/JS bundles per page (common.assets): `manage.py build_assets` before collectstatic writes them
+# to ASSET_BUILD_DIR; {% bundle_css %}/{% bundle_js %} use them when enabled (default: when DEBUG is off)
+ASSET_BUILD_DIR = BASE_DIR / 'assets_build'
+if ASSET_BUILD_DIR.is_dir():
+    STATICFILES_DIRS.append(ASSET_BUILD_DIR)
+ASSET_BUNDLES_ENABLED = os.environ.get('ASSET_BUNDLES', str(not DEBUG)).lower() in ('1', 'true', 'yes', 'on')
+ASSET_BUNDLES = {
+    'base': {
+        'css': ['deps/css/header-hero.css', 'deps/css/discount_badge.css'],
+    },
+    'home': {
+        'css': [
+            'deps/css/templatemo-style.css', 'deps/css/seo-text.css', 'deps/css/news_slider.css',
+            'deps/css/categories-glass.css', 'deps/css/bestsellers-carousel.css', 'deps/css/footer.css',
+            'deps/css/cart-component.css', 'deps/css/faq.css',
+        ],
+        'js': [
+            'deps/js/faq.js', 'deps/js/news_slider.js', 'deps/js/categories-glass.js', 'deps/js/bestsellers-tilt.js',
+            'deps/js/jquery-ajax.js', 'deps/js/bestsellers-carousel.js', 'deps/js/cart-component.js',
+        ],
+        'critical': 'main/home.html',
+    },
+    'product': {
+        'css': [
+            'deps/css/templatemo-style.css', 'deps/css/product_page.css', 'deps/css/discount_badge.css',
+            'deps/css/header-hero.css', 'deps/css/footer.css', 'deps/css/cart-component.css',
+        ],
+        'js': [
+            'deps/js/jquery.min.js', 'deps/js/product_page.js', 'deps/js/product_related.js',
+            'deps/js/cart-component.js', 'deps/js/jquery-ajax.js',
+        ],
+        'critical': 'goods/product.html',
+    },
+}
+
+# Subsetted WOFF2 fonts (common.fonts): `manage.py subset_fonts` before collectstatic; the Compressed*
+# storages then point CSS url()s at the subsets. Text fonts keep these ranges + characters used in templates
+FONT_SUBSETS = {
+    'deps/webfonts/TagesschriftCyrillic-Regular.ttf': {
+        # Basic Latin, Latin-1, Cyrillic incl. Ґґ, dashes/quotes/ellipsis, №, ₴
+        'unicodes': 'U+0020-007E,U+00A0-00FF,U+0400-045F,U+0490-0491,U+2010-2027,U+2116,U+20B4',
+    },
+}
+# Font Awesome CSS: trimmed to the fa-* icons used in templates/JS/CSS (fonts/icons.css), collected under
+# this same name so templates keep linking it
+ICON_FONT_CSS = 'deps/css/all.min.css'
+
+# Responsive image variants (common.image_utils.generate_width_ladder): per role, the widths written as
+# <name>_<W>x<H>.avif/.webp, the canvas aspect ratio and fit, and the `sizes` the media_extras tags emit
+# with the `w`-descriptor srcset (empty sizes: the tag's width in px)
+IMAGE_WIDTH_LADDERS = {
+    # product cards (catalog grid, bestsellers): 230px wide on desktop, ~2 per row on phones
+    'card': {'widths': [200, 230, 320, 460, 690], 'aspect': (230, 160), 'mode': 'cover',
+             'sizes': '(min-width: 768px) 230px, 50vw'},
+    # product page gallery; 640/800/1024/1200 match the legacy breakpoint variants
+    'gallery': {'widths': [400, 640, 800, 1024, 1200, 1600], 'aspect': (4, 3), 'mode': 'contain',
+                'sizes': '(min-width: 992px) 50vw, 100vw'},
+    'icon': {'widths': [128, 256, 384], 'aspect': (1, 1), 'mode': 'contain', 'sizes': ''},
+    # category presentation banner (seo_image)
+    'seo': {'widths': [320, 480, 640, 800], 'aspect': (16, 9), 'mode': 'cover',
+            'sizes': '(max-width: 767px) 260px, 320px'},
+}
+
+# On-demand resizing endpoint /img/ (common.image_resize): signed URLs, encoded results kept in an
+# LRU disk cache; nginx caches the responses in front (deploy/nginx*.conf)
+IMAGE_RESIZE_KEY = os.environ.get('IMAGE_RESIZE_KEY', '') or None  # default: SECRET_KEY
+IMAGE_RESIZE_CACHE_DIR = Path(os.environ.get('IMAGE_RESIZE_CACHE_DIR', BASE_DIR / 'cache' / 'img'))
+IMAGE_RESIZE_CACHE_MAX_MB = int(os.environ.get('IMAGE_RESIZE_CACHE_MAX_MB', '512'))
+IMAGE_RESIZE_MAX_DIM = int(os.environ.get('IMAGE_RESIZE_MAX_DIM', '2400'))
+IMAGE_RESIZE_MAX_AGE = int(os.environ.get('IMAGE_RESIZE_MAX_AGE', '2592000'))
+
+# Bounded-memory image ingest (common.image_utils.open_bounded): uploads over IMAGE_MAX_PIXELS are rejected
+# from the header (admin forms) and never decoded; variants are made from at most IMAGE_MAX_EDGE px on the
+# long side (JPEGs decoded in draft mode). IMAGE_NORMALIZE_ORIGINALS also rewrites uploaded originals to
+# that edge, EXIF-oriented and without camera metadata (GPS etc.).
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', '60000000'))
+IMAGE_MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', '2560'))
+IMAGE_NORMALIZE_ORIGINALS = os.environ.get('IMAGE_NORMALIZE_ORIGINALS', 'False').lower() in ('1', 'true', 'yes', 'on')
+
+# Encoder speed/effort profiles (common.image_utils.encoding_profile): goods.signals encode admin uploads
+# 'interactive', the batch management commands 'archival'; IMAGE_ENCODING_PROFILE applies elsewhere (the
+# /img/ endpoint). avif_max_threads 0 = all CPUs. Compare settings with `manage.py benchmark_images`.
+IMAGE_ENCODING_PROFILES = {
+    'interactive': {'avif_speed': 8, 'avif_max_threads': 2, 'avif_subsampling': '4:2:0', 'webp_method': 4},
+    'archival': {'avif_speed': 4, 'avif_max_threads': 0, 'avif_subsampling': '4:2:0', 'webp_method': 6},
+}
+IMAGE_ENCODING_PROFILE = os.environ.get('IMAGE_ENCODING_PROFILE', 'interactive')
+
+# Perceptual-quality-targeted encoding (common.image_quality, needs NumPy): when set (e.g. 0.98), uploaded
+# images get the lowest AVIF/WebP quality whose SSIM against the source reaches it, instead of the fixed
+# presets; the chosen quality and byte savings go to the <image>.meta.json sidecar. Empty/0 disables it.
+IMAGE_SSIM_TARGET = float(os.environ.get('IMAGE_SSIM_TARGET', '0') or 0) or None
 
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media served through Django (common.media_serving: /media/ when nginx forwards it, and /img/): with
+# MEDIA_X_ACCEL_REDIRECT on, the app only authorizes and nginx sends the file from the `internal`
+# location mapped to its directory (deploy/nginx*.conf). Content-addressed names (cas/) are cached as
+# immutable, other media for MEDIA_MAX_AGE seconds; MEDIA_ACCESS_RULES guard name prefixes.
+MEDIA_X_ACCEL_REDIRECT = os.environ.get('MEDIA_X_ACCEL_REDIRECT', 'False').lower() in ('1', 'true', 'yes', 'on')
+MEDIA_X_ACCEL_LOCATIONS = {
+    str(MEDIA_ROOT): '/_protected/media/',
+    str(IMAGE_RESIZE_CACHE_DIR): '/_protected/img/',
+}
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', '604800'))
+# every prefix needs its own nginx location forwarding to the app (deploy/nginx*.conf), otherwise nginx
+# serves it directly from MEDIA_ROOT
+MEDIA_ACCESS_RULES = {
+    # avatars are only shown on the owner's profile page
+    'users_images/': 'common.media_serving.owner_or_staff',
+}
+
 INTERNAL_IPS = [
     # ...
     "127.0.0.1",
@@ -269,6 +455,28 @@ LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
 LOG_TO_FILE = os.environ.get('LOG_TO_FILE', 'False').lower() in ('1', 'true', 'yes', 'on')
 LOG_FILE = os.environ.get('LOG_FILE', str(BASE_DIR / 'logs' / 'app.log'))
 
+# Per-request performance sampling (common.perf.PerfMiddleware).
+# 0 disables it; 0.01 instruments ~1% of requests with Server-Timing + a JSON "perf" log line.
+PERF_SAMPLE_RATE = float(os.environ.get('PERF_SAMPLE_RATE', '0') or 0)
+PERF_SERVER_TIMING = _env_bool('PERF_SERVER_TIMING', 'True')
+PERF_LOG = _env_bool('PERF_LOG', 'True')
+
+# Prometheus /metrics (common.metrics). Reachable from these addresses or with
+# "Authorization: Bearer <METRICS_TOKEN>"; block it in Nginx as well, since proxied
+# requests arrive from 127.0.0.1. PROMETHEUS_MULTIPROC_DIR is read from the environment.
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# On-demand profiles of single requests / management commands (common.profiling, /admin/profiles/).
+# Only the newest PROFILER_MAX_FILES are kept; tokens expire after PROFILER_TOKEN_MAX_AGE seconds.
+PROFILER_DIR = Path(os.environ.get('PROFILER_DIR', str(BASE_DIR / 'profiles')))
+PROFILER_MAX_FILES = int(os.environ.get('PROFILER_MAX_FILES', '50'))
+PROFILER_TOKEN_MAX_AGE = int(os.environ.get('PROFILER_TOKEN_MAX_AGE', '3600'))
+
+# Slow-query log (common.slow_queries): queries slower than this go to the "slow_query" logger and to
+# admin → Медленные запросы (with EXPLAIN for SELECTs). Negative disables it.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '300'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -304,6 +512,26 @@ LOGGING = {
             'level': LOG_LEVEL,
             'propagate': False,
         },
+        # Queries above SLOW_QUERY_THRESHOLD_MS (common.slow_queries)
+        'slow_query': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # One JSON line per sampled request (common.perf)
+        'perf': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # httpx logs every Nova Poshta request at INFO (orders views)
+        'httpx': {
+            'level': 'WARNING',
+        },
+        # subset_fonts: fontTools.subset logs every pruned table at INFO
+        'fontTools': {
+            'level': 'WARNING',
+        },
     },
 }
 
@@ -323,4 +551,6 @@ if LOG_TO_FILE:
     }
     LOGGING['root']['handlers'].append('file')
     LOGGING['loggers']['django.request']['handlers'].append('file')
-    LOGGING['loggers']['orders']['handlers'].append('file')
\ No newline at end of file
+    LOGGING['loggers']['orders']['handlers'].append('file')
+    LOGGING['loggers']['perf']['handlers'].append('file')
+    LOGGING['loggers']['slow_query']['handlers'].append('file')
\ No newline at end of file
@@ -1,4 +1,29 @@
-from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.deconstruct import deconstructible
+
+from common import fonts
+
+try:
+    import brotli
+except ImportError:  # optional dependency: only .gz is written without it
+    brotli = None
+
+# Text assets worth precompressing (woff/woff2, images are already compressed)
+COMPRESSIBLE_EXTENSIONS = frozenset({
+    ".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".xml", ".html", ".ttf", ".otf", ".eot", ".ico",
+})
 
 
 class ManifestStaticFilesStorageLoose(ManifestStaticFilesStorage):
@@ -23,3 +48,336 @@ class ManifestStaticFilesStorageNoPostProcess(ManifestStaticFilesStorage):
 
     # Do not try to rewrite url(...) inside CSS or sourcemap hints
     patterns = ()
+
+
+def _compress_file(path, source_hash, min_size):
+    """
+    Worker (runs in a child process): write path.gz / path.br next to the file.
+    A variant that doesn't beat the original by 5% is not kept. Returns (source_hash, written suffixes).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    variants = {}
+    if len(data) >= min_size:
+        variants[".gz"] = gzip.compress(data, compresslevel=9, mtime=0)
+        if brotli is not None:
+            variants[".br"] = brotli.compress(data, quality=11)
+    written = []
+    for suffix in (".gz", ".br"):
+        target = path + suffix
+        compressed = variants.get(suffix)
+        if compressed is not None and len(compressed) < len(data) * 0.95:
+            with open(target, "wb") as f:
+                f.write(compressed)
+            written.append(suffix)
+        elif os.path.exists(target):
+            # stale sibling from a previous build would be served instead of the new file
+            os.remove(target)
+    return source_hash, written
+
+
+class PrecompressMixin:
+    """
+    After post-processing, write .gz (and .br with the Brotli package) siblings of text
+    assets so nginx serves them via gzip_static / brotli_static without compressing.
+
+    Files whose content hash matches the previous run (staticfiles.compressed.json) are
+    skipped. Compression runs in a process pool of STATIC_COMPRESS_WORKERS processes
+    (default: CPU count); files below STATIC_COMPRESS_MIN_SIZE bytes are left alone.
+    Local filesystem storages only (uses self.path).
+    """
+
+    compressed_manifest_name = "staticfiles.compressed.json"
+
+    def post_process(self, paths, dry_run=False, **options):
+        parent = getattr(super(), "post_process", None)
+        if parent is not None:
+            yield from parent(paths, dry_run, **options)
+        if not dry_run:
+            self.precompress(self._served_names(paths))
+
+    def _served_names(self, paths):
+        names = set(paths)
+        # manifest storages serve the hashed copies
+        names.update(getattr(self, "hashed_files", {}).values())
+        return sorted(
+            name for name in names
+            if name and os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS and self.exists(name)
+        )
+
+    def _load_compressed_manifest(self):
+        try:
+            with open(self.path(self.compressed_manifest_name), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def precompress(self, names):
+        """Compress names (storage-relative); returns the list of names that were (re)compressed."""
+        previous = self._load_compressed_manifest()
+        manifest, jobs = {}, {}
+        for name in names:
+            path = self.path(name)
+            with open(path, "rb") as f:
+                source_hash = hashlib.sha256(f.read()).hexdigest()
+            done = previous.get(name)
+            if done and done["hash"] == source_hash and all(os.path.exists(path + s) for s in done["variants"]):
+                manifest[name] = done
+            else:
+                jobs[name] = (path, source_hash)
+
+        min_size = int(getattr(settings, "STATIC_COMPRESS_MIN_SIZE", 512))
+        workers = getattr(settings, "STATIC_COMPRESS_WORKERS", None) or os.cpu_count() or 1
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                futures = {name: pool.submit(_compress_file, path, h, min_size) for name, (path, h) in jobs.items()}
+                results = {name: future.result() for name, future in futures.items()}
+        else:
+            results = {name: _compress_file(path, h, min_size) for name, (path, h) in jobs.items()}
+        for name, (source_hash, written) in results.items():
+            manifest[name] = {"hash": source_hash, "variants": written}
+
+        with open(self.path(self.compressed_manifest_name), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=0, sort_keys=True)
+        return sorted(results)
+
+
+class SubsetFontsMixin:
+    """
+    Before post-processing, point font url()s in the collected CSS at the WOFF2 subsets
+    from `manage.py subset_fonts` (ASSET_BUILD_DIR/fonts/manifest.json) and replace the
+    icon CSS (settings.ICON_FONT_CSS) with its trimmed build, so templates keep linking
+    the same name. The copies are rewritten in place and hashed from there, so the hashed
+    names follow the new content. Without a fonts manifest nothing changes.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            self.rewrite_font_references(paths)
+        parent = getattr(super(), "post_process", None)
+        if parent is not None:
+            yield from parent(paths, dry_run, **options)
+
+    def rewrite_font_references(self, paths):
+        """Rewrite CSS copies in place; returns the names that changed."""
+        manifest = fonts.load_manifest()
+        if not manifest:
+            return []
+        changed = []
+        for name in sorted(paths):
+            if not name.endswith(".css") or not self.exists(name):
+                continue
+            with self.open(name) as f:
+                css = f.read().decode("utf-8")
+            rewritten = fonts.trimmed_css(name, manifest)
+            if rewritten is None:
+                rewritten = fonts.rewrite_font_urls(css, name, manifest)
+            if rewritten == css:
+                continue
+            self.delete(name)
+            self.save(name, ContentFile(rewritten.encode("utf-8")))
+            # hash/post-process the rewritten copy, not the original source file
+            paths[name] = (self, name)
+            changed.append(name)
+        return changed
+
+
+class CompressedStaticFilesStorage(PrecompressMixin, SubsetFontsMixin, StaticFilesStorage):
+    """No hashing, only .gz/.br siblings (+ subset font references)."""
+
+
+class CompressedManifestStaticFilesStorageLoose(PrecompressMixin, SubsetFontsMixin, ManifestStaticFilesStorageLoose):
+    """ManifestStaticFilesStorageLoose + .gz/.br siblings + subset fonts (recommended for production)."""
+
+
+class CompressedManifestStaticFilesStorageNoPostProcess(
+    PrecompressMixin, SubsetFontsMixin, ManifestStaticFilesStorageNoPostProcess
+):
+    """ManifestStaticFilesStorageNoPostProcess + .gz/.br siblings + subset fonts."""
+
+
+# --- media --------------------------------------------------------------------------------
+
+def content_digest(content) -> str:
+    """sha256 of a File/UploadedFile, read in chunks; the position is reset for the caller."""
+    digest = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def file_fields():
+    """(model, [field names]) for every model with image/file fields (goods, users, ...)."""
+    from django.apps import apps
+    from django.db import models
+
+    for model in apps.get_models():
+        names = [f.name for f in model._meta.concrete_fields if isinstance(f, models.FileField)]
+        if names:
+            yield model, names
+
+
+def media_references(name: str) -> int:
+    """Number of file field values (any model) equal to name."""
+    from django.db.models import Q
+
+    count = 0
+    for model, fields in file_fields():
+        query = Q()
+        for field in fields:
+            query |= Q(**{field: name})
+        count += model._base_manager.filter(query).count()
+    return count
+
+
+class DedupFileSystemStorage(FileSystemStorage):
+    """
+    Content-addressed media: every upload is stored as cas/<2 hex>/<32 hex of sha256>.<ext>
+    and that is the name saved in the image field. Uploading the same photo again (as the
+    card image, as a gallery image, for another product) returns the existing name without
+    writing anything, so goods.signals finds its AVIF/WebP variants already generated.
+
+    The file fields are the reference count: delete() keeps a blob while any field still
+    points at it, and gc_media removes blobs (with their variants) nothing references.
+    Existing uploads are moved in with `manage.py dedup_media`.
+
+    cas/ is public (nginx serves it directly, cached as immutable), so private uploads are
+    exempt: names under a settings.MEDIA_ACCESS_RULES prefix (avatars in users_images/) are
+    stored under their own name like FileSystemStorage does, and stay behind their rule.
+    """
+
+    dedup_prefix = "cas"
+
+    def is_private(self, name: str) -> bool:
+        """Name under a MEDIA_ACCESS_RULES prefix: never content-addressed."""
+        name = (name or "").replace("\\", "/")
+        return any(name.startswith(prefix) for prefix in getattr(settings, "MEDIA_ACCESS_RULES", {}))
+
+    def blob_name(self, digest: str, name: str) -> str:
+        ext = os.path.splitext(name or "")[1].lower()
+        return f"{self.dedup_prefix}/{digest[:2]}/{digest[:32]}{ext}"
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if self.is_private(name):
+            return super().save(name, content, max_length=max_length)
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        blob = self.blob_name(content_digest(content), name)
+        if self.exists(blob):
+            return blob
+        return super().save(blob, content, max_length=max_length)
+
+    def save_variant(self, name, content):
+        """Write under exactly this name (common.media_pipeline: variants, sidecars, normalized originals)."""
+        return super().save(name, content)
+
+    def delete(self, name):
+        if name and name.startswith(f"{self.dedup_prefix}/") and media_references(name):
+            return
+        super().delete(name)
+
+
+mimetypes.add_type("image/avif", ".avif")
+mimetypes.add_type("image/webp", ".webp")
+
+
+@deconstructible
+class S3MediaStorage(Storage):
+    """
+    Media in an S3-compatible bucket (AWS S3, MinIO, R2...) through common.s3.S3Client:
+    one keep-alive connection pool per process, uploads streamed in MEDIA_S3_PART_SIZE_MB
+    parts (multipart above one part), files served from MEDIA_S3_PUBLIC_URL (a CDN or the
+    bucket's public endpoint). Names are keys; saving an existing name overwrites it only
+    after delete(), like FileSystemStorage.
+
+    list_prefix() returns every key starting with a prefix in one paginated listing, which
+    common.media_pipeline uses instead of one HEAD per variant. There is no path():
+    code that needs a local file goes through open().
+    """
+
+    def __init__(self, endpoint=None, bucket=None, access_key=None, secret_key=None, region=None,
+                 public_url=None, transport=None):
+        from common.s3 import S3Client
+
+        self.bucket = bucket or settings.MEDIA_S3_BUCKET
+        self.public_url = (public_url or settings.MEDIA_S3_PUBLIC_URL or "").rstrip("/")
+        self.part_size = int(getattr(settings, "MEDIA_S3_PART_SIZE_MB", 8)) * 1024 * 1024
+        self.cache_control = getattr(settings, "MEDIA_S3_CACHE_CONTROL", "")
+        self.client = S3Client(
+            endpoint or settings.MEDIA_S3_ENDPOINT, self.bucket,
+            access_key or settings.MEDIA_S3_ACCESS_KEY, secret_key or settings.MEDIA_S3_SECRET_KEY,
+            region=region or getattr(settings, "MEDIA_S3_REGION", "us-east-1"),
+            pool_size=int(getattr(settings, "MEDIA_S3_POOL_SIZE", 10)),
+            transport=transport,
+        )
+
+    def _key(self, name: str) -> str:
+        return name.replace("\\", "/").lstrip("/")
+
+    def _open(self, name, mode="rb"):
+        if "w" in mode or "a" in mode:
+            raise ValueError("S3MediaStorage files are read-only; use save()")
+        # spooled: small images stay in memory, large originals go to a temp file, never both
+        spool = tempfile.SpooledTemporaryFile(max_size=self.part_size)
+        response = self.client.get_object(self._key(name))
+        try:
+            for chunk in response.iter_bytes():
+                spool.write(chunk)
+        finally:
+            response.close()
+        spool.seek(0)
+        return File(spool, name)
+
+    def _save(self, name, content):
+        headers = {"Content-Type": mimetypes.guess_type(name)[0] or "application/octet-stream"}
+        if self.cache_control:
+            headers["Cache-Control"] = self.cache_control
+        if hasattr(content, "seek"):
+            content.seek(0)
+        self.client.upload(self._key(name), content.chunks(self.part_size), headers, part_size=self.part_size)
+        return name
+
+    def save_variant(self, name, content):
+        """Write (overwrite) exactly this key without the exists() probe of save() (common.media_pipeline)."""
+        return self._save(name, content)
+
+    def delete(self, name):
+        self.client.delete_object(self._key(name))
+
+    def exists(self, name):
+        return self.client.head_object(self._key(name)) is not None
+
+    def _head(self, name) -> dict:
+        head = self.client.head_object(self._key(name))
+        if head is None:
+            raise FileNotFoundError(name)
+        return head
+
+    def size(self, name):
+        return int(self._head(name)["content-length"])
+
+    def get_modified_time(self, name):
+        from email.utils import parsedate_to_datetime
+
+        return parsedate_to_datetime(self._head(name)["last-modified"])
+
+    def listdir(self, path):
+        prefix = self._key(path).rstrip("/")
+        prefix = f"{prefix}/" if prefix else ""
+        objects, prefixes = self.client.list_objects(prefix, delimiter="/")
+        return (
+            [p[len(prefix):].rstrip("/") for p in prefixes],
+            [o.key[len(prefix):] for o in objects],
+        )
+
+    def list_prefix(self, prefix: str) -> list[str]:
+        return [o.key for o in self.client.list_objects(self._key(prefix))[0]]
+
+    def url(self, name):
+        return f"{self.public_url}/{quote(self._key(name))}"
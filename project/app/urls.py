@@ -16,11 +16,17 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import include, path
-from django.conf.urls.static import static
 
 from django.conf import settings
 
+from common.image_resize import resized_image_view
+from common.media_serving import media_view
+from common.metrics import metrics_view
+from common.profiling import profile_download, profiles_view
+
 urlpatterns = [
+    path('admin/profiles/', admin.site.admin_view(profiles_view), name='admin_profiles'),
+    path('admin/profiles/<str:name>', admin.site.admin_view(profile_download), name='admin_profile_download'),
     path('admin/', admin.site.urls),
     path('', include('main.urls', namespace='main')),
     path('catalog/', include('goods.urls', namespace='catalog')),
@@ -29,13 +35,25 @@ urlpatterns = [
     path('orders/', include('orders.urls', namespace='orders')),
 
     path('tinymce/', include('tinymce.urls')),
+
+    # on-demand resized media: /img/<params>.<signature>/<media path> (common.image_resize)
+    path('img/<str:signed>/<path:path>', resized_image_view, name='resized_image'),
+
+    # internal: Prometheus scrape endpoint (IP allow-list / token, denied in Nginx)
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
     urlpatterns += [
         path("__debug__/", include("debug_toolbar.urls")),
     ]
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+# uploads (common.media_serving): access rules, ETag/Range; nginx serves public media itself and
+# forwards the protected prefixes here. Skipped when MEDIA_URL points at another host (CDN, bucket).
+if settings.MEDIA_URL.startswith('/'):
+    urlpatterns += [
+        path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", media_view, name='media'),
+    ]
 
 """
 www.site.com/admin/
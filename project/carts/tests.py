@@ -1,3 +1,87 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from carts.models import Cart
+from common.testing import LOCMEM_CACHES, QueryBudgetMixin, seed_catalog
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_catalog()
+        cls.in_stock = [p for p in cls.data["products"] if p.quantity > 0]
+
+    def _add(self, product, quantity=1):
+        return self.client.post(reverse("carts:cart_add"), {"product_id": product.pk, "quantity": quantity})
+
+    def test_anonymous_add_change_remove(self):
+        # first add also creates the session row (existence check + insert, in savepoints)
+        with self.assertQueryBudget(14):
+            response = self._add(self.in_stock[0])
+        self.assertEqual(response.status_code, 200)
+
+        # product, lookup + update inside a savepoint, cart list (the session comes from the cache)
+        with self.assertQueryBudget(6):
+            self._add(self.in_stock[0])
+        with self.assertQueryBudget(7):
+            self._add(self.in_stock[1], 2)
+
+        cart = Cart.objects.get(session_key=self.client.session.session_key, product=self.in_stock[0])
+        self.assertEqual(cart.quantity, 2)
+
+        with self.assertQueryBudget(3):
+            response = self.client.post(reverse("carts:cart_change"), {"cart_id": cart.pk, "action": "increment"})
+        self.assertEqual(response.json()["total_quantity"], 5)
+
+        with self.assertQueryBudget(3):
+            response = self.client.post(reverse("carts:cart_remove"), {"cart_id": cart.pk})
+        self.assertEqual(response.json()["total_quantity"], 2)
+
+        with self.assertQueryBudget(1):
+            self.assertEqual(self.client.get(reverse("carts:cart_view")).status_code, 200)
+
+    def test_authenticated_add_change_remove(self):
+        user = self.data["users"][0]
+        self.client.force_login(user)
+        with self.assertQueryBudget(8):
+            self._add(self.in_stock[-1])
+        cart = Cart.objects.filter(user=user).first()
+        with self.assertQueryBudget(4):
+            self.client.post(reverse("carts:cart_change"), {"cart_id": cart.pk, "quantity": 3})
+        with self.assertQueryBudget(4):
+            self.client.post(reverse("carts:cart_remove"), {"cart_id": cart.pk})
+
+    def test_browsing_does_not_create_a_session(self):
+        for url in (reverse("main:home"), reverse("catalog:catalog_all"), self.in_stock[0].get_absolute_url()):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        # the cart widget polls this on every page
+        with self.assertQueryBudget(0):
+            response = self.client.get(reverse("carts:cart_view"))
+        self.assertEqual(response.json()["total_quantity"], 0)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+        self.assertFalse(Session.objects.exists())
+
+        self._add(self.in_stock[0])
+        self.assertIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+        self.assertEqual(Session.objects.count(), 1)
+
+    async def test_cart_views_on_the_async_stack(self):
+        # AsyncClient goes through the ASGI handler: async middleware and views end to end
+        product = self.in_stock[0]
+        response = await self.async_client.post(reverse("carts:cart_add"), {"product_id": product.pk, "quantity": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total_quantity"], 2)
+        self.assertIn(product.name, response.json()["cart_items_html"])
+
+        session_key = self.async_client.cookies[settings.SESSION_COOKIE_NAME].value
+        cart = await Cart.objects.aget(session_key=session_key, product=product)
+        response = await self.async_client.post(reverse("carts:cart_change"), {"cart_id": cart.pk, "action": "decrement"})
+        self.assertEqual(response.json()["total_quantity"], 1)
+
+        response = await self.async_client.post(reverse("carts:cart_remove"), {"cart_id": cart.pk})
+        self.assertEqual(response.json()["total_quantity"], 0)
+        self.assertEqual((await self.async_client.post(reverse("carts:cart_remove"), {"cart_id": cart.pk})).status_code, 404)
+        self.assertEqual((await self.async_client.get(reverse("carts:cart_view"))).json()["total_quantity"], 0)
@@ -4,7 +4,10 @@ from carts.models import Cart
 def get_user_carts(request):
     if request.user.is_authenticated:
         return Cart.objects.filter(user=request.user).select_related('product')
-    
-    if not request.session.session_key:
-        request.session.create()
-    return Cart.objects.filter(session_key=request.session.session_key).select_related('product')
\ No newline at end of file
+
+    # Read-only: a visitor without a session has an empty cart. The session is created
+    # only when something is added (CartAddView), so browsing never writes a session row.
+    session_key = request.session.session_key
+    if not session_key:
+        return Cart.objects.none()
+    return Cart.objects.filter(session_key=session_key).select_related('product')
\ No newline at end of file
@@ -1,7 +1,9 @@
 # carts/views.py
+# Async views: on the ASGI deployment (see DEPLOY.md) a cart request doesn't hold a worker
+# thread while waiting on the DB. Under WSGI Django runs them through async_to_sync.
+from asgiref.sync import sync_to_async
 from django.views import View
-from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.template.loader import render_to_string
 from django.db import transaction, IntegrityError
 
@@ -20,13 +22,76 @@ def _owner_filter(request):
     return {'session_key': request.session.session_key}
 
 
+async def _aload_user(request):
+    """Django 4.2 has no request.auser(): resolve the lazy user (session + auth query) on a thread."""
+    await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+async def _cart_json(request, **extra):
+    """JSON с cart_items_html, total_quantity, total_sum (+ extra, например message)."""
+    await _aload_user(request)
+    carts = [item async for item in get_user_carts(request)]
+    total_quantity = sum(item.quantity for item in carts)
+    total_sum = round(sum(float(item.product.sell_price()) * item.quantity for item in carts), 2)
+    # рендерим HTML с уже посчитанными итогами (шаблон не ходит в БД: product уже в select_related)
+    html = render_to_string(
+        'carts/includes/included_cart.html',
+        {'carts': carts, 'total_quantity': total_quantity, 'total_sum': total_sum},
+        request=request,
+    )
+    return JsonResponse({
+        **extra,
+        'cart_items_html': html,
+        'total_quantity': total_quantity,
+        'total_sum': total_sum,
+    })
+
+
+async def _aget_cart_item(request, cart_id):
+    # фильтруем по владельцу — чтобы нельзя было трогать чужие строки
+    owner = await sync_to_async(_owner_filter)(request)
+    try:
+        return await Cart.objects.aget(id=cart_id, **owner)
+    except Cart.DoesNotExist:
+        raise Http404('No Cart matches the given query.')
+
+
+def _add_to_cart(product, qty, gift_choice, owner):
+    """Транзакционная часть CartAddView (transaction.atomic пока только синхронный)."""
+    with transaction.atomic():
+        base_qs = Cart.objects.filter(product=product, **owner)
+        # 1) Ищем точное совпадение по gift_choice
+        cart_item = base_qs.filter(gift_choice=gift_choice).first()
+        if cart_item:
+            cart_item.quantity = cart_item.quantity + qty
+            cart_item.save(update_fields=['quantity'])
+        else:
+            # 2) Бэкаповый поиск для старых строк (NULL/пусто)
+            legacy_item = base_qs.filter(gift_choice__isnull=True).first()
+            if legacy_item:
+                legacy_item.gift_choice = gift_choice
+                legacy_item.quantity = legacy_item.quantity + qty
+                legacy_item.save(update_fields=['gift_choice', 'quantity'])
+                cart_item = legacy_item
+            else:
+                # 3) Пытаемся создать. Если кто-то создал параллельно — сольёмся
+                try:
+                    cart_item = Cart.objects.create(product=product, quantity=qty, gift_choice=gift_choice, **owner)
+                except IntegrityError:
+                    cart_item = base_qs.filter(gift_choice=gift_choice).first()
+                    if cart_item:
+                        cart_item.quantity = cart_item.quantity + qty
+                        cart_item.save(update_fields=['quantity'])
+    return cart_item
+
+
 class CartAddView(View):
     """
     Ожидает POST: product_id, quantity (опционально)
     Если запись уже есть -> увеличивает quantity.
     Возвращает JSON с cart_items_html, total_quantity, total_sum, message.
     """
-    def post(self, request):
+    async def post(self, request):
         product_id = request.POST.get('product_id') or request.POST.get('id')
         try:
             qty = int(request.POST.get('quantity', 1))
@@ -36,7 +101,10 @@ class CartAddView(View):
         if not product_id:
             return JsonResponse({'error': 'product_id is required'}, status=400)
 
-        product = get_object_or_404(Products, id=product_id)
+        try:
+            product = await Products.objects.aget(id=product_id)
+        except Products.DoesNotExist:
+            raise Http404('No Products matches the given query.')
         # Подарок-отпечаток: принимаем из формы/JS; если включено на товаре и не передано — используем "Рандом"
         gift_choice = request.POST.get('gift_choice')
         if getattr(product, 'gift_enabled', False):
@@ -44,51 +112,11 @@ class CartAddView(View):
                 gift_choice = 'Рандом'
         else:
             gift_choice = ''
-        owner = _owner_filter(request)
-
-        with transaction.atomic():
-            base_qs = Cart.objects.filter(product=product, **owner)
-            # 1) Ищем точное совпадение по gift_choice
-            cart_item = base_qs.filter(gift_choice=gift_choice).first()
-            if cart_item:
-                cart_item.quantity = cart_item.quantity + qty
-                cart_item.save(update_fields=['quantity'])
-            else:
-                # 2) Бэкаповый поиск для старых строк (NULL/пусто)
-                legacy_item = base_qs.filter(gift_choice__isnull=True).first()
-                if legacy_item:
-                    legacy_item.gift_choice = gift_choice
-                    legacy_item.quantity = legacy_item.quantity + qty
-                    legacy_item.save(update_fields=['gift_choice', 'quantity'])
-                    cart_item = legacy_item
-                else:
-                    # 3) Пытаемся создать. Если кто-то создал параллельно — сольёмся
-                    try:
-                        cart_item = Cart.objects.create(product=product, quantity=qty, gift_choice=gift_choice, **owner)
-                    except IntegrityError:
-                        cart_item = base_qs.filter(gift_choice=gift_choice).first()
-                        if cart_item:
-                            cart_item.quantity = cart_item.quantity + qty
-                            cart_item.save(update_fields=['quantity'])
+        owner = await sync_to_async(_owner_filter)(request)
+        await sync_to_async(_add_to_cart)(product, qty, gift_choice, owner)
 
         # рендерим обновлённый список корзины
-        carts = get_user_carts(request)
-        # вычисляем суммарные значения
-        total_quantity = sum(item.quantity for item in carts)
-        total_sum = round(sum(float(item.product.sell_price()) * item.quantity for item in carts), 2)
-        # рендерим HTML с уже посчитанными итогами
-        html = render_to_string(
-            'carts/includes/included_cart.html',
-            {'carts': carts, 'total_quantity': total_quantity, 'total_sum': total_sum},
-            request=request,
-        )
-
-        return JsonResponse({
-            'message': 'Товар добавлен в корзину',
-            'cart_items_html': html,
-            'total_quantity': total_quantity,
-            'total_sum': total_sum,
-        })
+        return await _cart_json(request, message='Товар добавлен в корзину')
 
 
 class CartChangeView(View):
@@ -97,94 +125,54 @@ class CartChangeView(View):
     Ожидает POST: cart_id, action (increment/decrement) или quantity (число).
     Возвращает JSON с обновлённым cart_items_html, total_quantity, total_sum
     """
-    def post(self, request):
+    async def post(self, request):
         cart_id = request.POST.get('cart_id')
         if not cart_id:
             return JsonResponse({'error': 'cart_id required'}, status=400)
 
-        # фильтруем по владельцу — чтобы нельзя было трогать чужие строки
-        owner = _owner_filter(request)
-        cart_item = get_object_or_404(Cart, id=cart_id, **owner)
+        cart_item = await _aget_cart_item(request, cart_id)
 
         action = request.POST.get('action')
         qty = request.POST.get('quantity')
         try:
             if action == 'increment':
                 cart_item.quantity += 1
-                cart_item.save(update_fields=['quantity'])
+                await cart_item.asave(update_fields=['quantity'])
             elif action == 'decrement':
                 cart_item.quantity -= 1
                 if cart_item.quantity <= 0:
-                    cart_item.delete()
+                    await cart_item.adelete()
                 else:
-                    cart_item.save(update_fields=['quantity'])
+                    await cart_item.asave(update_fields=['quantity'])
             elif qty is not None:
                 new_qty = max(0, int(qty))
                 if new_qty == 0:
-                    cart_item.delete()
+                    await cart_item.adelete()
                 else:
                     cart_item.quantity = new_qty
-                    cart_item.save(update_fields=['quantity'])
+                    await cart_item.asave(update_fields=['quantity'])
             else:
                 return JsonResponse({'error': 'action or quantity required'}, status=400)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
 
-        carts = get_user_carts(request)
-        total_quantity = sum(item.quantity for item in carts)
-        total_sum = round(sum(float(item.product.sell_price()) * item.quantity for item in carts), 2)
-        html = render_to_string(
-            'carts/includes/included_cart.html',
-            {'carts': carts, 'total_quantity': total_quantity, 'total_sum': total_sum},
-            request=request,
-        )
-
-        return JsonResponse({
-            'message': 'Количество обновлено',
-            'cart_items_html': html,
-            'total_quantity': total_quantity,
-            'total_sum': total_sum,
-        })
+        return await _cart_json(request, message='Количество обновлено')
 
 
 class CartRemoveView(View):
     """
     Удаляет строку корзины. Ожидает POST: cart_id.
     """
-    def post(self, request):
+    async def post(self, request):
         cart_id = request.POST.get('cart_id')
         if not cart_id:
             return JsonResponse({'error': 'cart_id required'}, status=400)
-        owner = _owner_filter(request)
-        cart_item = get_object_or_404(Cart, id=cart_id, **owner)
-        cart_item.delete()
-
-        carts = get_user_carts(request)
-        total_quantity = sum(item.quantity for item in carts)
-        total_sum = round(sum(float(item.product.sell_price()) * item.quantity for item in carts), 2)
-        html = render_to_string(
-            'carts/includes/included_cart.html',
-            {'carts': carts, 'total_quantity': total_quantity, 'total_sum': total_sum},
-            request=request,
-        )
-
-        return JsonResponse({
-            'message': 'Товар удалён',
-            'cart_items_html': html,
-            'total_quantity': total_quantity,
-            'total_sum': total_sum,
-        })
+        cart_item = await _aget_cart_item(request, cart_id)
+        await cart_item.adelete()
+        return await _cart_json(request, message='Товар удалён')
 
 
 # Optional: CartDetailView для GET /cart/view/
 class CartDetailView(View):
-    def get(self, request):
-        carts = get_user_carts(request)
-        total_quantity = sum(item.quantity for item in carts)
-        total_sum = round(sum(float(item.product.sell_price()) * item.quantity for item in carts), 2)
-        html = render_to_string(
-            'carts/includes/included_cart.html',
-            {'carts': carts, 'total_quantity': total_quantity, 'total_sum': total_sum},
-            request=request,
-        )
-        return JsonResponse({'cart_items_html': html, 'total_quantity': total_quantity, 'total_sum': total_sum})
+    async def get(self, request):
+        return await _cart_json(request)
@@ -0,0 +1,287 @@
+"""
+CSS/JS bundles and critical CSS.
+
+settings.ASSET_BUNDLES names per-page bundles:
+
+    "home": {
+        "css": ["deps/css/templatemo-style.css", ...],   # static paths, concatenated in order
+        "js": ["deps/js/faq.js", ...],
+        "critical": "main/home.html",                    # template to extract critical CSS for
+    }
+
+`manage.py build_assets` concatenates and minifies every bundle into
+ASSET_BUILD_DIR/bundles/<name>.<hash>.css|js (the directory is added to
+STATICFILES_DIRS, so collectstatic hashes/compresses them like any other file) and
+writes bundles/manifest.json. Critical CSS is the subset of a page's CSS whose
+selectors only use classes, ids and tags that appear in the page template above the
+`<!-- fold -->` marker (includes are followed). It is a static approximation of
+what a headless-browser tool would compute, so rules added by JS at runtime are
+not included; the full bundle still loads right after.
+
+The {% bundle_css %} / {% bundle_js %} tags (goods.templatetags.assets) emit the
+built files, or the individual source files when bundles are disabled or not built.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import posixpath
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template.loader import get_template
+
+try:
+    import rjsmin
+except ImportError:  # optional: without it JS is only stripped of blank lines and indentation
+    rjsmin = None
+
+BUNDLE_SUBDIR = "bundles"
+MANIFEST_NAME = "manifest.json"
+FOLD_MARKER = "<!-- fold -->"
+
+
+def build_dir() -> Path:
+    return Path(getattr(settings, "ASSET_BUILD_DIR", settings.BASE_DIR / "assets_build"))
+
+
+def manifest_path() -> Path:
+    return build_dir() / BUNDLE_SUBDIR / MANIFEST_NAME
+
+
+# --- minification --------------------------------------------------------------------
+
+_CSS_COMMENT_RE = re.compile(r"/\*(?!!).*?\*/", re.S)
+_CSS_SPACE_RE = re.compile(r"\s+")
+# not ":" before it: "div :hover" (descendant) differs from "div:hover"
+_CSS_PUNCT_RE = re.compile(r"\s*([{};,>])\s*|(:)\s+")
+_CSS_DECL_COLON_RE = re.compile(r"\s+:(?=[^{}]*})")  # "color :red}" (a declaration, not a selector)
+_CSS_STRING_RE = re.compile(r"\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'")
+
+
+def minify_css(css: str) -> str:
+    # strings (content: "...", url('...')) are protected from whitespace collapsing
+    strings = []
+
+    def stash(match):
+        strings.append(match.group(0))
+        return f"\x00{len(strings) - 1}\x00"
+
+    css = _CSS_STRING_RE.sub(stash, css)
+    css = _CSS_COMMENT_RE.sub("", css)
+    css = _CSS_SPACE_RE.sub(" ", css)
+    css = _CSS_PUNCT_RE.sub(lambda m: m.group(1) or m.group(2), css)
+    css = _CSS_DECL_COLON_RE.sub(":", css)
+    css = css.replace(";}", "}").strip()
+    return re.sub(r"\x00(\d+)\x00", lambda m: strings[int(m.group(1))], css)
+
+
+def minify_js(js: str) -> str:
+    if rjsmin is not None:
+        return rjsmin.jsmin(js)
+    # conservative: no tokenizer, so comments and inner whitespace stay
+    return "\n".join(line.strip() for line in js.splitlines() if line.strip())
+
+
+# --- CSS url() rewriting -----------------------------------------------------------------
+
+_URL_RE = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+
+
+def rewrite_css_urls(css: str, source_path: str) -> str:
+    """Relative url()s are relative to the source file; make them relative to bundles/."""
+    source_dir = posixpath.dirname(source_path)
+
+    def fix(match):
+        quote, url = match.groups()
+        if re.match(r"^(?:[a-z]+:|/|#|data:)", url, re.I):
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(source_dir, url))
+        return f"url({quote}{posixpath.relpath(target, BUNDLE_SUBDIR)}{quote})"
+
+    return _URL_RE.sub(fix, css)
+
+
+# --- critical CSS ----------------------------------------------------------------------
+
+_TEMPLATE_TAG_RE = re.compile(r"{%.*?%}|{{.*?}}|{#.*?#}", re.S)
+_INCLUDE_RE = re.compile(r"{%\s*include\s+['\"]([^'\"]+)['\"]")
+_EXTENDS_RE = re.compile(r"{%\s*extends\s+['\"]([^'\"]+)['\"]")
+_ATTR_RE = re.compile(r"\b(class|id)\s*=\s*(['\"])(.*?)\2", re.S)
+_TAG_RE = re.compile(r"<([a-zA-Z][a-zA-Z0-9-]*)")
+_SEL_CLASS_ID_RE = re.compile(r"([.#])(-?[_a-zA-Z][\w-]*)")
+_SEL_TAG_RE = re.compile(r"(?:^|[\s>+~(])([a-zA-Z][a-zA-Z0-9-]*)")
+_SEL_STRIP_RE = re.compile(r"\[[^\]]*\]|::?[\w-]+(?:\([^)]*\))?")
+_ALWAYS_TAGS = frozenset({"html", "body"})
+
+
+def _template_source(name: str) -> str:
+    return get_template(name).template.source
+
+
+def page_tokens(template_name: str, _seen: set | None = None) -> set[str]:
+    """Classes (".x"), ids ("#x") and tags used above the fold of a template."""
+    seen = _seen if _seen is not None else set()
+    if template_name in seen:
+        return set()
+    seen.add(template_name)
+    source = _template_source(template_name)
+    source = source.split(FOLD_MARKER, 1)[0]
+
+    tokens: set[str] = set()
+    parent = _EXTENDS_RE.search(source)
+    if parent:
+        # the parent's wrapper markup (<main class="container">...) surrounds every page
+        tokens |= page_tokens(parent.group(1), seen)
+    for include in _INCLUDE_RE.findall(source):
+        tokens |= page_tokens(include, seen)
+
+    # keep the text between template tags: class="a {% if x %}active{% endif %}" -> "a active"
+    html = _TEMPLATE_TAG_RE.sub(" ", source)
+    for attr, _, value in _ATTR_RE.findall(html):
+        prefix = "." if attr == "class" else "#"
+        tokens.update(prefix + word for word in value.split())
+    tokens.update(tag.lower() for tag in _TAG_RE.findall(html))
+    return tokens
+
+
+def _selector_matches(selector: str, tokens: set[str]) -> bool:
+    selector = selector.strip()
+    if not selector or selector in ("*", ":root"):
+        return True
+    bare = _SEL_STRIP_RE.sub("", selector)
+    for kind, name in _SEL_CLASS_ID_RE.findall(bare):
+        if kind + name not in tokens:
+            return False
+    bare = _SEL_CLASS_ID_RE.sub("", bare)
+    for tag in _SEL_TAG_RE.findall(bare):
+        tag = tag.lower()
+        if tag not in tokens and tag not in _ALWAYS_TAGS:
+            return False
+    return True
+
+
+def _split_blocks(css: str):
+    """Yield (prelude, body) for each top-level block of minified CSS; body is None for @import;."""
+    i, n = 0, len(css)
+    while i < n:
+        brace = css.find("{", i)
+        semi = css.find(";", i)
+        if brace == -1:
+            return
+        if semi != -1 and semi < brace:  # @charset/@import statement
+            yield css[i:semi].strip(), None
+            i = semi + 1
+            continue
+        depth, j = 1, brace + 1
+        while j < n and depth:
+            if css[j] == "{":
+                depth += 1
+            elif css[j] == "}":
+                depth -= 1
+            j += 1
+        yield css[i:brace].strip(), css[brace + 1:j - 1]
+        i = j
+
+
+def critical_css(css: str, tokens: set[str]) -> str:
+    """Rules of (minified) css that can apply to an element in tokens; @media blocks are filtered recursively."""
+    out = []
+    for prelude, body in _split_blocks(css):
+        if body is None:
+            continue
+        if prelude.startswith("@"):
+            if prelude.startswith(("@media", "@supports")):
+                inner = critical_css(body, tokens)
+                if inner:
+                    out.append(f"{prelude}{{{inner}}}")
+            # @font-face/@keyframes are left to the full bundle
+            continue
+        if any(_selector_matches(part, tokens) for part in prelude.split(",")):
+            out.append(f"{prelude}{{{body}}}")
+    return "".join(out)
+
+
+# --- build -----------------------------------------------------------------------------
+
+def _read_static(path: str) -> str:
+    found = finders.find(path)
+    if not found:
+        raise FileNotFoundError(f"static file not found: {path}")
+    with open(found, encoding="utf-8") as f:
+        return f.read()
+
+
+def _write_hashed(name: str, ext: str, content: str) -> str:
+    digest = hashlib.md5(content.encode("utf-8")).hexdigest()[:12]
+    rel = f"{BUNDLE_SUBDIR}/{name}.{digest}.{ext}"
+    target = build_dir() / rel
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(content, encoding="utf-8")
+    return rel
+
+
+def build_bundle(name: str, spec: dict) -> dict:
+    entry: dict = {}
+    if spec.get("css"):
+        css = "".join(minify_css(rewrite_css_urls(_read_static(p), p)) for p in spec["css"])
+        entry["css"] = _write_hashed(name, "css", css)
+        entry["css_size"] = len(css.encode("utf-8"))
+        if spec.get("critical"):
+            entry["critical"] = critical_css(css, page_tokens(spec["critical"]))
+    if spec.get("js"):
+        # ";" guards against files that rely on automatic semicolon insertion at EOF
+        js = ";\n".join(minify_js(_read_static(p)) for p in spec["js"])
+        entry["js"] = _write_hashed(name, "js", js)
+        entry["js_size"] = len(js.encode("utf-8"))
+    return entry
+
+
+def build_all(names=None) -> dict:
+    """Build the given (default: all) bundles, drop stale outputs, write the manifest."""
+    specs = getattr(settings, "ASSET_BUNDLES", {})
+    manifest = load_manifest(cached=False) if names else {}
+    for name in names or specs:
+        manifest[name] = build_bundle(name, specs[name])
+    manifest = {k: v for k, v in manifest.items() if k in specs}
+
+    keep = {entry[kind] for entry in manifest.values() for kind in ("css", "js") if kind in entry}
+    out_dir = build_dir() / BUNDLE_SUBDIR
+    with os.scandir(out_dir) as it:
+        for item in it:
+            if item.name != MANIFEST_NAME and f"{BUNDLE_SUBDIR}/{item.name}" not in keep:
+                os.remove(item.path)
+    manifest_path().write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    _manifest_cache.clear()
+    return manifest
+
+
+# --- lookup (template tags) -----------------------------------------------------------------
+
+_manifest_cache: dict = {}
+
+
+def load_manifest(cached: bool = True) -> dict:
+    """Built bundles, re-read when manifest.json changes; {} when not built."""
+    path = manifest_path()
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return {}
+    if cached and _manifest_cache.get("key") == (path, mtime):
+        return _manifest_cache["data"]
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    _manifest_cache.update(key=(path, mtime), data=data)
+    return data
+
+
+def bundle_entry(name: str) -> dict | None:
+    if not getattr(settings, "ASSET_BUNDLES_ENABLED", False):
+        return None
+    return load_manifest().get(name)
@@ -0,0 +1,37 @@
+"""
+PostgreSQL backend with connection metrics and idle-aware health checks.
+
+ENGINE = "common.db.postgresql". On top of the stock backend:
+- the time to get a connection (TCP/TLS/auth, or the wait for a free slot when
+  Django's pool is enabled) is observed in db_connection_acquire_seconds;
+- with CONN_HEALTH_CHECKS the liveness check normally runs once per request.
+  Long-running management commands never pass a request boundary, so the check
+  is re-armed once a persistent connection has been idle for
+  DB_HEALTH_CHECK_IDLE seconds (outside transactions only).
+"""
+import time
+
+from django.db.backends.postgresql import base
+
+from common.metrics import DB_CONNECTION_ACQUIRE_SECONDS
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    _last_used = 0.0
+
+    def get_new_connection(self, conn_params):
+        started = time.perf_counter()
+        try:
+            return super().get_new_connection(conn_params)
+        finally:
+            DB_CONNECTION_ACQUIRE_SECONDS.labels(self.alias).observe(time.perf_counter() - started)
+            # a fresh connection counts as just used: connect() itself goes through the check below
+            self._last_used = time.monotonic()
+
+    def close_if_health_check_failed(self):
+        idle = self.settings_dict.get("HEALTH_CHECK_IDLE", 30)
+        now = time.monotonic()
+        if self.health_check_done and not self.in_atomic_block and now - self._last_used > idle:
+            self.health_check_done = False
+        super().close_if_health_check_failed()
+        self._last_used = now
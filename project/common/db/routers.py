@@ -0,0 +1,97 @@
+"""
+Optional read replica for catalog traffic.
+
+Enabled when settings define DATABASES["replica"] (DB_REPLICA_* env). Only
+reads issued while a view marked `replica_reads = True` handles a GET/HEAD go
+to the replica, and only for catalog models; auth, sessions, carts, orders and
+admin always use the primary. After any write (or unsafe request) the client
+is pinned to the primary for REPLICA_PIN_SECONDS so it reads its own writes
+despite replication lag.
+
+Mark a class-based view with `replica_reads = True`, or set the attribute on a
+function view.
+"""
+from __future__ import annotations
+
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from common.middleware import DualMiddleware
+
+REPLICA_ALIAS = "replica"
+PIN_COOKIE = "db_primary"
+PRIMARY_APPS = frozenset({"admin", "auth", "contenttypes", "sessions", "users", "carts", "orders", "main"})
+
+# per request: {"replica": bool, "wrote": bool}
+_state: ContextVar[dict | None] = ContextVar("db_routing_state", default=None)
+
+
+def replica_configured() -> bool:
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (state and state["replica"] and not state["wrote"] and model._meta.app_label not in PRIMARY_APPS
+                # inside transaction.atomic() reads must see the transaction's own writes
+                and not connections["default"].in_atomic_block):
+            return REPLICA_ALIAS
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        # session/cart writes don't change what the replica serves
+        if state is not None and model._meta.app_label not in PRIMARY_APPS:
+            state["wrote"] = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # same data on both aliases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReplicaMiddleware(DualMiddleware):
+    """Switch marked read-only views to the replica; pin writers to the primary."""
+
+    def __init__(self, get_response):
+        if not replica_configured():
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+        self.pin_seconds = int(getattr(settings, "REPLICA_PIN_SECONDS", 5))
+
+    def handle(self, request):
+        state = {"replica": False, "wrote": False}
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin(request, response, state)
+
+    async def ahandle(self, request):
+        # the dict is shared with the sync_to_async threads the ORM runs on
+        state = {"replica": False, "wrote": False}
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin(request, response, state)
+
+    def _pin(self, request, response, state):
+        if state["wrote"] or request.method not in ("GET", "HEAD", "OPTIONS"):
+            response.set_cookie(PIN_COOKIE, "1", max_age=self.pin_seconds, httponly=True, samesite="Lax")
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, "view_class", view_func)
+        if (getattr(view, "replica_reads", False) and request.method in ("GET", "HEAD")
+                and PIN_COOKIE not in request.COOKIES):
+            _state.get()["replica"] = True
@@ -0,0 +1,263 @@
+"""
+Subsetted web fonts (manage.py subset_fonts).
+
+Text fonts (settings.FONT_SUBSETS) keep the configured unicode ranges plus every
+character found in the templates, and are saved as WOFF2. The icon font CSS
+(settings.ICON_FONT_CSS, Font Awesome) is scanned for `.fa-<name>:before` glyph
+rules; only icons referenced by templates, JS or CSS survive, both in the
+subsetted icon fonts and in the trimmed ASSET_BUILD_DIR/fonts/icons.css.
+
+fonts/manifest.json maps source font paths to the subsets (and ICON_FONT_CSS to
+icons.css); the Compressed* static storages (app.storage.SubsetFontsMixin) rewrite
+url() references to them and collect the trimmed icons.css in place of the full
+icon CSS at collectstatic time. Requires fontTools (+ Brotli for WOFF2).
+"""
+from __future__ import annotations
+
+import json
+import os
+import posixpath
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template.utils import get_app_template_dirs
+
+from common.assets import _split_blocks, build_dir
+
+FONTS_SUBDIR = "fonts"
+MANIFEST_NAME = "manifest.json"
+ICONS_CSS = f"{FONTS_SUBDIR}/icons.css"
+
+_ICON_CLASS_RE = re.compile(r"\bfa-([a-z0-9]+(?:-[a-z0-9]+)*)")
+_GLYPH_RULE_RE = re.compile(r'^\.fa-([a-z0-9-]+):before$')
+_CONTENT_RE = re.compile(r'content:\s*"\\([0-9a-fA-F]+)"')
+_FONT_URL_RE = re.compile(r"url\(\s*(['\"]?)([^'\")?#]+\.(?:woff2|woff|ttf|otf|eot|svg))[^'\")]*\1\s*\)(?:\s*format\([^)]*\))?")
+
+
+def manifest_path() -> Path:
+    return build_dir() / FONTS_SUBDIR / MANIFEST_NAME
+
+
+def load_manifest() -> dict:
+    try:
+        return json.loads(manifest_path().read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def parse_unicode_ranges(ranges: str) -> set[int]:
+    """'U+0020-007E,U+0400-045F,U+20B4' -> code points."""
+    points = set()
+    for part in ranges.replace(" ", "").split(","):
+        if not part:
+            continue
+        part = part.upper().removeprefix("U+")
+        start, _, end = part.partition("-")
+        points.update(range(int(start, 16), int(end or start, 16) + 1))
+    return points
+
+
+# --- usage scan ------------------------------------------------------------------------
+
+def _template_files():
+    dirs = [Path(d) for cfg in settings.TEMPLATES for d in cfg.get("DIRS", [])]
+    dirs += [Path(d) for d in get_app_template_dirs("templates")]
+    for root in dirs:
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith((".html", ".txt", ".xml")):
+                    yield Path(dirpath) / filename
+
+
+def _static_sources(exts):
+    """Project static files (vendor dirs from apps such as admin are not scanned)."""
+    for root in settings.STATICFILES_DIRS:
+        root = Path(root[1] if isinstance(root, (list, tuple)) else root)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(exts) and not filename.endswith(".min.css"):
+                    yield Path(dirpath) / filename
+
+
+def _read(path: Path) -> str:
+    return path.read_text(encoding="utf-8", errors="ignore")
+
+
+def scan_usage() -> tuple[set[str], set[int]]:
+    """(icon names used as fa-<name>, code points of the template text)."""
+    icons: set[str] = set()
+    chars: set[int] = set()
+    for path in _template_files():
+        text = _read(path)
+        icons.update(_ICON_CLASS_RE.findall(text))
+        chars.update(ord(c) for c in text if c.isprintable())
+    for path in _static_sources((".js", ".css")):
+        icons.update(_ICON_CLASS_RE.findall(_read(path)))
+    return icons, chars
+
+
+# --- icon CSS --------------------------------------------------------------------------------
+
+def icon_glyphs(css: str) -> dict[str, int]:
+    """Icon name -> code point from the glyph rules of the icon CSS."""
+    glyphs = {}
+    for prelude, body in _split_blocks(css):
+        if body is None:
+            continue
+        content = _CONTENT_RE.search(body)
+        if not content:
+            continue
+        for selector in prelude.split(","):
+            match = _GLYPH_RULE_RE.match(selector.strip())
+            if match:
+                glyphs[match.group(1)] = int(content.group(1), 16)
+    return glyphs
+
+
+def trim_icon_css(css: str, used: set[str], fonts: dict[str, str], css_path: str) -> str:
+    """
+    Drop glyph rules of unused icons; @font-face blocks point at the subsets only
+    (fonts: source static path -> subset path, relative to ASSET_BUILD_DIR).
+    """
+    css_dir = posixpath.dirname(css_path)
+    out = []
+    for prelude, body in _split_blocks(css):
+        if body is None:
+            continue
+        if prelude == "@font-face":
+            source = next((posixpath.normpath(posixpath.join(css_dir, m.group(2)))
+                           for m in _FONT_URL_RE.finditer(body)
+                           if posixpath.normpath(posixpath.join(css_dir, m.group(2))) in fonts), None)
+            if source is None:
+                continue  # nothing of this family is used
+            target = posixpath.relpath(fonts[source], FONTS_SUBDIR)
+            decls = [d for d in body.split(";") if d and not d.strip().startswith("src:")]
+            decls.append(f'src:url({target}) format("woff2")')
+            out.append(f"@font-face{{{';'.join(decls)}}}")
+            continue
+        if _CONTENT_RE.search(body):
+            selectors = [s for s in prelude.split(",")
+                         if not _GLYPH_RULE_RE.match(s.strip()) or _GLYPH_RULE_RE.match(s.strip()).group(1) in used]
+            if selectors:
+                out.append(f"{','.join(selectors)}{{{body}}}")
+            continue
+        out.append(f"{prelude}{{{body}}}")
+    return "\n".join(out)
+
+
+# --- build ---------------------------------------------------------------------------------
+
+def subset_font(source: Path, target: Path, unicodes: set[int]) -> None:
+    from fontTools import subset
+
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    options.notdef_outline = True
+    font = subset.load_font(str(source), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=unicodes)
+    subsetter.subset(font)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    subset.save_font(font, str(target), options)
+
+
+def _woff2_name(static_path: str) -> str:
+    return f"{FONTS_SUBDIR}/{Path(static_path).stem}.subset.woff2"
+
+
+def build(log=None) -> dict:
+    """Write the subsets, icons.css and the manifest; returns the manifest."""
+    log = log or (lambda path, before, after: None)
+    icons, chars = scan_usage()
+    manifest: dict[str, str] = {}
+
+    for static_path, spec in getattr(settings, "FONT_SUBSETS", {}).items():
+        source = finders.find(static_path)
+        if not source:
+            raise FileNotFoundError(f"font not found: {static_path}")
+        unicodes = parse_unicode_ranges(spec.get("unicodes", ""))
+        if spec.get("template_chars", True):
+            unicodes |= chars
+        target = _woff2_name(static_path)
+        subset_font(Path(source), build_dir() / target, unicodes)
+        manifest[static_path] = target
+        log(static_path, os.path.getsize(source), (build_dir() / target).stat().st_size)
+
+    icon_css_path = getattr(settings, "ICON_FONT_CSS", None)
+    if icon_css_path:
+        source_css = finders.find(icon_css_path)
+        if not source_css:
+            raise FileNotFoundError(f"icon CSS not found: {icon_css_path}")
+        css = _read(Path(source_css))
+        glyphs = icon_glyphs(css)
+        used = icons & set(glyphs)
+        codepoints = {glyphs[name] for name in used}
+        icon_fonts = {}
+        if codepoints:
+            css_dir = posixpath.dirname(icon_css_path)
+            for match in _FONT_URL_RE.finditer(css):
+                font_path = posixpath.normpath(posixpath.join(css_dir, match.group(2)))
+                if font_path.endswith(".woff2") and font_path not in icon_fonts:
+                    source = finders.find(font_path)
+                    if source:
+                        icon_fonts[font_path] = _woff2_name(font_path)
+                        subset_font(Path(source), build_dir() / icon_fonts[font_path], codepoints)
+                        log(font_path, os.path.getsize(source), (build_dir() / icon_fonts[font_path]).stat().st_size)
+        trimmed = trim_icon_css(css, used, icon_fonts, icon_css_path)
+        (build_dir() / ICONS_CSS).parent.mkdir(parents=True, exist_ok=True)
+        (build_dir() / ICONS_CSS).write_text(trimmed, encoding="utf-8")
+        manifest.update(icon_fonts)
+        manifest[icon_css_path] = ICONS_CSS
+        log(icon_css_path, len(css.encode("utf-8")), len(trimmed.encode("utf-8")))
+
+    manifest_path().parent.mkdir(parents=True, exist_ok=True)
+    manifest_path().write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    return manifest
+
+
+# --- url() rewriting (collectstatic) ---------------------------------------------------------------
+
+def trimmed_css(css_path: str, manifest: dict) -> str | None:
+    """The trimmed build of css_path (icons.css) with its url()s relative to css_path; None if not built."""
+    built = manifest.get(css_path)
+    if not built or not css_path.endswith(".css"):
+        return None
+    try:
+        css = (build_dir() / built).read_text(encoding="utf-8")
+    except OSError:
+        return None
+    css_dir, built_dir = posixpath.dirname(css_path), posixpath.dirname(built)
+
+    def rebase(match):
+        target = posixpath.normpath(posixpath.join(built_dir, match.group(2)))
+        return f'url({posixpath.relpath(target, css_dir or ".")}) format("woff2")'
+
+    return _FONT_URL_RE.sub(rebase, css)
+
+
+def rewrite_font_urls(css: str, css_path: str, manifest: dict) -> str:
+    """Point url()s of subsetted fonts at the WOFF2 subsets (absolute /static/... or relative)."""
+    fonts = {src: dst for src, dst in manifest.items() if not src.endswith(".css")}
+    if not fonts:
+        return css
+    static_url = settings.STATIC_URL if settings.STATIC_URL.startswith("/") else "/" + settings.STATIC_URL
+    css_dir = posixpath.dirname(css_path)
+
+    def fix(match):
+        quote, url = match.groups()
+        if url.startswith(static_url):
+            source, absolute = url[len(static_url):], True
+        elif re.match(r"^(?:[a-z]+:|/)", url, re.I):
+            return match.group(0)
+        else:
+            source, absolute = posixpath.normpath(posixpath.join(css_dir, url)), False
+        if source not in fonts:
+            return match.group(0)
+        target = static_url + fonts[source] if absolute else posixpath.relpath(fonts[source], css_dir or ".")
+        return f'url({quote}{target}{quote}) format("woff2")'
+
+    return _FONT_URL_RE.sub(fix, css)
@@ -0,0 +1,147 @@
+"""
+Perceptual-quality-targeted encoding.
+
+Instead of a fixed quality per image type, encode_to_target() binary-searches the
+encoder quality for the smallest AVIF/WebP whose SSIM against the source reaches a
+target (settings.IMAGE_SSIM_TARGET). SSIM is computed with NumPy over 8x8 windows
+(box filter through summed-area tables) on Y, Cb and Cr, weighted 0.8/0.1/0.1 so
+chroma-subsampling damage still counts. Images with alpha are compared after
+compositing both sides on mid-grey.
+
+The result records the chosen quality, the score, the size and the size at the
+preset quality the search started from (the byte savings); callers store it in the
+image sidecar (common.image_utils.record_encoding) and the Prometheus histograms.
+"""
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from common.image_utils import AVIF_AVAILABLE, encode_bytes, ensure_dir
+from common.metrics import IMAGE_ENCODE_QUALITY
+
+# quality search range per format (pillow-avif / libwebp scales)
+QUALITY_RANGE = {"avif": (20, 90), "webp": (40, 95)}
+WINDOW = 8
+CHANNEL_WEIGHTS = (0.8, 0.1, 0.1)
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+# SSIM is computed on at most this many pixels on the long side (artifacts of the
+# quality range searched here survive the downscale; the search stays fast)
+MAX_COMPARE_SIDE = 1600
+
+
+@dataclass
+class EncodeResult:
+    format: str
+    quality: int
+    ssim: float
+    size: int
+    baseline_quality: int
+    baseline_size: int
+    data: bytes = b""
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.baseline_size - self.size
+
+    def as_record(self) -> dict:
+        record = asdict(self)
+        record.pop("data")
+        record["ssim"] = round(self.ssim, 5)
+        return record
+
+
+def _ycbcr(img: Image.Image) -> np.ndarray:
+    if img.mode in ("RGBA", "LA", "P"):
+        rgba = img.convert("RGBA")
+        base = Image.new("RGBA", rgba.size, (128, 128, 128, 255))
+        base.alpha_composite(rgba)
+        img = base
+    img = img.convert("RGB")
+    if max(img.size) > MAX_COMPARE_SIDE:
+        img = img.copy()
+        img.thumbnail((MAX_COMPARE_SIDE, MAX_COMPARE_SIDE), Image.BOX)
+    return np.asarray(img.convert("YCbCr"), dtype=np.float64)
+
+
+def _box_mean(a: np.ndarray, k: int) -> np.ndarray:
+    """Mean over every k x k window (valid positions) via a summed-area table."""
+    sat = np.zeros((a.shape[0] + 1, a.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(a, axis=0), axis=1, out=sat[1:, 1:])
+    total = sat[k:, k:] - sat[:-k, k:] - sat[k:, :-k] + sat[:-k, :-k]
+    return total / (k * k)
+
+
+def _ssim_channel(x: np.ndarray, y: np.ndarray, k: int) -> float:
+    mu_x, mu_y = _box_mean(x, k), _box_mean(y, k)
+    var_x = _box_mean(x * x, k) - mu_x * mu_x
+    var_y = _box_mean(y * y, k) - mu_y * mu_y
+    cov = _box_mean(x * y, k) - mu_x * mu_y
+    num = (2 * mu_x * mu_y + _C1) * (2 * cov + _C2)
+    den = (mu_x * mu_x + mu_y * mu_y + _C1) * (var_x + var_y + _C2)
+    return float(np.mean(num / den))
+
+
+def ssim(reference: Image.Image, candidate: Image.Image) -> float:
+    """Weighted YCbCr SSIM of two images of the same size (1.0 = identical)."""
+    a, b = _ycbcr(reference), _ycbcr(candidate)
+    if a.shape != b.shape:
+        raise ValueError(f"size mismatch: {a.shape} vs {b.shape}")
+    k = min(WINDOW, a.shape[0], a.shape[1])
+    return sum(w * _ssim_channel(a[..., c], b[..., c], k) for c, w in enumerate(CHANNEL_WEIGHTS))
+
+
+def encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    """Same encoder settings as image_utils.save_avif / save_webp (current profile), in memory."""
+    return encode_bytes(img, fmt, quality)
+
+
+def encode_to_target(img: Image.Image, fmt: str, target: float, baseline_quality: int,
+                     quality_range: tuple[int, int] | None = None) -> EncodeResult:
+    """
+    Smallest-quality encode with ssim >= target (assumes the score grows with quality).
+    baseline_quality (the preset) is probed first and narrows the search; when even the
+    top of the range misses the target, the top is used.
+    """
+    if fmt == "avif" and not AVIF_AVAILABLE:
+        raise ValueError("AVIF encoder not available")
+    lo, hi = quality_range or QUALITY_RANGE[fmt]
+    baseline_quality = min(max(baseline_quality, lo), hi)
+    probes: dict[int, tuple[bytes, float]] = {}
+
+    def probe(q: int) -> float:
+        if q not in probes:
+            data = encode(img, fmt, q)
+            with Image.open(BytesIO(data)) as decoded:
+                decoded.load()
+                probes[q] = (data, ssim(img, decoded))
+        return probes[q][1]
+
+    # invariant: every quality >= best meets the target (best = hi when nothing is known)
+    if probe(baseline_quality) >= target:
+        best, hi = baseline_quality, baseline_quality - 1
+    else:
+        best, lo = hi, baseline_quality + 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if probe(mid) >= target:
+            best, hi = mid, mid - 1
+        else:
+            lo = mid + 1
+    score = probe(best)
+
+    data = probes[best][0]
+    IMAGE_ENCODE_QUALITY.labels(fmt).observe(best)
+    return EncodeResult(fmt, best, score, len(data), baseline_quality, len(probes[baseline_quality][0]), data)
+
+
+def save_to_target(img: Image.Image, out_path: str, fmt: str, target: float, baseline_quality: int) -> EncodeResult:
+    result = encode_to_target(img, fmt, target, baseline_quality)
+    ensure_dir(out_path)
+    with open(out_path, "wb") as f:
+        f.write(result.data)
+    return result
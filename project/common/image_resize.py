@@ -0,0 +1,281 @@
+"""
+On-demand image resizing: /img/<params>.<signature>/<media path>.
+
+params is "<w>x<h>[-<mode>][-q<quality>]": h=0 keeps the aspect ratio, mode is one of
+cover (default, center crop), contain (transparent padding) or blur (blurred cover
+background + contained foreground). The output format follows the Accept header
+(AVIF > WebP > JPEG), so responses carry `Vary: Accept`.
+
+URLs are HMAC-signed (settings.IMAGE_RESIZE_KEY, default SECRET_KEY) over params and
+path, so clients cannot request arbitrary sizes; build them with resized_url() or the
+cdn_extras template tags. Encoded results are kept in a disk cache
+(IMAGE_RESIZE_CACHE_DIR) with LRU eviction by mtime once it grows past
+IMAGE_RESIZE_CACHE_MAX_MB; nginx can cache the responses in front of it
+(deploy/nginx*.conf, proxy_cache keyed on the negotiated format) or, with
+MEDIA_X_ACCEL_REDIRECT, send the cached file itself (common.media_serving).
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.signing import Signer
+from django.http import Http404, HttpResponseNotAllowed
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from PIL import Image, UnidentifiedImageError
+
+from common.image_utils import (
+    AVIF_AVAILABLE, ImageTooLarge, _blur_extend_canvas, _fit_box, _fit_box_contain, open_bounded, save_avif,
+    save_jpeg, save_webp,
+)
+from common.media_serving import serve_file
+from common.metrics import IMAGE_RESIZE_REQUESTS
+
+MODES = ("cover", "contain", "blur")
+SOURCE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".webp", ".avif", ".gif"})
+CONTENT_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+DEFAULT_QUALITY = {"avif": 60, "webp": 82, "jpeg": 82}
+
+_PARAMS_RE = re.compile(rf"^(\d{{1,4}})x(\d{{1,4}})(?:-({'|'.join(MODES)}))?(?:-q(\d{{1,3}}))?$")
+
+
+@dataclass(frozen=True)
+class ResizeSpec:
+    width: int
+    height: int = 0
+    mode: str = "cover"
+    quality: int | None = None
+
+    @property
+    def params(self) -> str:
+        out = f"{self.width}x{self.height}"
+        if self.mode != "cover":
+            out += f"-{self.mode}"
+        if self.quality:
+            out += f"-q{self.quality}"
+        return out
+
+    @classmethod
+    def parse(cls, params: str) -> "ResizeSpec":
+        match = _PARAMS_RE.match(params)
+        if not match:
+            raise ValueError(f"bad resize params: {params!r}")
+        width, height, mode, quality = match.groups()
+        spec = cls(int(width), int(height), mode or "cover", int(quality) if quality else None)
+        limit = int(getattr(settings, "IMAGE_RESIZE_MAX_DIM", 2400))
+        if not 0 < spec.width <= limit or spec.height > limit or (spec.quality is not None and not 0 < spec.quality <= 100):
+            raise ValueError(f"resize params out of range: {params!r}")
+        return spec
+
+
+# --- signing ----------------------------------------------------------------------------
+
+def _signer() -> Signer:
+    key = getattr(settings, "IMAGE_RESIZE_KEY", None) or settings.SECRET_KEY
+    return Signer(key=key, salt="common.image_resize")
+
+
+def signature(params: str, name: str) -> str:
+    return _signer().signature(f"{params}/{name}")
+
+
+def resized_url(name: str, width: int, height: int = 0, mode: str = "cover", quality: int | None = None) -> str:
+    """Signed /img/ URL of a media file (storage name) at the given size."""
+    params = ResizeSpec(width, height, mode, quality).params
+    return reverse("resized_image", args=[f"{params}.{signature(params, name)}", name])
+
+
+# --- disk cache -------------------------------------------------------------------------
+
+class DiskLRUCache:
+    """
+    Files under directory/<2 hex>/<key>.<ext>. A hit sets the file's atime explicitly (noatime
+    mounts only stop the kernel from doing it on reads) and leaves the mtime alone: it is
+    what the ETag / Last-Modified of the app and of nginx are made from, so revalidation keeps
+    answering 304. evict() removes the least recently used files until the total is back
+    under 90% of max_bytes. Writers check the size after every
+    max_bytes/20 bytes written by this process, so the directory is not scanned per request.
+    """
+
+    touch_interval = 60  # seconds; don't rewrite the inode on every hit
+
+    def __init__(self, directory, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._written = 0
+
+    def path(self, key: str, ext: str) -> Path:
+        return self.directory / key[:2] / f"{key}.{ext}"
+
+    def get(self, key: str, ext: str) -> Path | None:
+        path = self.path(key, ext)
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        now = time.time()
+        if now - max(st.st_atime, st.st_mtime) > self.touch_interval:
+            try:
+                os.utime(path, (now, st.st_mtime))
+            except OSError:
+                pass
+        return path
+
+    def put(self, key: str, ext: str, write) -> Path:
+        """write(tmp_path) produces the file; it is moved into place atomically."""
+        path = self.path(key, ext)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=f".{ext}")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._written += path.stat().st_size
+        if self._written >= self.max_bytes / 20:
+            self._written = 0
+            self.evict()
+        return path
+
+    def _entries(self):
+        try:
+            with os.scandir(self.directory) as buckets:
+                for bucket in buckets:
+                    if not bucket.is_dir(follow_symlinks=False):
+                        continue
+                    with os.scandir(bucket.path) as files:
+                        for entry in files:
+                            if entry.is_file(follow_symlinks=False) and not entry.name.startswith(".tmp-"):
+                                st = entry.stat()
+                                yield max(st.st_atime, st.st_mtime), st.st_size, entry.path
+        except FileNotFoundError:
+            return
+
+    def evict(self) -> int:
+        """Drop least recently used files while over max_bytes; returns the number removed."""
+        entries = list(self._entries())
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return 0
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+
+_cache: DiskLRUCache | None = None
+
+
+def get_cache() -> DiskLRUCache:
+    global _cache
+    directory = Path(getattr(settings, "IMAGE_RESIZE_CACHE_DIR", settings.BASE_DIR / "cache" / "img"))
+    max_bytes = int(getattr(settings, "IMAGE_RESIZE_CACHE_MAX_MB", 512)) * 1024 * 1024
+    if _cache is None or _cache.directory != directory or _cache.max_bytes != max_bytes:
+        _cache = DiskLRUCache(directory, max_bytes)
+    return _cache
+
+
+# --- rendering ---------------------------------------------------------------------------
+
+def negotiate_format(accept: str) -> str:
+    accept = accept or ""
+    if AVIF_AVAILABLE and "image/avif" in accept:
+        return "avif"
+    if "image/webp" in accept:
+        return "webp"
+    return "jpeg"
+
+
+def render(name: str, spec: ResizeSpec, fmt: str, out_path: str) -> None:
+    with default_storage.open(name, "rb") as f:
+        # JPEGs decode at the smallest DCT scale still covering the requested box
+        img = open_bounded(f, min_size=(spec.width, spec.height or 1))
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+    if spec.height:
+        size = (spec.width, spec.height)
+        if spec.mode == "blur":
+            img = _blur_extend_canvas(img, size)
+        elif spec.mode == "contain":
+            img = _fit_box_contain(img, size)
+        else:
+            img = _fit_box(img, size)
+    else:
+        # width only: keep the aspect ratio, never upscale
+        width = min(spec.width, img.width)
+        height = max(1, round(img.height * width / img.width))
+        img = img.convert("RGBA").resize((width, height), Image.LANCZOS) if width != img.width else img
+
+    quality = spec.quality or DEFAULT_QUALITY[fmt]
+    if fmt == "avif":
+        save_avif(img, out_path, quality=quality)
+    elif fmt == "webp":
+        save_webp(img, out_path, quality=quality)
+    else:
+        save_jpeg(img, out_path, quality=quality)
+
+
+def _source_name(path: str) -> str:
+    name = posixpath.normpath(path)
+    if name.startswith(("..", "/")) or os.path.splitext(name)[1].lower() not in SOURCE_EXTENSIONS:
+        raise Http404("Not an image")
+    return name
+
+
+def resized_image_view(request, signed: str, path: str):
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+    params, _, sig = signed.rpartition(".")
+    if not params or not constant_time_compare(sig, signature(params, path)):
+        raise Http404("Bad signature")
+    try:
+        spec = ResizeSpec.parse(params)
+    except ValueError:
+        raise Http404("Bad parameters")
+    name = _source_name(path)
+    try:
+        modified = default_storage.get_modified_time(name).timestamp()
+    except (OSError, NotImplementedError):
+        raise Http404("No such image")
+
+    fmt = negotiate_format(request.META.get("HTTP_ACCEPT", ""))
+    # the source mtime is part of the key: a re-uploaded file gets fresh variants
+    key = hashlib.sha256(f"{name}\0{spec.params}\0{fmt}\0{modified}".encode()).hexdigest()
+    cache = get_cache()
+    cached = cache.get(key, fmt)
+    if cached is not None:
+        IMAGE_RESIZE_REQUESTS.labels("hit").inc()
+    else:
+        try:
+            cached = cache.put(key, fmt, lambda tmp: render(name, spec, fmt, tmp))
+        except (UnidentifiedImageError, Image.DecompressionBombError, ImageTooLarge, OSError):
+            IMAGE_RESIZE_REQUESTS.labels("error").inc()
+            raise Http404("Cannot decode image")
+        IMAGE_RESIZE_REQUESTS.labels("miss").inc()
+
+    # ETag/Range/304 and, behind nginx, an X-Accel-Redirect into the cache directory (common.media_serving)
+    response = serve_file(request, cached, content_type=CONTENT_TYPES[fmt],
+                          cache_control=f"public, max-age={int(getattr(settings, 'IMAGE_RESIZE_MAX_AGE', 2592000))}")
+    patch_vary_headers(response, ("Accept",))
+    return response
@@ -1,8 +1,17 @@
+import base64
+import json
+import math
 import os
+import re
+import tempfile
+from contextlib import contextmanager
+from contextvars import ContextVar
 from io import BytesIO
 from typing import Tuple, Literal
 
-from PIL import Image, ImageFilter
+from PIL import Image, ImageFilter, ImageOps
+
+from common.metrics import time_image_encode
 
 try:
     import pillow_avif  # noqa: F401  # registers AVIF
@@ -15,12 +24,135 @@ def ensure_dir(path: str) -> None:
     os.makedirs(os.path.dirname(path), exist_ok=True)
 
 
-def _open_image(path: str) -> Image.Image:
-    img = Image.open(path)
+# --- bounded-memory decoding --------------------------------------------------------------
+# Admin uploads can be 40+ megapixel phone photos: dimensions are checked from the header
+# (settings.IMAGE_MAX_PIXELS) before anything is decoded, JPEGs are decoded in draft mode
+# (DCT scaling by 1/2..1/8) close to the size actually needed, and originals are encoded at
+# most settings.IMAGE_MAX_EDGE on the long side.
+
+_ORIENTATION = 0x0112
+_STRIPPED_INFO = ("exif", "xmp", "XML:com.adobe.xmp", "photoshop", "comment")
+
+
+class ImageTooLarge(ValueError):
+    """More pixels than settings.IMAGE_MAX_PIXELS (known from the header, nothing decoded)."""
+
+
+def _image_limits() -> tuple[int, int]:
+    from django.conf import settings
+
+    return int(getattr(settings, "IMAGE_MAX_PIXELS", 0) or 0), int(getattr(settings, "IMAGE_MAX_EDGE", 0) or 0)
+
+
+def check_image_pixels(size: Tuple[int, int]) -> None:
+    max_pixels, _ = _image_limits()
+    if max_pixels and size[0] * size[1] > max_pixels:
+        raise ImageTooLarge(
+            f"{size[0]}x{size[1]} is {size[0] * size[1] / 1e6:.0f} MP, the limit is {max_pixels / 1e6:.0f} MP"
+        )
+
+
+def open_bounded(fp, max_edge: int | None = None, min_size: Tuple[int, int] | None = None) -> Image.Image:
+    """
+    Decode an image (path or file object) with bounded memory: header-only pixel check,
+    JPEG draft decoding no smaller than min_size (or max_edge on the long side), EXIF
+    orientation applied, downscaled to max_edge, and EXIF/XMP dropped so encoders don't
+    copy camera metadata into the variants (the ICC profile stays).
+    """
+    img = Image.open(fp)
+    try:
+        check_image_pixels(img.size)
+    except ImageTooLarge:
+        img.close()
+        raise
+    w, h = img.size
+    if max_edge and max(w, h) > max_edge:
+        ratio = max_edge / max(w, h)
+        min_size = (max(1, math.ceil(w * ratio)), max(1, math.ceil(h * ratio)))
+    elif min_size and img.getexif().get(_ORIENTATION) in (5, 6, 7, 8):
+        # requested in display orientation; the stored image is rotated by 90 degrees
+        min_size = (min_size[1], min_size[0])
+    if min_size:
+        img.draft(img.mode, (max(1, min_size[0]), max(1, min_size[1])))  # JPEG only, no-op otherwise
     img.load()
+    ImageOps.exif_transpose(img, in_place=True)
+    if max_edge and max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    for key in _STRIPPED_INFO:
+        img.info.pop(key, None)
     return img
 
 
+def _open_image(path: str) -> Image.Image:
+    return open_bounded(path, max_edge=_image_limits()[1] or None)
+
+
+def validate_image_upload(file) -> None:
+    """Form validator: reject uploads over IMAGE_MAX_PIXELS before they are stored."""
+    from django.core.exceptions import ValidationError
+
+    try:
+        file.seek(0)
+        with Image.open(file) as img:
+            check_image_pixels(img.size)
+    except ImageTooLarge as e:
+        raise ValidationError(f"Image is too large: {e}.", code="image_too_large")
+    except (OSError, Image.DecompressionBombError):
+        pass  # not decodable: forms.ImageField reports it
+    finally:
+        file.seek(0)
+
+
+def needs_normalizing(img: Image.Image, max_edge: int | None = None) -> bool:
+    """From the header only: larger than max_edge, EXIF-rotated or carrying camera metadata."""
+    max_edge = max_edge or _image_limits()[1]
+    return bool(
+        (max_edge and max(img.size) > max_edge)
+        or img.getexif().get(_ORIENTATION, 1) != 1
+        or any(key in img.info for key in _STRIPPED_INFO)
+    )
+
+
+def encode_normalized(img: Image.Image, fmt: str) -> bytes:
+    """Re-encode a decoded original (open_bounded) in its own format, ICC profile kept."""
+    buf = BytesIO()
+    icc = {"icc_profile": img.info["icc_profile"]} if img.info.get("icc_profile") else {}
+    if fmt == "JPEG":
+        img.convert("RGB").save(buf, format="JPEG", quality=90, optimize=True, progressive=True, **icc)
+    elif fmt == "PNG":
+        img.save(buf, format="PNG", optimize=True, **icc)
+    else:
+        img.save(buf, format="WEBP", quality=90, method=4, **icc)
+    return buf.getvalue()
+
+
+NORMALIZED_FORMATS = ("JPEG", "PNG", "WEBP")
+
+
+def normalize_original(path: str, max_edge: int | None = None) -> bool:
+    """
+    Rewrite an uploaded original in place at most max_edge (default IMAGE_MAX_EDGE) on the
+    long side, EXIF-oriented and without camera metadata. Only reads the header when the file
+    is already normalized; returns whether it was rewritten.
+    """
+    max_edge = max_edge or _image_limits()[1]
+    with Image.open(path) as probe:
+        fmt = probe.format
+        needs_work = needs_normalizing(probe, max_edge)
+    if not needs_work or fmt not in NORMALIZED_FORMATS:
+        return False
+    data = encode_normalized(open_bounded(path, max_edge=max_edge or None), fmt)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=os.path.splitext(path)[1])
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return True
+
+
 def _fit_box(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
     # cover-like resize with center crop to exact size
     target_w, target_h = size
@@ -67,9 +199,75 @@ def _fit_box_contain(img: Image.Image, size: Tuple[int, int], background=(0, 0,
     return base
 
 
+# --- encoding profiles -------------------------------------------------------------------
+# settings.IMAGE_ENCODING_PROFILES: 'interactive' (admin saves via goods.signals, the /img/ endpoint)
+# trades bytes for latency, 'archival' (batch management commands) the other way round.
+
+_profile: ContextVar[str | None] = ContextVar("image_encoding_profile", default=None)
+
+
+@contextmanager
+def encoding_profile(name: str):
+    """Encode with the named profile inside the block; also usable as a decorator."""
+    from django.conf import settings
+
+    if name not in settings.IMAGE_ENCODING_PROFILES:
+        raise ValueError(f"Unknown image encoding profile: {name!r}")
+    token = _profile.set(name)
+    try:
+        yield
+    finally:
+        _profile.reset(token)
+
+
+def current_profile() -> dict:
+    from django.conf import settings
+
+    name = _profile.get() or getattr(settings, "IMAGE_ENCODING_PROFILE", "interactive")
+    return settings.IMAGE_ENCODING_PROFILES[name]
+
+
+def avif_options() -> dict:
+    """Pillow save() options of the current profile's AVIF encoder (besides quality)."""
+    profile = current_profile()
+    return {
+        "speed": profile.get("avif_speed", 6),
+        "max_threads": profile.get("avif_max_threads") or os.cpu_count() or 1,
+        "subsampling": profile.get("avif_subsampling", "4:2:0"),
+    }
+
+
+def webp_options() -> dict:
+    return {"method": current_profile().get("webp_method", 6)}
+
+
+def encode_bytes(img: Image.Image, fmt: str, quality: int) -> bytes:
+    """Same encoder settings as save_avif / save_webp (current profile), in memory."""
+    buf = BytesIO()
+    with time_image_encode(fmt):
+        if fmt == "avif":
+            img.save(buf, format="AVIF", quality=quality, **avif_options())
+        else:
+            img.save(buf, format="WEBP", quality=quality, **webp_options())
+    return buf.getvalue()
+
+
 def save_webp(img: Image.Image, out_path: str, quality: int = 80) -> None:
     ensure_dir(out_path)
-    img.save(out_path, format="WEBP", quality=quality, method=6)
+    with time_image_encode("webp"):
+        img.save(out_path, format="WEBP", quality=quality, **webp_options())
+
+
+def save_jpeg(img: Image.Image, out_path: str, quality: int = 82) -> None:
+    ensure_dir(out_path)
+    if img.mode != "RGB":
+        # JPEG has no alpha: flatten onto white instead of black
+        rgba = img.convert("RGBA")
+        flat = Image.new("RGB", rgba.size, (255, 255, 255))
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+        img = flat
+    with time_image_encode("jpeg"):
+        img.save(out_path, format="JPEG", quality=quality, optimize=True, progressive=True)
 
 
 def save_avif(img: Image.Image, out_path: str, quality: int = 50) -> None:
@@ -78,10 +276,44 @@ def save_avif(img: Image.Image, out_path: str, quality: int = 50) -> None:
     ensure_dir(out_path)
     # pillow-avif uses 'quality' 0..100 similar to JPEG; smaller -> worse
     # we'll map requested 'quality' ~ cqLevel analogue
-    img.save(out_path, format="AVIF", quality=quality)
+    with time_image_encode("avif"):
+        img.save(out_path, format="AVIF", quality=quality, **avif_options())
 
 
-def save_avif_optimized(img: Image.Image, out_path: str, image_type: str = "background", quality: int | None = None) -> None:
+def ssim_target() -> float | None:
+    """settings.IMAGE_SSIM_TARGET when the targeted encoder can run (NumPy installed), else None."""
+    from django.conf import settings
+
+    target = getattr(settings, "IMAGE_SSIM_TARGET", None)
+    if not target:
+        return None
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return None
+    return float(target)
+
+
+def avif_preset_quality(img: Image.Image, image_type: str = "background") -> int:
+    # Normalize type
+    kind = (image_type or "background").strip().lower()
+    # Heuristic presets (tuned for pillow-avif quality scale)
+    if kind == "product":
+        # Preserve detail on product shots a bit more than before
+        return 45
+    # Backgrounds: adapt by size; larger backgrounds need higher quality to avoid mushy look
+    longest = max(getattr(img, 'size', (0, 0)) or (0, 0))
+    if longest >= 2400:
+        return 66
+    elif longest >= 1920:
+        return 62
+    elif longest >= 1600:
+        return 58
+    return 54
+
+
+def save_avif_optimized(img: Image.Image, out_path: str, image_type: str = "background", quality: int | None = None,
+                        target_ssim: float | None = None):
     """
     Optimized AVIF saver expected by management commands.
     Chooses sensible defaults depending on image type.
@@ -89,34 +321,125 @@ def save_avif_optimized(img: Image.Image, out_path: str, image_type: str = "back
     image_type:
       - 'background' -> aggressive compression for large backdrops
       - 'product'    -> conservative to preserve detail
+
+    With an SSIM target (target_ssim, default settings.IMAGE_SSIM_TARGET) and no explicit
+    quality, the preset is only where common.image_quality starts its per-image search for
+    the smallest file meeting the target; the EncodeResult is returned (None otherwise).
     """
     if not AVIF_AVAILABLE:
-        return
-
-    # Normalize type
-    kind = (image_type or "background").strip().lower()
+        return None
 
     # If quality explicitly provided (e.g., via management command), honor it
     if isinstance(quality, int) and 0 <= quality <= 100:
-        q = quality
-    else:
-        # Heuristic presets (tuned for pillow-avif quality scale)
-        if kind == "product":
-            # Preserve detail on product shots a bit more than before
-            q = 45
-        else:
-            # Backgrounds: adapt by size; larger backgrounds need higher quality to avoid mushy look
-            longest = max(getattr(img, 'size', (0, 0)) or (0, 0))
-            if longest >= 2400:
-                q = 66
-            elif longest >= 1920:
-                q = 62
-            elif longest >= 1600:
-                q = 58
-            else:
-                q = 54
+        save_avif(img, out_path, quality=quality)
+        return None
 
+    q = avif_preset_quality(img, image_type)
+    target = target_ssim if target_ssim is not None else ssim_target()
+    if target:
+        from common.image_quality import save_to_target
+
+        return save_to_target(img, out_path, "avif", target, q)
     save_avif(img, out_path, quality=q)
+    return None
+
+
+# --- placeholders + intrinsic size -------------------------------------------------------------
+# <root>.meta.json next to the original: {"width": W, "height": H, "lqip": "data:image/webp;base64,..."}
+# lqip is a ~16px WebP (a few hundred bytes) that templates inline as the <img> background until the
+# real file arrives; None for images with transparency (the blur would show through).
+
+LQIP_MAX_SIDE = 16
+LQIP_QUALITY = 40
+
+
+def meta_path(original_path: str) -> str:
+    root, _ext = os.path.splitext(original_path)
+    return f"{root}.meta.json"
+
+
+# Everything generated next to an original: <root>.avif/.webp, <root>.meta.json,
+# <root>_<W>x<H>.avif/.webp/.png (width ladders, card/icon variants)
+_SIBLING_RE = re.compile(r"^(?P<root>.+?)(?:_\d+x\d+)?(?:\.meta\.json|\.[A-Za-z0-9]+)$")
+
+
+def original_root(name: str) -> str:
+    """'products/a_230x160.webp' -> 'products/a': the original's name without its extension."""
+    match = _SIBLING_RE.match(name)
+    return match.group("root") if match else name
+
+
+def candidate_roots(name: str) -> set[str]:
+    """
+    Roots of the originals name may belong to: 'products/b_1200x400.webp' is a variant of
+    products/b.* or the no-resize copy of an original itself called products/b_1200x400.*.
+    """
+    base = name[:-len(".meta.json")] if name.endswith(".meta.json") else os.path.splitext(name)[0]
+    return {base, original_root(name)}
+
+
+# what the pipeline writes after <root>: never another upload (a_100x100.jpg is not a variant of a.jpg)
+_GENERATED_SUFFIX_RE = re.compile(r"(?:_\d+x\d+)?(?:\.meta\.json|\.avif|\.webp)", re.IGNORECASE)
+
+
+def is_generated_from(name: str, root: str) -> bool:
+    """name is a variant or the sidecar generated for the original whose root (name without extension) is root."""
+    return name.startswith(root) and bool(_GENERATED_SUFFIX_RE.fullmatch(name[len(root):]))
+
+
+def _has_alpha(img: Image.Image) -> bool:
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        alpha = img.convert("RGBA").getchannel("A")
+        return alpha.getextrema()[0] < 255
+    return False
+
+
+def compute_lqip(img: Image.Image) -> str | None:
+    if _has_alpha(img):
+        return None
+    small = img.convert("RGB")
+    small.thumbnail((LQIP_MAX_SIDE, LQIP_MAX_SIDE), Image.LANCZOS)
+    buf = BytesIO()
+    small.save(buf, format="WEBP", quality=LQIP_QUALITY, method=6)
+    return "data:image/webp;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def write_image_meta(original_fs_path: str, img: Image.Image | None = None, overwrite: bool = False) -> dict:
+    """Write (or reuse, when newer than the original) the placeholder/size sidecar; returns its data."""
+    if not original_fs_path or not os.path.exists(original_fs_path):
+        return {}
+    out_path = meta_path(original_fs_path)
+    if not overwrite and os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(original_fs_path):
+        meta = _read_meta(out_path)
+        if meta:
+            return meta
+    if img is None:
+        img = _open_image(original_fs_path)
+    meta = {"width": img.width, "height": img.height, "lqip": compute_lqip(img)}
+    previous = _read_meta(out_path)
+    if previous.get("encodings") and os.path.getmtime(out_path) >= os.path.getmtime(original_fs_path):
+        # same original: keep what the targeted encoder recorded
+        meta["encodings"] = previous["encodings"]
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def _read_meta(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_encoding(original_fs_path: str, results: dict) -> None:
+    """Store {format: EncodeResult} of the SSIM-targeted encoder in the sidecar ("encodings")."""
+    path = meta_path(original_fs_path)
+    meta = _read_meta(path)
+    meta.setdefault("encodings", {}).update({fmt: result.as_record() for fmt, result in results.items()})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
 
 
 def build_variant_paths(original_path: str, size_name: str, out_ext: str) -> str:
@@ -239,6 +562,79 @@ def generate_card_variants(
     return result
 
 
+def width_ladder(role: str) -> dict:
+    """
+    Width ladder of an image role from settings.IMAGE_WIDTH_LADDERS:
+      {'widths': [...], 'aspect': (w, h), 'mode': 'cover'|'contain'|'blur', 'sizes': '<img sizes>'}
+    """
+    from django.conf import settings
+
+    try:
+        return settings.IMAGE_WIDTH_LADDERS[role]
+    except KeyError:
+        raise ValueError(f"Unknown image role: {role!r}")
+
+
+def ladder_sizes(role: str) -> list[Tuple[int, int]]:
+    """(w, h) canvases of a role, smallest first; h follows the role's aspect ratio."""
+    spec = width_ladder(role)
+    aspect_w, aspect_h = spec["aspect"]
+    return [(w, max(1, int(round(w * aspect_h / aspect_w)))) for w in sorted(spec["widths"])]
+
+
+def generate_width_ladder(
+    original_fs_path: str,
+    role: str,
+    *,
+    mode: Literal["contain", "cover", "blur"] | None = None,
+    quality_webp: int | None = None,
+    quality_avif: int | None = None,
+    overwrite: bool = True,
+) -> dict:
+    """
+    Generate AVIF/WebP variants for every width of the role's ladder (<root>_<W>x<H>.<ext>).
+    Widths above the source width are skipped (no upscaling) except the smallest one, so a
+    small upload still gets one variant. Returns {'<W>x<H>': {'webp': path, 'avif': path}}.
+    """
+    if not original_fs_path or not os.path.exists(original_fs_path):
+        return {}
+
+    img = _open_image(original_fs_path)
+    write_image_meta(original_fs_path, img, overwrite=overwrite)
+    mode = mode or width_ladder(role).get("mode", "cover")
+    sizes = ladder_sizes(role)
+    sizes = [sizes[0]] + [(w, h) for w, h in sizes[1:] if w <= img.width]
+
+    result = {}
+    for w, h in sizes:
+        size_name = f"{w}x{h}"
+        out_webp = build_variant_paths(original_fs_path, size_name, "webp")
+        out_avif = build_variant_paths(original_fs_path, size_name, "avif")
+        if not overwrite and os.path.exists(out_webp) and (not AVIF_AVAILABLE or os.path.exists(out_avif)):
+            result[size_name] = {"webp": out_webp, **({"avif": out_avif} if AVIF_AVAILABLE else {})}
+            continue
+
+        if mode == "blur":
+            canvas = _blur_extend_canvas(img, (w, h))
+        elif mode == "contain":
+            canvas = _fit_box_contain(img, (w, h))
+        else:
+            canvas = _fit_box(img, (w, h))
+
+        save_webp(canvas, out_webp, quality=int(quality_webp) if isinstance(quality_webp, int) else 82)
+        if AVIF_AVAILABLE:
+            save_avif(canvas, out_avif, quality=int(quality_avif) if isinstance(quality_avif, int) else 60)
+
+        created = {}
+        if os.path.exists(out_webp):
+            created["webp"] = out_webp
+        if AVIF_AVAILABLE and os.path.exists(out_avif):
+            created["avif"] = out_avif
+        result[size_name] = created
+
+    return result
+
+
 def generate_formats_noresize(
     original_fs_path: str,
     *,
@@ -279,6 +675,7 @@ def generate_formats_noresize(
         original_mime = "image/jpeg"
 
     img = _open_image(original_fs_path)
+    write_image_meta(original_fs_path, img, overwrite=overwrite)
 
     # Preserve transparency: keep RGBA/LA; convert palette to RGBA; fallback to RGB
     if img.mode == "P":
@@ -288,21 +685,33 @@ def generate_formats_noresize(
 
     created_avif = None
     created_webp = None
+    encodings = {}
 
     # Save AVIF
     if AVIF_AVAILABLE:
         if overwrite or (not os.path.exists(out_avif)):
-            save_avif_optimized(img, out_avif, image_type=image_type, quality=quality_avif if isinstance(quality_avif, int) else None)
+            result = save_avif_optimized(img, out_avif, image_type=image_type, quality=quality_avif if isinstance(quality_avif, int) else None)
+            if result is not None:
+                encodings["avif"] = result
         if os.path.exists(out_avif):
             created_avif = out_avif
 
-    # Save WebP
+    # Save WebP (SSIM-targeted when configured and no explicit quality; the preset is the starting point)
     webp_q = int(quality_webp) if isinstance(quality_webp, int) else (82 if image_type == "background" else 80)
+    target = ssim_target() if not isinstance(quality_webp, int) else None
     if overwrite or (not os.path.exists(out_webp)):
-        save_webp(img, out_webp, quality=webp_q)
+        if target:
+            from common.image_quality import save_to_target
+
+            encodings["webp"] = save_to_target(img, out_webp, "webp", target, webp_q)
+        else:
+            save_webp(img, out_webp, quality=webp_q)
     if os.path.exists(out_webp):
         created_webp = out_webp
 
+    if encodings:
+        record_encoding(original_fs_path, encodings)
+
     mime_order = []
     if created_avif:
         mime_order.append(("image/avif", created_avif))
@@ -0,0 +1,223 @@
+"""
+Storage-agnostic image pipeline: everything goods.signals and the batch commands generate
+for an uploaded original, through the Django storage API only (open/save/delete/listdir),
+so it works the same on local disk (FileSystemStorage, DedupFileSystemStorage) and in a
+bucket (app.storage.S3MediaStorage).
+
+  <root>.avif / <root>.webp            no-resize variants (noresize=True)
+  <root>_<W>x<H>.avif / .webp          width ladders of the requested roles, and fixed
+                                       canvases (sizes=, e.g. the batch commands' icon/card sizes)
+  <root>.meta.json                     size + LQIP sidecar, plus "variants": the basenames
+                                       generated next to the original
+
+What already exists is learned from one listing per original (storage.list_prefix when the
+storage has it, else one listdir of the directory) instead of an exists() call per variant;
+when nothing is missing the original is not even downloaded. Variants are encoded in memory
+and written with storage.save. Templates read "variants" from the sidecar (media_extras) so a
+bucket isn't asked about every <source> either.
+"""
+from __future__ import annotations
+
+import json
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from common.image_utils import (
+    AVIF_AVAILABLE,
+    NORMALIZED_FORMATS,
+    _fit_box,
+    _fit_box_contain,
+    _blur_extend_canvas,
+    _image_limits,
+    avif_preset_quality,
+    compute_lqip,
+    encode_bytes,
+    encode_normalized,
+    ladder_sizes,
+    meta_path,
+    needs_normalizing,
+    open_bounded,
+    ssim_target,
+    width_ladder,
+)
+
+# what follows <root> in the names generated next to an original (see image_utils.original_root)
+_SIBLING_SUFFIX_RE = re.compile(r"(?:_\d+x\d+)?(?:\.meta\.json|\.[A-Za-z0-9]+)")
+
+
+def _formats() -> list[str]:
+    return ["avif", "webp"] if AVIF_AVAILABLE else ["webp"]
+
+
+def sidecar_name(name: str) -> str:
+    return meta_path(name)
+
+
+def list_siblings(name: str, storage=None) -> set[str]:
+    """Stored names generated next to an original (variants, sidecar), in one listing call."""
+    storage = storage or default_storage
+    root = posixpath.splitext(name)[0]
+    list_prefix = getattr(storage, "list_prefix", None)
+    if list_prefix is not None:
+        names = list_prefix(root)
+    else:
+        directory = posixpath.dirname(name)
+        try:
+            files = storage.listdir(directory)[1]
+        except (FileNotFoundError, NotImplementedError):
+            files = []
+        names = [posixpath.join(directory, f) for f in files]
+    return {n for n in names if n != name and n.startswith(root) and _SIBLING_SUFFIX_RE.fullmatch(n[len(root):])}
+
+
+def read_meta(name: str, storage=None) -> dict:
+    storage = storage or default_storage
+    try:
+        with storage.open(sidecar_name(name), "rb") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(storage, name: str, data: bytes, existing: set[str]) -> None:
+    if name in existing:
+        storage.delete(name)
+    # content-addressed storages would file the variant under its own hash otherwise
+    save = getattr(storage, "save_variant", storage.save)
+    saved = save(name, ContentFile(data))
+    if saved != name:  # somebody else wrote it meanwhile: keep theirs
+        storage.delete(saved)
+
+
+def planned_variants(name: str, width: int, *, roles=(), noresize: bool = True, sizes=(),
+                     mode: str = "cover") -> dict[str, tuple]:
+    """
+    {variant name: (format, canvas mode or None, (w, h) or None)} for a source `width` px wide;
+    no mode means the no-resize variant. Fixed `sizes` are always made, in `mode`.
+    """
+    root = posixpath.splitext(name)[0]
+    planned = {}
+    if noresize:
+        for fmt in _formats():
+            planned[f"{root}.{fmt}"] = (fmt, None, None)
+    for role in roles:
+        ladder = ladder_sizes(role)
+        role_mode = width_ladder(role).get("mode", "cover")
+        # no upscaling, but a small upload still gets the smallest width
+        for w, h in [ladder[0]] + [(w, h) for w, h in ladder[1:] if w <= width]:
+            for fmt in _formats():
+                planned[f"{root}_{w}x{h}.{fmt}"] = (fmt, role_mode, (w, h))
+    for w, h in sizes:
+        for fmt in _formats():
+            planned[f"{root}_{w}x{h}.{fmt}"] = (fmt, mode, (w, h))
+    return planned
+
+
+def _encode_noresize(img: Image.Image, fmt: str, image_type: str, quality: int | None):
+    """(bytes, EncodeResult or None): the preset quality, or the SSIM-targeted search when configured."""
+    if fmt == "avif":
+        preset = avif_preset_quality(img, image_type)
+    else:
+        preset = 82 if image_type == "background" else 80
+    target = ssim_target() if quality is None else None
+    if target:
+        from common.image_quality import encode_to_target
+
+        result = encode_to_target(img, fmt, target, preset)
+        return result.data, result
+    return encode_bytes(img, fmt, quality if quality is not None else preset), None
+
+
+def _canvas(img: Image.Image, mode: str, size) -> Image.Image:
+    if mode == "blur":
+        return _blur_extend_canvas(img, size)
+    if mode == "contain":
+        return _fit_box_contain(img, size)
+    return _fit_box(img, size)
+
+
+def process_image(name: str, *, image_type: str = "product", roles=(), noresize: bool = True,
+                  sizes=(), mode: str = "cover", overwrite: bool = False, quality_avif: int | None = None,
+                  quality_webp: int | None = None, storage=None) -> dict:
+    """
+    Generate what's missing for the stored original `name` (everything with overwrite): the
+    no-resize variants, the ladders of `roles` and the fixed `sizes` [(w, h)] in `mode`
+    (cover/contain/blur); returns {"written": [names], "variants": [basenames], "meta": sidecar data}.
+    With IMAGE_NORMALIZE_ORIGINALS the original itself is rewritten first when it is over
+    IMAGE_MAX_EDGE, EXIF-rotated or carries camera metadata (which regenerates everything).
+    """
+    storage = storage or default_storage
+    siblings = list_siblings(name, storage)
+    meta_name = sidecar_name(name)
+    meta = read_meta(name, storage) if meta_name in siblings else {}
+
+    if meta.get("width") and not overwrite:
+        planned = planned_variants(name, meta["width"], roles=roles, noresize=noresize, sizes=sizes, mode=mode)
+        if not set(planned) - siblings:
+            variants = sorted(posixpath.basename(n) for n in siblings if n != meta_name)
+            if meta.get("variants") != variants:
+                meta["variants"] = variants
+                _write(storage, meta_name, json.dumps(meta).encode("utf-8"), siblings)
+            return {"written": [], "variants": variants, "meta": meta}
+
+    written = []
+    max_edge = _image_limits()[1] or None
+    with storage.open(name, "rb") as f:
+        with Image.open(f) as probe:
+            fmt = probe.format
+            # content-addressed blobs (DedupFileSystemStorage) are immutable
+            normalize = (getattr(settings, "IMAGE_NORMALIZE_ORIGINALS", False)
+                         and not getattr(storage, "dedup_prefix", None)
+                         and fmt in NORMALIZED_FORMATS and needs_normalizing(probe, max_edge))
+        f.seek(0)
+        img = open_bounded(f, max_edge=max_edge)
+    if normalize:
+        _write(storage, name, encode_normalized(img, fmt), {name})
+        overwrite, meta = True, {}
+        written.append(name)
+
+    if img.mode == "P":
+        img = img.convert("RGBA")
+    if img.mode not in ("RGB", "RGBA", "LA"):
+        img = img.convert("RGB")
+
+    encodings = dict(meta.get("encodings") or {})
+    planned = planned_variants(name, img.width, roles=roles, noresize=noresize, sizes=sizes, mode=mode)
+    for variant, (fmt, canvas_mode, size) in planned.items():
+        if variant in siblings and not overwrite:
+            continue
+        if canvas_mode is None:
+            data, result = _encode_noresize(img, fmt, image_type, quality_avif if fmt == "avif" else quality_webp)
+            if result is not None:
+                encodings[fmt] = result.as_record()
+            else:
+                encodings.pop(fmt, None)
+        else:
+            quality = quality_avif if fmt == "avif" else quality_webp
+            data = encode_bytes(_canvas(img, canvas_mode, size), fmt, quality if quality is not None else (60 if fmt == "avif" else 82))
+        _write(storage, variant, data, siblings)
+        written.append(variant)
+
+    variants = sorted(posixpath.basename(n) for n in (siblings | set(written)) - {meta_name, name})
+    meta = {"width": img.width, "height": img.height, "lqip": compute_lqip(img), "variants": variants}
+    if encodings:
+        meta["encodings"] = encodings
+    _write(storage, meta_name, json.dumps(meta).encode("utf-8"), siblings)
+    return {"written": written, "variants": variants, "meta": meta}
+
+
+def missing_variants(name: str, *, roles=(), noresize: bool = True, sizes=(), mode: str = "cover",
+                     storage=None) -> list[str] | None:
+    """Planned variant names not stored yet (one listing); None when the sidecar doesn't exist yet."""
+    storage = storage or default_storage
+    siblings = list_siblings(name, storage)
+    meta = read_meta(name, storage) if sidecar_name(name) in siblings else {}
+    if not meta.get("width"):
+        return None
+    planned = planned_variants(name, meta["width"], roles=roles, noresize=noresize, sizes=sizes, mode=mode)
+    return sorted(set(planned) - siblings)
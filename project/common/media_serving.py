@@ -0,0 +1,201 @@
+"""
+Media served through Django with the bytes sent by nginx: /media/<name> (media_view) and the
+/img/ resize cache (common.image_resize) authorize in Python, then answer either with an
+X-Accel-Redirect to an `internal` nginx location over the same file (settings.MEDIA_X_ACCEL_REDIRECT,
+locations in MEDIA_X_ACCEL_LOCATIONS; nginx does sendfile, Range and the ETag itself) or, without
+nginx in front (runserver, tests), by streaming the file with the same semantics:
+
+  - ETag "<mtime hex>-<size hex>" (nginx's own format, so both paths validate each other's tags)
+    and Last-Modified; If-None-Match / If-Modified-Since answer 304 before the file is opened
+  - a single `Range: bytes=...` answers 206 (416 when unsatisfiable), honouring If-Range;
+    multi-range requests get the whole file
+  - Cache-Control: content-addressed names (DedupFileSystemStorage's cas/ blobs and their
+    variants) never change, so they are `immutable` for a year; other media get MEDIA_MAX_AGE;
+    files behind an access rule are `private`
+
+Access rules (MEDIA_ACCESS_RULES) map a name prefix to a callable(request, name) -> bool;
+users_images/ (avatars, only shown on the profile page) is limited to the owner and staff.
+Public media keep being served by nginx directly; only the protected prefixes need to reach
+Django (deploy/nginx*.conf). DedupFileSystemStorage never moves guarded names into the public
+cas/ (see app.storage), so a rule keeps holding with content-addressed media.
+"""
+from __future__ import annotations
+
+import mimetypes
+import os
+import posixpath
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, HttpResponseRedirect, StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.module_loading import import_string
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# ManifestStaticFilesStorage-style names (<name>.<12 hex>.<ext>)
+_HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{12}\.[A-Za-z0-9]+$")
+
+
+def file_etag(st: os.stat_result) -> str:
+    return f'"{int(st.st_mtime):x}-{st.st_size:x}"'
+
+
+def is_content_hashed(name: str) -> bool:
+    """Names whose bytes can never change: a new upload always gets a new name."""
+    prefix = getattr(default_storage, "dedup_prefix", None)
+    return bool((prefix and name.startswith(f"{prefix}/")) or _HASHED_NAME_RE.search(name))
+
+
+def media_cache_control(name: str, private: bool = False) -> str:
+    if private:
+        return "private, no-cache"
+    if is_content_hashed(name):
+        return IMMUTABLE_CACHE_CONTROL
+    return f"public, max-age={int(getattr(settings, 'MEDIA_MAX_AGE', 604800))}"
+
+
+def byte_range(header: str, size: int):
+    """(start, end) inclusive for a single-range header; None to send everything, False when unsatisfiable."""
+    match = _RANGE_RE.match(header.strip())
+    if not match or not (match[1] or match[2]):
+        return None
+    if not match[1]:  # suffix: the last N bytes
+        length = int(match[2])
+        return (max(0, size - length), size - 1) if length and size else False
+    start = int(match[1])
+    if match[2] and int(match[2]) < start:
+        return None  # syntactically invalid: ignored (RFC 9110 14.1.1)
+    if start >= size:
+        return False
+    return start, min(int(match[2]) if match[2] else size - 1, size - 1)
+
+
+def _accel_url(path: Path) -> str | None:
+    if not getattr(settings, "MEDIA_X_ACCEL_REDIRECT", False):
+        return None
+    for root, location in getattr(settings, "MEDIA_X_ACCEL_LOCATIONS", {}).items():
+        try:
+            relative = path.relative_to(Path(root).resolve())
+        except ValueError:
+            continue
+        return location.rstrip("/") + "/" + quote(relative.as_posix())
+    return None
+
+
+def _read_range(path: Path, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, path, *, content_type: str | None = None, cache_control: str | None = None):
+    """Response for a local file with validators, Range support and the nginx handoff (see module docs)."""
+    path = Path(path).resolve()
+    try:
+        st = path.stat()
+    except OSError:
+        raise Http404("No such file")
+    etag, last_modified = file_etag(st), int(st.st_mtime)
+    content_type = content_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+    def finish(response):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Accept-Ranges"] = "bytes"
+        if cache_control:
+            response["Cache-Control"] = cache_control
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    accel = _accel_url(path)
+    if accel is not None:
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = accel
+        return finish(response)
+
+    requested = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if requested and if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        requested = None  # the client's partial copy is stale: send it all
+    span = byte_range(requested, st.st_size) if requested else None
+    if span is False:
+        response = HttpResponse(status=416, content_type=content_type)
+        response["Content-Range"] = f"bytes */{st.st_size}"
+        return finish(response)
+    if span is None:
+        # FileResponse hands the file to wsgi.file_wrapper (sendfile under gunicorn)
+        return finish(FileResponse(open(path, "rb"), content_type=content_type))
+    start, end = span
+    response = StreamingHttpResponse(_read_range(path, start, end - start + 1), status=206, content_type=content_type)
+    response["Content-Length"] = str(end - start + 1)
+    response["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    return finish(response)
+
+
+# --- /media/ -----------------------------------------------------------------------------
+
+def owner_or_staff(request, name: str) -> bool:
+    """Access rule: staff, or a user whose own image field holds this name."""
+    user = request.user
+    if not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return True
+    from django.db.models import FileField
+
+    return any(
+        getattr(user, field.name).name == name
+        for field in user._meta.concrete_fields if isinstance(field, FileField)
+    )
+
+
+def access_rule(name: str):
+    """Callable guarding name (longest matching MEDIA_ACCESS_RULES prefix), or None for public media."""
+    rules = getattr(settings, "MEDIA_ACCESS_RULES", {})
+    for prefix in sorted(rules, key=len, reverse=True):
+        if name.startswith(prefix):
+            rule = rules[prefix]
+            return import_string(rule) if isinstance(rule, str) else rule
+    return None
+
+
+def media_name(path: str) -> str:
+    name = posixpath.normpath(path)
+    if name.startswith(("..", "/")) or any(part.startswith(".") for part in name.split("/")):
+        raise Http404("No such file")  # traversal, .quarantine/, .tmp- files
+    return name
+
+
+def media_view(request, path: str):
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+    name = media_name(path)
+    rule = access_rule(name)
+    if rule is not None and not rule(request, name):
+        raise Http404("No such file")  # not 403: don't confirm the file exists
+    try:
+        local = default_storage.path(name)
+    except NotImplementedError:
+        # bucket storages (app.storage.S3MediaStorage) serve their own URLs
+        return HttpResponseRedirect(default_storage.url(name))
+    response = serve_file(request, local, cache_control=media_cache_control(name, private=rule is not None))
+    if rule is not None:
+        response["Vary"] = "Cookie"
+    return response
@@ -0,0 +1,121 @@
+"""
+Prometheus metrics shared by all gunicorn workers.
+
+With PROMETHEUS_MULTIPROC_DIR set (see deploy/gunicorn.service) every worker
+writes its samples to mmap files in that directory and metrics_view merges
+them on scrape; without it (runserver, tests) the in-process registry is used.
+The variable must be in the environment before prometheus_client is imported:
+set it in the service file or .env (the .env loader in settings runs first).
+
+Label values are always bounded: URL names rather than paths, cache key
+families rather than keys.
+"""
+from __future__ import annotations
+
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+from common.middleware import DualMiddleware
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by URL name.", ["view", "method"],
+)
+HTTP_RESPONSES = Counter(
+    "http_responses_total", "Responses by URL name and status class.", ["view", "method", "status"],
+)
+CHECKOUT = Counter(
+    "checkout_total", "Checkout attempts by outcome.", ["result"],
+)
+NOVA_POSHTA_SECONDS = Histogram(
+    "nova_poshta_request_duration_seconds", "Nova Poshta API latency (including retries).", ["method"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32),
+)
+NOVA_POSHTA_ERRORS = Counter(
+    "nova_poshta_errors_total", "Failed Nova Poshta API calls.", ["method", "reason"],
+)
+IMAGE_ENCODE_SECONDS = Histogram(
+    "image_encode_duration_seconds", "Time to encode one image variant.", ["format"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+IMAGE_ENCODE_QUALITY = Histogram(
+    "image_encode_quality", "Quality chosen by the SSIM-targeted encoder (common.image_quality).", ["format"],
+    buckets=(20, 30, 40, 50, 60, 70, 80, 90, 100),
+)
+IMAGE_RESIZE_REQUESTS = Counter(
+    "image_resize_requests_total", "/img/ on-demand resizes by disk cache result (hit/miss/error).", ["result"],
+)
+DB_CONNECTION_ACQUIRE_SECONDS = Histogram(
+    "db_connection_acquire_seconds", "Time to open a DB connection (or wait for a pooled one).", ["alias"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "cache.get() calls by key family and result (hit/miss).", ["family", "result"],
+)
+
+_FAMILY_RE = re.compile(r"[:.]")
+
+
+def cache_key_family(key) -> str:
+    """'np:city:kyiv' -> 'np', 'categories_ordered' -> 'categories_ordered'."""
+    return _FAMILY_RE.split(str(key), 1)[0][:40] or "other"
+
+
+@contextmanager
+def time_image_encode(fmt: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        IMAGE_ENCODE_SECONDS.labels(fmt).observe(time.perf_counter() - started)
+
+
+def _client_allowed(request) -> bool:
+    from django.conf import settings
+
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and request.headers.get("Authorization", "") == f"Bearer {token}":
+        return True
+    return request.META.get("REMOTE_ADDR") in getattr(settings, "METRICS_ALLOWED_IPS", ("127.0.0.1", "::1"))
+
+
+def metrics_view(request):
+    """Text exposition format for the scraper; internal only (IP allow-list or bearer token)."""
+    from django.http import Http404, HttpResponse
+
+    if not _client_allowed(request):
+        raise Http404()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware(DualMiddleware):
+    """Observe latency and status per URL name; unresolved paths are grouped as 'unmatched'."""
+
+    def handle(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, time.perf_counter() - started)
+        return response
+
+    async def ahandle(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, time.perf_counter() - started)
+        return response
+
+    def _observe(self, request, response, elapsed):
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name or "unnamed") if match else "unmatched"
+        if view != "metrics":
+            HTTP_REQUEST_SECONDS.labels(view, request.method).observe(elapsed)
+            HTTP_RESPONSES.labels(view, request.method, f"{response.status_code // 100}xx").inc()
@@ -0,0 +1,30 @@
+"""
+Base class for the project's middleware that runs natively under both WSGI and ASGI.
+
+Django adapts a sync-only middleware on an async stack by pushing the rest of the
+chain through async_to_sync, which would put every async view back on a thread.
+Subclasses implement `handle` for the sync stack and `ahandle` for the async one.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
+class DualMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.ahandle(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        raise NotImplementedError
+
+    async def ahandle(self, request):
+        raise NotImplementedError
@@ -0,0 +1,200 @@
+"""
+Per-request performance instrumentation.
+
+PerfMiddleware samples a fraction of requests (PERF_SAMPLE_RATE) and for those
+records DB query count/time (an execute wrapper installed on every connection,
+see main.apps), cache hits/misses,
+template render time and total time. The result goes out as a `Server-Timing`
+header and as one JSON log line on the "perf" logger.
+
+Cache and template numbers need the instrumented backends from this module:
+    CACHES["default"]["BACKEND"] = "common.perf.FileBasedCache"
+    TEMPLATES[0]["BACKEND"] = "common.perf.DjangoTemplates"
+Outside a sampled request they cost one ContextVar lookup (the cache backends
+also feed the cache_requests_total metric, see common.metrics).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache.backends import filebased, locmem
+from django.template.backends import django as django_backend
+
+from common.metrics import CACHE_REQUESTS, cache_key_family
+from common.middleware import DualMiddleware
+
+logger = logging.getLogger("perf")
+
+_current: ContextVar["RequestStats | None"] = ContextVar("perf_request_stats", default=None)
+_MISSING = object()
+
+
+@dataclass
+class RequestStats:
+    db_queries: int = 0
+    db_time: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    template_time: float = 0.0
+    total_time: float = 0.0
+
+    def server_timing(self) -> str:
+        return ", ".join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'cache;desc="{self.cache_hits} hit / {self.cache_misses} miss"',
+            f"tpl;dur={self.template_time * 1000:.1f}",
+            f"total;dur={self.total_time * 1000:.1f}",
+        ))
+
+    def as_log_dict(self) -> dict:
+        return {
+            "total_ms": round(self.total_time * 1000, 1),
+            "db_ms": round(self.db_time * 1000, 1),
+            "db_queries": self.db_queries,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "tpl_ms": round(self.template_time * 1000, 1),
+        }
+
+
+def current_stats() -> RequestStats | None:
+    """Stats of the request being sampled in this context, or None."""
+    return _current.get()
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def install(connection, **kwargs):
+    """connection_created receiver. A permanent wrapper (rather than one per request) also
+    sees queries that async views run through sync_to_async on another thread."""
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+# --- instrumented cache backends ---------------------------------------------------
+
+class CacheStatsMixin:
+    """
+    Count hits/misses of get() (get_many() goes through get() in these backends):
+    always into the cache_requests_total metric, and into the sampled request's stats.
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        CACHE_REQUESTS.labels(cache_key_family(key), "miss" if value is _MISSING else "hit").inc()
+        stats = _current.get()
+        if stats is not None:
+            if value is _MISSING:
+                stats.cache_misses += 1
+            else:
+                stats.cache_hits += 1
+        return default if value is _MISSING else value
+
+
+class FileBasedCache(CacheStatsMixin, filebased.FileBasedCache):
+    pass
+
+
+class LocMemCache(CacheStatsMixin, locmem.LocMemCache):
+    pass
+
+
+# --- instrumented template backend ---------------------------------------------------
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            # includes/extends render inside this call, so only top-level templates are timed
+            stats.template_time += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return Template(template.template, self)
+
+
+# --- middleware --------------------------------------------------------------------
+
+class PerfMiddleware(DualMiddleware):
+    """
+    Sample requests and report where their time went.
+
+    Settings: PERF_SAMPLE_RATE (0..1, 0 disables), PERF_SERVER_TIMING (add the header),
+    PERF_LOG (emit the log line).
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.sample_rate = float(getattr(settings, "PERF_SAMPLE_RATE", 0.0))
+        self.server_timing = getattr(settings, "PERF_SERVER_TIMING", True)
+        self.log = getattr(settings, "PERF_LOG", True)
+
+    def _sampled(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def handle(self, request):
+        if not self._sampled():
+            return self.get_response(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats.total_time = time.perf_counter() - started
+            _current.reset(token)
+        return self._report(request, response, stats)
+
+    async def ahandle(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stats.total_time = time.perf_counter() - started
+            _current.reset(token)
+        return self._report(request, response, stats)
+
+    def _report(self, request, response, stats):
+        if self.server_timing:
+            response["Server-Timing"] = stats.server_timing()
+        if self.log:
+            match = getattr(request, "resolver_match", None)
+            line = {
+                "method": request.method,
+                "path": request.path,
+                "view": match.view_name if match else None,
+                "status": response.status_code,
+                **stats.as_log_dict(),
+            }
+            logger.info(json.dumps(line, ensure_ascii=False))
+        return response
@@ -0,0 +1,218 @@
+"""
+On-demand profiling of live requests and management commands.
+
+A staff user opens /admin/profiles/, copies the signed token and adds
+`?_profile=<token>` (or an `X-Profile: <token>` header) to any URL. That one
+request runs under pyinstrument (sampling, saved as .html) or, when
+pyinstrument is not installed, cProfile (saved as .pstats). Commands are
+profiled with `manage.py profile_command <name> [args...]`.
+
+Profiles go to PROFILER_DIR, which keeps only the newest PROFILER_MAX_FILES.
+Under ASGI all async requests share the event loop's thread, which can run one
+profiler at a time: a profiled request that overlaps another one is served
+unprofiled (and the running profile includes whatever else ran on the loop).
+"""
+from __future__ import annotations
+
+import cProfile
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+
+from common.middleware import DualMiddleware
+
+try:
+    from pyinstrument import Profiler as _SamplingProfiler
+except ImportError:  # optional dependency
+    _SamplingProfiler = None
+
+TOKEN_PARAM = "_profile"
+TOKEN_HEADER = "X-Profile"
+_SALT = "common.profiling"
+_NAME_RE = re.compile(r"^[\w.-]+\.(html|pstats)$")
+_LABEL_RE = re.compile(r"[^\w-]+")
+
+
+def profiles_dir() -> Path:
+    return Path(getattr(settings, "PROFILER_DIR", settings.BASE_DIR / "profiles"))
+
+
+# --- tokens --------------------------------------------------------------------------
+
+def make_token(user) -> str:
+    return signing.TimestampSigner(salt=_SALT).sign(str(user.pk))
+
+
+def check_token(token: str, user) -> bool:
+    """Valid, unexpired and issued to this (still staff) user."""
+    if not token or not getattr(user, "is_staff", False):
+        return False
+    try:
+        pk = signing.TimestampSigner(salt=_SALT).unsign(token, max_age=getattr(settings, "PROFILER_TOKEN_MAX_AGE", 3600))
+    except signing.BadSignature:
+        return False
+    return pk == str(user.pk)
+
+
+# --- profiles on disk ----------------------------------------------------------------
+
+@dataclass
+class ProfileFile:
+    name: str
+    size: int
+    created: datetime
+
+
+def list_profiles() -> list[ProfileFile]:
+    """Newest first."""
+    root = profiles_dir()
+    if not root.is_dir():
+        return []
+    items = []
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_file() and _NAME_RE.match(entry.name):
+                st = entry.stat()
+                items.append(ProfileFile(entry.name, st.st_size, datetime.fromtimestamp(st.st_mtime)))
+    items.sort(key=lambda p: p.created, reverse=True)
+    return items
+
+
+def _prune() -> None:
+    keep = max(1, int(getattr(settings, "PROFILER_MAX_FILES", 50)))
+    for old in list_profiles()[keep:]:
+        try:
+            os.remove(profiles_dir() / old.name)
+        except OSError:
+            pass
+
+
+class ProfilerBusy(RuntimeError):
+    """This thread is already being profiled (cProfile/pyinstrument allow one profiler per thread)."""
+
+
+# Python < 3.12 lets a second cProfile silently take over the thread instead of raising
+_active = threading.local()
+
+
+class profile:
+    """
+    Context manager: profile the block and save it to the ring buffer.
+    `.label` may be changed inside the block; after exit `.name` holds the saved file name.
+    """
+
+    def __init__(self, kind: str, label: str):
+        self.kind = kind
+        self.label = label
+        self.name = None
+
+    def __enter__(self):
+        if getattr(_active, "profiling", False):
+            raise ProfilerBusy("this thread is already being profiled")
+        self.started = time.perf_counter()
+        try:
+            if _SamplingProfiler is not None:
+                self._profiler = _SamplingProfiler(interval=0.001, async_mode="disabled")
+                self._profiler.start()
+            else:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+        except (RuntimeError, ValueError) as exc:  # "Another profiling tool is already active"
+            raise ProfilerBusy(str(exc)) from exc
+        _active.profiling = True
+        return self
+
+    def __exit__(self, *exc):
+        _active.profiling = False
+        elapsed_ms = int((time.perf_counter() - self.started) * 1000)
+        root = profiles_dir()
+        root.mkdir(parents=True, exist_ok=True)
+        label = _LABEL_RE.sub("_", self.label or "").strip("_")[:60] or "unknown"
+        stem = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{self.kind}-{label}-{elapsed_ms}ms"
+        if _SamplingProfiler is not None:
+            self._profiler.stop()
+            self.name = f"{stem}.html"
+            (root / self.name).write_text(self._profiler.output_html(), encoding="utf-8")
+        else:
+            self._profiler.disable()
+            self.name = f"{stem}.pstats"
+            self._profiler.dump_stats(str(root / self.name))
+        _prune()
+        return False
+
+
+# --- request hook ----------------------------------------------------------------------
+
+class ProfilerMiddleware(DualMiddleware):
+    """Must come after AuthenticationMiddleware: the token is only honoured for its staff owner."""
+
+    @staticmethod
+    def _token(request):
+        return request.GET.get(TOKEN_PARAM) or request.headers.get(TOKEN_HEADER)
+
+    def handle(self, request):
+        token = self._token(request)
+        if not token or not check_token(token, request.user):
+            return self.get_response(request)
+        with profile("view", request.path) as prof:
+            response = self.get_response(request)
+            self._label(request, prof)
+        response["X-Profile-Id"] = prof.name
+        return response
+
+    async def ahandle(self, request):
+        token = self._token(request)
+        # request.user loads lazily from the DB: only touch it (on a thread) when a token is present
+        if not token or not await sync_to_async(check_token)(token, request.user):
+            return await self.get_response(request)
+        prof = profile("view", request.path)
+        try:
+            prof.__enter__()
+        except ProfilerBusy:
+            # another profiled request is running on this event loop's thread
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+            self._label(request, prof)
+        finally:
+            prof.__exit__(None, None, None)
+        response["X-Profile-Id"] = prof.name
+        return response
+
+    @staticmethod
+    def _label(request, prof):
+        match = getattr(request, "resolver_match", None)
+        if match and match.view_name:
+            prof.label = match.view_name
+
+
+# --- admin pages (wrapped with admin.site.admin_view in app/urls.py) -----------------------
+
+def profiles_view(request):
+    from django.contrib import admin
+
+    return render(request, "admin/profiles.html", {
+        **admin.site.each_context(request),
+        "title": "Профили",
+        "profiles": list_profiles(),
+        "token": make_token(request.user),
+        "token_param": TOKEN_PARAM,
+        "token_hours": getattr(settings, "PROFILER_TOKEN_MAX_AGE", 3600) // 3600,
+        "profiler": "pyinstrument" if _SamplingProfiler is not None else "cProfile",
+    })
+
+
+def profile_download(request, name):
+    if not _NAME_RE.match(name) or not (profiles_dir() / name).is_file():
+        raise Http404()
+    return FileResponse(open(profiles_dir() / name, "rb"), as_attachment=True, filename=name)
@@ -0,0 +1,220 @@
+"""
+Minimal S3-compatible object storage client (AWS S3, MinIO, Cloudflare R2, Backblaze B2...).
+
+Path-style requests (<endpoint>/<bucket>/<key>) signed with AWS Signature V4 over one
+pooled httpx.Client per process (keep-alive connections, connect retries). Only what the
+media storage needs: put/get/head/delete, paginated ListObjectsV2 and multipart uploads
+for large files, which are streamed part by part so memory stays at one part.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+
+import httpx
+
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 minimum for every part but the last
+_NS = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+
+
+class S3Error(OSError):
+    def __init__(self, status: int, code: str, message: str = ""):
+        super().__init__(f"S3 {status} {code}: {message}".rstrip(": "))
+        self.status = status
+        self.code = code
+
+
+@dataclass(frozen=True)
+class S3Object:
+    key: str
+    size: int
+    last_modified: datetime | None = None
+
+
+def _uri_encode(value: str, safe: str = "-_.~") -> str:
+    return quote(value, safe=safe)
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def _find(element, tag):
+    found = element.find(f"{_NS}{tag}")
+    return found if found is not None else element.find(tag)
+
+
+def _findall(element, tag):
+    return element.findall(f"{_NS}{tag}") or element.findall(tag)
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return parsedate_to_datetime(value)
+
+
+class S3Client:
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str, region: str = "us-east-1",
+                 pool_size: int = 10, timeout: float = 30, transport: httpx.BaseTransport | None = None):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.host = httpx.URL(self.endpoint).netloc.decode("ascii")
+        self._http = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=transport or httpx.HTTPTransport(retries=2),
+        )
+
+    def close(self) -> None:
+        self._http.close()
+
+    # --- signing ----------------------------------------------------------------------------
+
+    def _sign(self, method: str, path: str, query: str, headers: dict, payload_hash: str) -> dict:
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{now:%Y%m%d}/{self.region}/s3/aws4_request"
+        headers = {k.lower(): str(v).strip() for k, v in headers.items()}
+        headers.update({"host": self.host, "x-amz-date": amz_date, "x-amz-content-sha256": payload_hash})
+        signed = ";".join(sorted(headers))
+        canonical = "\n".join([
+            method, path, query,
+            "".join(f"{k}:{headers[k]}\n" for k in sorted(headers)),
+            signed, payload_hash,
+        ])
+        to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode("utf-8")).hexdigest(),
+        ])
+        key = _hmac(("AWS4" + self.secret_key).encode("utf-8"), f"{now:%Y%m%d}")
+        for part in (self.region, "s3", "aws4_request"):
+            key = _hmac(key, part)
+        signature = hmac.new(key, to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, SignedHeaders={signed}, Signature={signature}"
+        )
+        del headers["host"]  # httpx sets it
+        return headers
+
+    def request(self, method: str, key: str = "", params: dict | None = None, body: bytes = b"",
+                headers: dict | None = None, stream: bool = False, ok=(200,)) -> httpx.Response:
+        path = "/" + _uri_encode(self.bucket) + ("/" + _uri_encode(key, safe="-_.~/") if key else "")
+        # the canonical query string is sent as is, so what was signed is exactly what the server sees
+        query = "&".join(f"{_uri_encode(str(k))}={_uri_encode(str(v))}" for k, v in sorted((params or {}).items()))
+        signed = self._sign(method, path, query, headers or {}, hashlib.sha256(body).hexdigest() if body else EMPTY_SHA256)
+        url = self.endpoint + path + (f"?{query}" if query else "")
+        request = self._http.build_request(method, url, content=body or None, headers=signed)
+        response = self._http.send(request, stream=stream)
+        if response.status_code not in ok:
+            if stream:
+                response.read()
+                response.close()
+            code, message = str(response.status_code), ""
+            if response.content:
+                try:
+                    root = ET.fromstring(response.content)
+                    code = getattr(_find(root, "Code"), "text", code)
+                    message = getattr(_find(root, "Message"), "text", "") or ""
+                except ET.ParseError:
+                    pass
+            if response.status_code == 404:
+                raise FileNotFoundError(f"{key}: {code}")
+            raise S3Error(response.status_code, code, message)
+        return response
+
+    # --- objects ----------------------------------------------------------------------------
+
+    def put_object(self, key: str, data: bytes, headers: dict | None = None) -> None:
+        self.request("PUT", key, body=data, headers=headers)
+
+    def get_object(self, key: str) -> httpx.Response:
+        """Streaming response; iterate response.iter_bytes() and close it."""
+        return self.request("GET", key, stream=True)
+
+    def head_object(self, key: str) -> dict | None:
+        try:
+            return dict(self.request("HEAD", key).headers)
+        except FileNotFoundError:
+            return None
+
+    def delete_object(self, key: str) -> None:
+        self.request("DELETE", key, ok=(200, 204))
+
+    def list_objects(self, prefix: str = "", delimiter: str | None = None):
+        """(objects, common prefixes) under prefix, following continuation tokens."""
+        objects, prefixes, token = [], [], None
+        while True:
+            params = {"list-type": "2", "prefix": prefix}
+            if delimiter:
+                params["delimiter"] = delimiter
+            if token:
+                params["continuation-token"] = token
+            root = ET.fromstring(self.request("GET", params=params).content)
+            for item in _findall(root, "Contents"):
+                objects.append(S3Object(
+                    _find(item, "Key").text, int(_find(item, "Size").text),
+                    _parse_time(getattr(_find(item, "LastModified"), "text", None)),
+                ))
+            prefixes += [_find(p, "Prefix").text for p in _findall(root, "CommonPrefixes")]
+            truncated = getattr(_find(root, "IsTruncated"), "text", "false") == "true"
+            token = getattr(_find(root, "NextContinuationToken"), "text", None)
+            if not truncated or not token:
+                return objects, prefixes
+
+    # --- multipart --------------------------------------------------------------------------
+
+    def upload(self, key: str, chunks, headers: dict | None = None, part_size: int = 8 * 1024 * 1024) -> None:
+        """
+        Upload from an iterable of byte chunks: a single PUT when everything fits in one
+        part, otherwise a multipart upload (aborted on failure so no parts are left billed).
+        """
+        part_size = max(part_size, MIN_PART_SIZE)
+        buffer = bytearray()
+        chunks = iter(chunks)
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) > part_size:
+                break
+        else:
+            self.put_object(key, bytes(buffer), headers)
+            return
+
+        root = ET.fromstring(self.request("POST", key, params={"uploads": ""}, headers=headers).content)
+        upload_id = _find(root, "UploadId").text
+        etags = []
+        try:
+            while True:
+                while len(buffer) >= part_size or (buffer and chunks is None):
+                    part, buffer = bytes(buffer[:part_size]), buffer[part_size:]
+                    response = self.request("PUT", key, params={"partNumber": len(etags) + 1, "uploadId": upload_id}, body=part)
+                    etags.append(response.headers["etag"])
+                if chunks is None:
+                    break
+                chunk = next(chunks, None)
+                if chunk is None:
+                    chunks = None
+                else:
+                    buffer += chunk
+            body = "".join(
+                f"<Part><PartNumber>{n}</PartNumber><ETag>{etag}</ETag></Part>" for n, etag in enumerate(etags, 1)
+            )
+            self.request("POST", key, params={"uploadId": upload_id},
+                         body=f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode("utf-8"))
+        except BaseException:
+            try:
+                self.request("DELETE", key, params={"uploadId": upload_id}, ok=(200, 204))
+            except (OSError, httpx.HTTPError):
+                pass
+            raise
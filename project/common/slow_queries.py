@@ -0,0 +1,155 @@
+"""
+Slow-query log.
+
+An execute wrapper (installed on every new DB connection, see main.apps) times
+each query. Queries slower than SLOW_QUERY_THRESHOLD_MS are logged on the
+"slow_query" logger at once and buffered. The buffer is flushed into
+main.SlowQuery after the response (SlowQueryMiddleware) or at process exit
+(management commands), i.e. outside the transaction that ran the query. The
+table is aggregated per (fingerprint, source), where source is the view name
+or "command:<name>". A SELECT gets `EXPLAIN (FORMAT JSON)` (no ANALYZE) once
+per fingerprint.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from common.middleware import DualMiddleware
+from common.sql import normalize_sql, sql_fingerprint
+
+logger = logging.getLogger("slow_query")
+
+_source: ContextVar[str | None] = ContextVar("slow_query_source", default=None)
+_suppressed: ContextVar[bool] = ContextVar("slow_query_suppressed", default=False)
+
+_MAX_BUFFERED = 500
+_buffer: list[dict] = []
+_lock = threading.Lock()
+_explained: set[str] = set()
+
+
+def _threshold() -> float | None:
+    ms = getattr(settings, "SLOW_QUERY_THRESHOLD_MS", None)
+    return None if ms is None or ms < 0 else ms / 1000
+
+
+def _current_source() -> str:
+    source = _source.get()
+    if source:
+        return source
+    if len(sys.argv) > 1 and sys.argv[0].endswith("manage.py"):
+        return f"command:{sys.argv[1]}"
+    return "unknown"
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    threshold = _threshold()
+    if threshold is None or _suppressed.get():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        if elapsed >= threshold:
+            source = _current_source()
+            logger.warning("%.1fms [%s] %s", elapsed * 1000, source, normalize_sql(sql))
+            with _lock:
+                if len(_buffer) < _MAX_BUFFERED:
+                    _buffer.append({
+                        "sql": sql, "params": None if many else params, "elapsed": elapsed, "source": source,
+                        "alias": context["connection"].alias,
+                    })
+
+
+def install(connection, **kwargs):
+    """connection_created receiver: keep exactly one wrapper on the connection."""
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_wrapper)
+
+
+def _explain(entry) -> dict | list | None:
+    if entry["sql"].lstrip()[:6].upper() != "SELECT":
+        return None
+    conn = connections[entry["alias"]]
+    if conn.vendor != "postgresql":
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + entry["sql"], entry["params"])
+            return cursor.fetchone()[0]
+    except Exception as exc:
+        logger.info("EXPLAIN failed: %s", exc)
+        return None
+
+
+def flush() -> int:
+    """Write buffered slow queries to main.SlowQuery; returns how many were written."""
+    with _lock:
+        entries = _buffer[:]
+        _buffer.clear()
+    if not entries:
+        return 0
+
+    from main.models import SlowQuery
+
+    token = _suppressed.set(True)
+    try:
+        for entry in entries:
+            fingerprint = sql_fingerprint(entry["sql"])
+            plan = None
+            if fingerprint not in _explained:
+                _explained.add(fingerprint)
+                if not SlowQuery.objects.filter(fingerprint=fingerprint, explain__isnull=False).exists():
+                    plan = _explain(entry)
+            SlowQuery.record(fingerprint, entry["source"], normalize_sql(entry["sql"]), entry["elapsed"], plan)
+    except Exception:
+        logger.exception("Failed to store slow queries")
+    finally:
+        _suppressed.reset(token)
+    return len(entries)
+
+
+@atexit.register
+def _flush_at_exit():
+    # management commands have no "request finished" hook; the test runner has dropped its DB by now
+    if sys.argv[1:2] != ["test"]:
+        flush()
+
+
+class SlowQueryMiddleware(DualMiddleware):
+    """Attribute slow queries to the URL name and store them once the response is ready."""
+
+    def handle(self, request):
+        token = _source.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _source.reset(token)
+        if _buffer:
+            flush()
+        return response
+
+    async def ahandle(self, request):
+        token = _source.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _source.reset(token)
+        if _buffer:
+            await sync_to_async(flush)()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # on the async stack this runs via sync_to_async, which copies the value back
+        match = request.resolver_match
+        _source.set((match.view_name if match else None) or request.path)
@@ -0,0 +1,24 @@
+import hashlib
+import re
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Collapse a SQL statement to its "shape": literals become ?, IN-lists become (...)
+    and whitespace is squashed. Two queries that differ only by parameters
+    (the classic N+1 pattern) normalize to the same string.
+    """
+    sql = _STRING_RE.sub("?", sql or "")
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+def sql_fingerprint(sql: str) -> str:
+    """Short stable hash of normalize_sql(sql), suitable as a dict/DB key."""
+    return hashlib.sha1(normalize_sql(sql).encode("utf-8")).hexdigest()[:16]
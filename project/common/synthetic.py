@@ -0,0 +1,170 @@
+"""
+Deterministic synthetic catalog generator for scale testing.
+
+Used by `manage.py generate_synthetic_catalog` (large volumes, batched
+bulk_create, optional placeholder files) and by common.testing.seed_catalog
+(small catalogs for the query-budget tests).
+"""
+from __future__ import annotations
+
+import random
+from decimal import Decimal
+from io import BytesIO
+from typing import Callable
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+_WORDS = (
+    "гриб", "міцелій", "спори", "відбиток", "кубенсіс", "панеолус", "шапка", "ніжка",
+    "золотий", "вчитель", "альбінос", "тайська", "амазонка", "мексика", "колекція", "набір",
+    "mushroom", "spore", "print", "cubensis", "golden", "teacher", "albino", "strain",
+)
+_SPECIES = ("cubensis", "panaeolus")
+
+
+def _chunks(seq, size):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+class SyntheticCatalog:
+    """
+    Bulk-insert categories, products, gallery images, users, carts and orders.
+
+    Everything derives from `seed`, so two runs with the same arguments produce
+    the same rows. Names and slugs carry `prefix` so a previous run can be
+    purged with `purge()`.
+    """
+
+    def __init__(self, *, seed: int = 42, prefix: str = "syn", batch_size: int = 1000,
+                 write_files: bool = False, storage=None, log: Callable[[str], None] | None = None):
+        self.rnd = random.Random(seed)
+        self.prefix = prefix
+        self.batch_size = max(1, int(batch_size))
+        self.write_files = write_files
+        self.storage = storage or default_storage
+        self.log = log or (lambda msg: None)
+
+    # --- helpers -----------------------------------------------------------------
+
+    def _placeholder(self, name: str, size=(64, 48)) -> str:
+        """Save a tiny solid-colour JPEG under `name` and return the stored name."""
+        if not self.write_files:
+            return name
+        from PIL import Image
+
+        color = tuple(self.rnd.randint(30, 225) for _ in range(3))
+        buf = BytesIO()
+        Image.new("RGB", size, color).save(buf, format="JPEG", quality=70)
+        if self.storage.exists(name):
+            self.storage.delete(name)
+        return self.storage.save(name, ContentFile(buf.getvalue()))
+
+    def _text(self, words: int) -> str:
+        return " ".join(self.rnd.choice(_WORDS) for _ in range(words))
+
+    def _bulk(self, model, objs: list) -> list:
+        created = []
+        for chunk in _chunks(objs, self.batch_size):
+            with transaction.atomic():
+                created.extend(model.objects.bulk_create(chunk, batch_size=self.batch_size))
+        return created
+
+    # --- generation --------------------------------------------------------------
+
+    def purge(self) -> None:
+        """Delete rows created by a previous run with the same prefix (files are left alone)."""
+        from goods.models import Categories
+        from orders.models import Order
+        from users.models import User
+
+        # products, gallery images, carts and order items cascade from categories/products
+        Order.objects.filter(user__username__startswith=f"{self.prefix}-").delete()
+        Categories.objects.filter(slug__startswith=f"{self.prefix}-").delete()
+        User.objects.filter(username__startswith=f"{self.prefix}-").delete()
+
+    def generate(self, *, categories: int = 10, products: int = 1000, images_per_product: int = 2,
+                 users: int = 100, carts_per_user: int = 3, anonymous_carts: int = 0,
+                 orders: int = 200, items_per_order: int = 3) -> dict:
+        from carts.models import Cart
+        from goods.models import Categories, Products, ProductImage
+        from orders.models import Order, OrderItem
+        from users.models import User
+
+        p = self.prefix
+        rnd = self.rnd
+
+        cats = self._bulk(Categories, [
+            Categories(
+                name=f"{p} Категорія {i}", slug=f"{p}-category-{i}", sort_order=1000 + i,
+                short_description=self._text(6), description=f"<p>{self._text(40)}</p>",
+                image=self._placeholder(f"categories_images/{p}/category-{i}.png", (128, 128)),
+            )
+            for i in range(categories)
+        ])
+        self.log(f"categories: {len(cats)}")
+
+        prods = []
+        for start in range(0, products, self.batch_size):
+            batch = []
+            for i in range(start, min(start + self.batch_size, products)):
+                cat = cats[i % len(cats)]
+                batch.append(Products(
+                    name=f"{p} Товар {i} {self._text(2)}", slug=f"{p}-product-{i}", category=cat,
+                    short_description=self._text(8), description=f"<p>{self._text(rnd.randint(30, 120))}</p>",
+                    # every fifth product has no main image and falls back to its gallery
+                    image=self._placeholder(f"products/{p}/product-{i}.jpg") if i % 5 else "",
+                    price=Decimal(rnd.randint(50, 2000)), discount=Decimal(rnd.choice((0, 0, 0, 5, 10, 15))),
+                    quantity=rnd.randint(1, 50) if i % 7 else 0, is_bestseller=(i % 25 == 0),
+                    species=rnd.choice(_SPECIES) if i % len(cats) == 0 else "",
+                ))
+            prods.extend(self._bulk(Products, batch))
+        self.log(f"products: {len(prods)}")
+
+        gallery = 0
+        for chunk in _chunks(prods, self.batch_size):
+            gallery += len(self._bulk(ProductImage, [
+                ProductImage(product=prod, alt_text=f"{prod.name} #{j}",
+                             image=self._placeholder(f"products/{p}/gallery-{prod.pk}-{j}.jpg"))
+                for prod in chunk for j in range(images_per_product)
+            ]))
+        self.log(f"gallery images: {gallery}")
+
+        # one hash for everybody: hashing per user would dominate the run time
+        password = make_password(f"{p}-password")
+        user_objs = self._bulk(User, [
+            User(username=f"{p}-user{i}", email=f"{p}-user{i}@example.com", password=password,
+                 first_name=f"Ім'я{i}", last_name=f"Прізвище{i}")
+            for i in range(users)
+        ])
+        self.log(f"users: {len(user_objs)}")
+
+        in_stock = [prod for prod in prods if prod.quantity > 0]
+        per_user = min(carts_per_user, len(in_stock))
+        cart_objs = [Cart(user=u, product=prod, quantity=rnd.randint(1, min(3, prod.quantity)))
+                     for u in user_objs for prod in rnd.sample(in_stock, per_user)]
+        cart_objs += [Cart(session_key=f"{p}{i:0>{40 - len(p)}}"[:40], product=rnd.choice(in_stock), quantity=1)
+                      for i in range(anonymous_carts if in_stock else 0)]
+        carts = self._bulk(Cart, cart_objs)
+        self.log(f"carts: {len(carts)}")
+
+        order_objs = self._bulk(Order, [
+            Order(user=user_objs[i % len(user_objs)] if user_objs else None,
+                  first_name="Тест", last_name="Тестовий", phone_number="+380000000000",
+                  email="buyer@example.com", requires_delivery="Нова Пошта",
+                  delivery_address=f"Київ, відділення {rnd.randint(1, 300)}", is_paid=rnd.random() < 0.6)
+            for i in range(orders)
+        ])
+        per_order = min(items_per_order, len(prods))
+        items = 0
+        for chunk in _chunks(order_objs, self.batch_size):
+            items += len(self._bulk(OrderItem, [
+                OrderItem(order=o, product=prod, name=prod.name, price=prod.price, quantity=rnd.randint(1, 3))
+                for o in chunk for prod in rnd.sample(prods, per_order)
+            ]))
+        self.log(f"orders: {len(order_objs)} ({items} items)")
+
+        return {"categories": cats, "products": prods, "users": user_objs, "carts": carts, "orders": order_objs}
@@ -0,0 +1,194 @@
+"""
+Shared helpers for the per-app tests: a synthetic catalog seeder, a
+query/wall-time budget assertion that explains itself when it fails and an
+in-memory S3-compatible endpoint for the media storage.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from urllib.parse import unquote
+from xml.etree import ElementTree as ET
+
+import httpx
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+from common.sql import normalize_sql
+from common.synthetic import SyntheticCatalog
+
+# Multiply wall-time budgets on slow machines, e.g. PERF_BUDGET_SCALE=3 on shared CI runners
+PERF_BUDGET_SCALE = float(os.environ.get("PERF_BUDGET_SCALE", "1") or 1)
+
+# Per-test in-memory cache so budgets don't depend on the file cache left by the dev server
+LOCMEM_CACHES = {"default": {"BACKEND": "common.perf.LocMemCache"}}
+
+
+def seed_catalog(categories: int = 6, products: int = 300, images_per_product: int = 2,
+                 users: int = 5, carts_per_user: int = 3, orders: int = 40, seed: int = 42) -> dict:
+    """
+    Bulk-insert a deterministic synthetic catalog for query-budget tests.
+    Image fields get file names only: template tags fall back gracefully when variants are missing.
+    """
+    return SyntheticCatalog(seed=seed, write_files=False).generate(
+        categories=categories, products=products, images_per_product=images_per_product,
+        users=users, carts_per_user=carts_per_user, orders=orders,
+    )
+
+
+def format_queries(queries) -> str:
+    """Readable report: repeated query shapes first (likely N+1), then the full numbered list."""
+    shapes = Counter(normalize_sql(q["sql"]) for q in queries)
+    lines = ["Repeated query shapes:"]
+    repeated = [(n, shape) for shape, n in shapes.most_common() if n > 1]
+    lines += [f"  x{n:<3} {shape}" for n, shape in repeated] or ["  (none)"]
+    lines.append("All queries:")
+    lines += [f"  {i:>3}. [{q.get('time', '?')}s] {q['sql']}" for i, q in enumerate(queries, 1)]
+    return "\n".join(lines)
+
+
+class QueryBudgetMixin:
+    """TestCase mixin: assert an upper bound on queries and wall time for a block."""
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries: int, max_seconds: float | None = 1.0, using: str = DEFAULT_DB_ALIAS):
+        ctx = CaptureQueriesContext(connections[using])
+        started = time.perf_counter()
+        with ctx:
+            yield ctx
+        elapsed = time.perf_counter() - started
+
+        executed = len(ctx.captured_queries)
+        if executed > max_queries:
+            self.fail(
+                f"{executed} queries executed, budget is {max_queries} (+{executed - max_queries}).\n"
+                + format_queries(ctx.captured_queries)
+            )
+        if max_seconds is not None and elapsed > max_seconds * PERF_BUDGET_SCALE:
+            self.fail(
+                f"Took {elapsed:.3f}s, budget is {max_seconds * PERF_BUDGET_SCALE:.3f}s "
+                f"({executed} queries).\n" + format_queries(ctx.captured_queries)
+            )
+
+
+_S3_XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class FakeS3:
+    """
+    In-memory S3-compatible endpoint (a MinIO stand-in) served through httpx.MockTransport:
+    object PUT/GET/HEAD/DELETE, ListObjectsV2 with prefix, delimiter and pagination, and
+    multipart uploads. Requests must be SigV4-signed with a matching x-amz-content-sha256.
+    `requests` counts (method, operation) pairs so tests can assert batching.
+
+        s3 = FakeS3()
+        storage = S3MediaStorage(endpoint="http://s3.test", bucket="media", ..., transport=s3.transport)
+    """
+
+    def __init__(self, bucket: str = "media", page_size: int = 1000):
+        self.bucket = bucket
+        self.page_size = page_size
+        self.objects: dict[str, tuple[bytes, dict, datetime]] = {}
+        self.uploads: dict[str, tuple[dict, dict[int, bytes]]] = {}  # id -> (object headers, parts)
+        self.requests: Counter = Counter()
+        self.transport = httpx.MockTransport(self)
+
+    @staticmethod
+    def _error(status: int, code: str) -> httpx.Response:
+        return httpx.Response(status, content=f"<Error><Code>{code}</Code><Message>{code}</Message></Error>".encode())
+
+    @staticmethod
+    def _xml(root: str, body: str) -> httpx.Response:
+        return httpx.Response(200, content=f'<{root} xmlns="{_S3_XMLNS}">{body}</{root}>'.encode(),
+                              headers={"content-type": "application/xml"})
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        if not request.headers.get("authorization", "").startswith("AWS4-HMAC-SHA256 Credential="):
+            return self._error(403, "AccessDenied")
+        if request.headers.get("x-amz-content-sha256") != hashlib.sha256(body).hexdigest():
+            return self._error(400, "XAmzContentSHA256Mismatch")
+        bucket, _, key = unquote(request.url.raw_path.split(b"?")[0].decode()).lstrip("/").partition("/")
+        if bucket != self.bucket:
+            return self._error(404, "NoSuchBucket")
+        params = request.url.params
+        method = request.method
+
+        if not key:
+            self.requests[(method, "list")] += 1
+            return self._list(params)
+        if "uploads" in params or "uploadId" in params:
+            self.requests[(method, "multipart")] += 1
+            return self._multipart(method, key, params, body, request.headers)
+        self.requests[(method, "object")] += 1
+        if method == "PUT":
+            self._store(key, body, self._object_headers(request.headers))
+            return httpx.Response(200, headers={"etag": f'"{hashlib.md5(body).hexdigest()}"'})
+        if method == "DELETE":
+            self.objects.pop(key, None)
+            return httpx.Response(204)
+        if key not in self.objects:
+            return self._error(404, "NoSuchKey") if method == "GET" else httpx.Response(404)
+        data, headers, modified = self.objects[key]
+        headers = {**headers, "content-length": str(len(data)), "last-modified": format_datetime(modified, usegmt=True),
+                   "etag": f'"{hashlib.md5(data).hexdigest()}"'}
+        return httpx.Response(200, content=data if method == "GET" else b"", headers=headers)
+
+    @staticmethod
+    def _object_headers(headers) -> dict:
+        return {k: headers[k] for k in ("content-type", "cache-control") if k in headers}
+
+    def _store(self, key: str, data: bytes, headers: dict) -> None:
+        self.objects[key] = (data, headers, datetime.now(timezone.utc).replace(microsecond=0))
+
+    def _list(self, params) -> httpx.Response:
+        prefix, delimiter = params.get("prefix", ""), params.get("delimiter")
+        entries = []  # (sort key, is prefix)
+        for key in sorted(k for k in self.objects if k.startswith(prefix)):
+            rest = key[len(prefix):]
+            if delimiter and delimiter in rest:
+                common = prefix + rest.split(delimiter, 1)[0] + delimiter
+                if not entries or entries[-1] != (common, True):
+                    entries.append((common, True))
+            else:
+                entries.append((key, False))
+        start = int(params.get("continuation-token", "0"))
+        page = entries[start:start + self.page_size]
+        truncated = start + self.page_size < len(entries)
+        body = "".join(
+            f"<CommonPrefixes><Prefix>{name}</Prefix></CommonPrefixes>" if is_prefix else
+            f"<Contents><Key>{name}</Key><Size>{len(self.objects[name][0])}</Size>"
+            f"<LastModified>{self.objects[name][2].isoformat().replace('+00:00', '.000Z')}</LastModified></Contents>"
+            for name, is_prefix in page
+        )
+        body += f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>"
+        if truncated:
+            body += f"<NextContinuationToken>{start + self.page_size}</NextContinuationToken>"
+        return self._xml("ListBucketResult", body)
+
+    def _multipart(self, method: str, key: str, params, body: bytes, headers) -> httpx.Response:
+        if method == "POST" and "uploads" in params:
+            upload_id = os.urandom(8).hex()
+            self.uploads[upload_id] = (self._object_headers(headers), {})
+            return self._xml("InitiateMultipartUploadResult", f"<Key>{key}</Key><UploadId>{upload_id}</UploadId>")
+        if params.get("uploadId") not in self.uploads:
+            return self._error(404, "NoSuchUpload")
+        object_headers, parts = self.uploads[params["uploadId"]]
+        if method == "PUT":
+            parts[int(params["partNumber"])] = body
+            return httpx.Response(200, headers={"etag": f'"{hashlib.md5(body).hexdigest()}"'})
+        if method == "DELETE":
+            del self.uploads[params["uploadId"]]
+            return httpx.Response(204)
+        numbers = [int(n.text) for n in ET.fromstring(body).iter("PartNumber")]
+        if numbers != sorted(parts) or any(len(parts[n]) < 5 * 1024 * 1024 for n in numbers[:-1]):
+            return self._error(400, "InvalidPart")
+        self._store(key, b"".join(parts[n] for n in numbers), object_headers)
+        del self.uploads[params["uploadId"]]
+        return self._xml("CompleteMultipartUploadResult", f"<Key>{key}</Key>")
@@ -0,0 +1,21 @@
+# Gunicorn hooks, loaded via --config from deploy/gunicorn.service (and gunicorn-asgi.service).
+# Worker/bind options stay on the ExecStart line.
+import os
+
+
+def on_starting(server):
+    # Stale per-worker metric files from a previous run would be summed into the new one
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith(".db"):
+                os.remove(os.path.join(path, name))
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's live gauges from /metrics (counters/histograms are kept)
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,10 +1,17 @@
 from django.contrib import admin
+from django.db import models
+
+from common.image_utils import validate_image_upload
 from .models import Categories, Products, ProductImage
 
+# header-only size check (settings.IMAGE_MAX_PIXELS) before an upload is stored
+IMAGE_FIELD_OVERRIDES = {models.ImageField: {"validators": [validate_image_upload]}}
+
 
 
 @admin.register(Categories)
 class CategoriesAdmin(admin.ModelAdmin):
+    formfield_overrides = IMAGE_FIELD_OVERRIDES
     prepopulated_fields = {"slug": ("name",)}
     list_display = ["name", "sort_order"]
     list_editable = ["sort_order"]
@@ -23,11 +30,13 @@ class CategoriesAdmin(admin.ModelAdmin):
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
     extra = 1
+    formfield_overrides = IMAGE_FIELD_OVERRIDES
 
 
 @admin.register(Products)
 class ProductsAdmin(admin.ModelAdmin):
     inlines = [ProductImageInline]
+    formfield_overrides = IMAGE_FIELD_OVERRIDES
     prepopulated_fields = {"slug": ("name",)}
     list_display = ["name", "species", "quantity", "price", "discount", "gift_enabled"]
     list_editable = ["discount", "gift_enabled", "species"]
@@ -51,4 +60,5 @@ class ProductsAdmin(admin.ModelAdmin):
 
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
+    formfield_overrides = IMAGE_FIELD_OVERRIDES
     list_display = ("product", "alt_text")
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import csv
+import os
+import random
+import re
+import statistics
+import time
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+
+import PIL
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.html import escape
+from PIL import Image
+
+from common.image_utils import AVIF_AVAILABLE
+
+try:
+    from common.image_quality import ssim
+except ImportError:  # NumPy not installed: no quality column
+    ssim = None
+
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# generated variants (<name>_230x160.webp, _128.png, test outputs) are not sources
+VARIANT_RE = re.compile(r"_(\d+x\d+|\d+|test_\w+)$")
+FIELDS = [
+    "image", "width", "height", "format", "quality", "speed", "threads",
+    "bytes", "bpp", "encode_ms", "decode_ms", "ssim",
+]
+
+
+def _int_list(value: str) -> list[int]:
+    try:
+        return [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise CommandError(f"Expected comma-separated integers, got {value!r}")
+
+
+def find_sources(roots) -> list[Path]:
+    found = []
+    for root in roots:
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                stem, ext = os.path.splitext(filename)
+                if ext.lower() in SOURCE_EXTENSIONS and not VARIANT_RE.search(stem):
+                    found.append(Path(dirpath) / filename)
+    return sorted(found)
+
+
+def encoder_matrix(formats, qualities, avif_speeds, webp_methods, threads):
+    """(format, quality, speed, threads, save kwargs); speed is the AVIF speed / WebP method."""
+    for fmt in formats:
+        for q in qualities:
+            if fmt == "avif":
+                for speed in avif_speeds:
+                    for n in threads:
+                        yield fmt, q, speed, n, {"format": "AVIF", "quality": q, "speed": speed, "max_threads": n}
+            elif fmt == "webp":
+                for method in webp_methods:
+                    yield fmt, q, method, 1, {"format": "WEBP", "quality": q, "method": method}
+            else:
+                yield fmt, q, "", 1, {"format": "JPEG", "quality": q, "optimize": True, "progressive": True}
+
+
+def measure(img: Image.Image, save_kwargs: dict, repeat: int) -> dict:
+    """Best-of-repeat encode/decode wall time, size and SSIM of one encoder setting."""
+    encode_times, decode_times = [], []
+    for _ in range(repeat):
+        buf = BytesIO()
+        started = time.perf_counter()
+        img.save(buf, **save_kwargs)
+        encode_times.append(time.perf_counter() - started)
+        data = buf.getvalue()
+        started = time.perf_counter()
+        with Image.open(BytesIO(data)) as decoded:
+            decoded.load()
+        decode_times.append(time.perf_counter() - started)
+    with Image.open(BytesIO(data)) as decoded:
+        decoded.load()
+        score = ssim(img, decoded) if ssim is not None else None
+    return {
+        "bytes": len(data),
+        "bpp": round(len(data) * 8 / (img.width * img.height), 4),
+        "encode_ms": round(min(encode_times) * 1000, 1),
+        "decode_ms": round(min(decode_times) * 1000, 1),
+        "ssim": round(score, 5) if score is not None else "",
+    }
+
+
+def summarize(rows: list[dict]) -> list[dict]:
+    """Mean per encoder setting over all sampled images, sorted by format then size."""
+    groups: dict[tuple, list[dict]] = {}
+    for row in rows:
+        groups.setdefault((row["format"], row["quality"], row["speed"], row["threads"]), []).append(row)
+    summary = []
+    for (fmt, q, speed, threads), items in groups.items():
+        scores = [r["ssim"] for r in items if r["ssim"] != ""]
+        summary.append({
+            "format": fmt, "quality": q, "speed": speed, "threads": threads, "images": len(items),
+            "bpp": round(statistics.mean(r["bpp"] for r in items), 4),
+            "bytes": round(statistics.mean(r["bytes"] for r in items)),
+            "encode_ms": round(statistics.mean(r["encode_ms"] for r in items), 1),
+            "decode_ms": round(statistics.mean(r["decode_ms"] for r in items), 1),
+            "ssim": round(statistics.mean(scores), 5) if scores else "",
+        })
+    summary.sort(key=lambda s: (s["format"], s["bpp"]))
+    return summary
+
+
+def write_html(path: Path, summary: list[dict], rows: list[dict], meta: dict) -> None:
+    def table(records, columns):
+        head = "".join(f"<th>{escape(c)}</th>" for c in columns)
+        body = "".join(
+            "<tr>" + "".join(f"<td>{escape(r[c])}</td>" for c in columns) + "</tr>" for r in records
+        )
+        return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+    info = "".join(f"<li>{escape(k)}: {escape(v)}</li>" for k, v in meta.items())
+    summary_columns = ["format", "quality", "speed", "threads", "images", "bpp", "bytes", "encode_ms", "decode_ms", "ssim"]
+    path.write_text(
+        "<!doctype html><meta charset=\"utf-8\"><title>Image encoder benchmark</title>"
+        "<style>body{font:14px sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:2em}"
+        "td,th{border:1px solid #ccc;padding:2px 8px;text-align:right}th{background:#eee}</style>"
+        f"<h1>Image encoder benchmark</h1><ul>{info}</ul>"
+        f"<h2>Per setting (mean over images)</h2>{table(summary, summary_columns)}"
+        f"<h2>Per image</h2>{table(rows, FIELDS)}",
+        encoding="utf-8",
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark AVIF/WebP/JPEG encoder settings on a sample of media/static images: encode and\n"
+        "decode time, bytes (bits per pixel) and SSIM vs the source, written as CSV + HTML reports.\n"
+        "Rerun after bumping Pillow or pillow-avif-plugin before changing save_avif/save_webp defaults."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", help="Directories to sample from (default: MEDIA_ROOT and static/)")
+        parser.add_argument("--sample", type=int, default=10, help="Number of images (default: 10)")
+        parser.add_argument("--seed", type=int, default=0, help="Sampling seed, for comparable reruns (default: 0)")
+        parser.add_argument("--formats", default="avif,webp", help="avif, webp, jpeg (default: avif,webp)")
+        parser.add_argument("--qualities", default="50,65,80", help="Comma-separated qualities (default: 50,65,80)")
+        parser.add_argument("--avif-speeds", default="4,6,8", help="AVIF encoder speeds 0-10 (default: 4,6,8)")
+        parser.add_argument("--webp-methods", default="4,6", help="WebP methods 0-6 (default: 4,6)")
+        parser.add_argument("--threads", default=f"1,{os.cpu_count() or 1}", help="AVIF max_threads values (default: 1,<cpus>)")
+        parser.add_argument("--repeat", type=int, default=2, help="Encode/decode repetitions, best time kept (default: 2)")
+        parser.add_argument("--max-side", type=int, default=1600,
+                            help="Downscale sources to this longest side first, 0 keeps them (default: 1600)")
+        parser.add_argument("--output", default=None,
+                            help="Report directory (default: cache/benchmarks/images-<timestamp>)")
+
+    def handle(self, *args, **options):
+        formats = [f.strip().lower() for f in options["formats"].split(",") if f.strip()]
+        unknown = set(formats) - {"avif", "webp", "jpeg"}
+        if unknown:
+            raise CommandError(f"Unknown formats: {', '.join(sorted(unknown))}")
+        if "avif" in formats and not AVIF_AVAILABLE:
+            self.stderr.write(self.style.WARNING("AVIF encoder not available, skipping avif"))
+            formats.remove("avif")
+        if not formats:
+            raise CommandError("Nothing to benchmark")
+        matrix = list(encoder_matrix(
+            formats, _int_list(options["qualities"]), _int_list(options["avif_speeds"]),
+            _int_list(options["webp_methods"]), _int_list(options["threads"]),
+        ))
+        if not matrix:  # e.g. --qualities ""
+            raise CommandError("Nothing to benchmark")
+
+        roots = options["paths"] or [settings.MEDIA_ROOT, settings.BASE_DIR / "static"]
+        sources = find_sources(roots)
+        if not sources:
+            raise CommandError(f"No source images under {', '.join(map(str, roots))}")
+        sample = sorted(random.Random(options["seed"]).sample(sources, min(options["sample"], len(sources))))
+        self.stdout.write(f"🔍 {len(sample)} of {len(sources)} images x {len(matrix)} settings")
+        if ssim is None:
+            self.stdout.write("ℹ️  NumPy not installed: no SSIM column")
+
+        rows = []
+        for path in sample:
+            with Image.open(path) as img:
+                img.load()
+                img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+            if options["max_side"] and max(img.size) > options["max_side"]:
+                img.thumbnail((options["max_side"], options["max_side"]), Image.LANCZOS)
+            label = str(path)
+            for root in roots:
+                if path.is_relative_to(root):
+                    label = str(path.relative_to(root))
+                    break
+            self.stdout.write(f"🔄 {label} ({img.width}x{img.height})")
+            for fmt, q, speed, threads, save_kwargs in matrix:
+                source = img.convert("RGB") if fmt == "jpeg" and img.mode != "RGB" else img
+                row = {"image": label, "width": img.width, "height": img.height, "format": fmt,
+                       "quality": q, "speed": speed, "threads": threads}
+                row.update(measure(source, save_kwargs, max(1, options["repeat"])))
+                rows.append(row)
+
+        out_dir = Path(options["output"] or settings.BASE_DIR / "cache" / "benchmarks"
+                       / f"images-{datetime.now():%Y%m%d-%H%M%S}")
+        out_dir.mkdir(parents=True, exist_ok=True)
+        summary = summarize(rows)
+        with open(out_dir / "results.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        with open(out_dir / "summary.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(summary[0]))
+            writer.writeheader()
+            writer.writerows(summary)
+        versions = {"Pillow": PIL.__version__}
+        try:
+            import pillow_avif
+            versions["pillow-avif-plugin"] = pillow_avif.__version__
+        except (ImportError, AttributeError):
+            pass
+        write_html(out_dir / "report.html", summary, rows, {
+            **versions, "images": len(sample), "settings": len(matrix), "repeat": options["repeat"],
+            "max side": options["max_side"] or "original",
+        })
+
+        self.stdout.write("\n📊 Smallest setting per format (mean bpp / SSIM / encode ms):")
+        for fmt in formats:
+            best = next((s for s in summary if s["format"] == fmt), None)
+            if best is None:  # no settings for this format (e.g. --webp-methods "")
+                continue
+            self.stdout.write(
+                f"   {fmt}: q{best['quality']} speed={best['speed']} threads={best['threads']} → "
+                f"{best['bpp']} bpp, SSIM {best['ssim'] or '-'}, {best['encode_ms']} ms"
+            )
+        self.stdout.write(self.style.SUCCESS(f"✅ Reports: {out_dir}/report.html, results.csv, summary.csv"))
@@ -4,8 +4,8 @@ import os
 from typing import Iterable, Tuple
 
 from django.core.management.base import BaseCommand
-from django.core.files.storage import default_storage
 
+from common.media_pipeline import list_siblings
 from goods.models import Categories, Products, ProductImage
 
 
@@ -14,11 +14,16 @@ def _variant_name(orig_name: str, size: str, ext: str) -> str:
     return f"{root}_{size}.{ext}"
 
 
-def _exists(path: str) -> bool:
+def _missing_sizes(orig_name: str, sizes: Iterable[str]) -> list[str]:
+    """Sizes with neither an AVIF nor a WebP variant; one storage listing per image, not one call per variant."""
     try:
-        return default_storage.exists(path)
+        present = list_siblings(orig_name)
     except Exception:
-        return False
+        present = set()
+    return [
+        size for size in sizes
+        if _variant_name(orig_name, size, "avif") not in present and _variant_name(orig_name, size, "webp") not in present
+    ]
 
 
 class Command(BaseCommand):
@@ -43,14 +48,7 @@ class Command(BaseCommand):
             if not img or not getattr(img, "name", ""):
                 continue
             cat_total += 1
-            missing_for_cat = []
-            for size in sizes:
-                avif = _variant_name(img.name, size, "avif")
-                webp = _variant_name(img.name, size, "webp")
-                ok_avif = _exists(avif)
-                ok_webp = _exists(webp)
-                if not (ok_avif or ok_webp):
-                    missing_for_cat.append(size)
+            missing_for_cat = _missing_sizes(img.name, sizes)
             if missing_for_cat:
                 cat_missing += 1
                 self.stdout.write(f"[CATEGORY] {cat.slug or cat.id} ({cat.name}): missing {', '.join(missing_for_cat)}")
@@ -64,12 +62,7 @@ class Command(BaseCommand):
             if not img or not getattr(img, "name", ""):
                 continue
             prod_total += 1
-            missing_for_prod = []
-            for size in sizes:
-                avif = _variant_name(img.name, size, "avif")
-                webp = _variant_name(img.name, size, "webp")
-                if not (_exists(avif) or _exists(webp)):
-                    missing_for_prod.append(size)
+            missing_for_prod = _missing_sizes(img.name, sizes)
             if missing_for_prod:
                 prod_missing += 1
                 self.stdout.write(f"[PRODUCT] {p.id} {p.name}: missing {', '.join(missing_for_prod)}")
@@ -80,12 +73,7 @@ class Command(BaseCommand):
             if not img or not getattr(img, "name", ""):
                 continue
             prod_total += 1
-            missing_for_prod = []
-            for size in sizes:
-                avif = _variant_name(img.name, size, "avif")
-                webp = _variant_name(img.name, size, "webp")
-                if not (_exists(avif) or _exists(webp)):
-                    missing_for_prod.append(size)
+            missing_for_prod = _missing_sizes(img.name, sizes)
             if missing_for_prod:
                 prod_missing += 1
                 self.stdout.write(f"[PRODUCT-IMG] {pi.id} of {pi.product_id}: missing {', '.join(missing_for_prod)}")
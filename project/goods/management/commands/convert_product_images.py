@@ -1,19 +1,10 @@
 from __future__ import annotations
 
-import os
 from django.core.management.base import BaseCommand
-from django.core.files.storage import default_storage
-from django.conf import settings
 
 from goods.models import Products, ProductImage
-from common.image_utils import generate_icon_variants
-
-
-def _fs_path(name: str) -> str:
-    try:
-        return default_storage.path(name)  # type: ignore[attr-defined]
-    except Exception:
-        return os.path.join(settings.MEDIA_ROOT, name)
+from common.image_utils import encoding_profile
+from common.media_pipeline import list_siblings, planned_variants, process_image
 
 
 class Command(BaseCommand):
@@ -27,6 +18,7 @@ class Command(BaseCommand):
         parser.add_argument("--dry-run", action="store_true", 
                           help="Show what would be converted without actually doing it")
 
+    @encoding_profile("archival")
     def handle(self, *args, **options):
         sizes_str: str = options["sizes"]
         dry_run: bool = options["dry_run"]
@@ -73,44 +65,32 @@ class Command(BaseCommand):
             )
 
     def _process_image(self, image_field, sizes, only_missing, dry_run):
-        """Process a single image field"""
-        try:
-            src_path = _fs_path(image_field.name)
-            if not os.path.exists(src_path):
-                return False
-
-            converted_any = False
-            for size in sizes:
-                size_name = f"{size[0]}x{size[1]}"
-                
-                if only_missing:
-                    # Check if variants already exist
-                    root, _ = os.path.splitext(src_path)
-                    avif_path = f"{root}_{size_name}.avif"
-                    webp_path = f"{root}_{size_name}.webp"
-                    if os.path.exists(avif_path) and os.path.exists(webp_path):
-                        continue
-
-                if dry_run:
-                    self.stdout.write(f"Would convert: {image_field.name} → {size_name}")
-                    converted_any = True
-                else:
-                    try:
-                        variants = generate_icon_variants(src_path, size=size)
-                        if variants:
-                            self.stdout.write(
-                                self.style.SUCCESS(f"✓ {image_field.name} → {size_name}")
-                            )
-                            converted_any = True
-                    except Exception as e:
-                        self.stderr.write(
-                            self.style.WARNING(f"✗ {image_field.name}: {e}")
-                        )
+        """Process a single image field (read and written through default_storage: local media or a bucket)"""
+        name = image_field.name
+        if only_missing:
+            # one listing for all sizes instead of a lookup per variant
+            siblings = list_siblings(name)
+            sizes = [size for size in sizes if set(planned_variants(name, 0, noresize=False, sizes=[size])) - siblings]
+        if not sizes:
+            return False
 
-            return converted_any
+        if dry_run:
+            for w, h in sizes:
+                self.stdout.write(f"Would convert: {name} → {w}x{h}")
+            return True
 
+        try:
+            result = process_image(name, image_type="product", noresize=False, sizes=sizes, mode="contain",
+                                   overwrite=not only_missing, quality_avif=70)
+        except FileNotFoundError:
+            return False
         except Exception as e:
             self.stderr.write(
-                self.style.ERROR(f"Error processing {image_field.name}: {e}")
+                self.style.ERROR(f"Error processing {name}: {e}")
             )
             return False
+        for w, h in sizes:
+            self.stdout.write(
+                self.style.SUCCESS(f"✓ {name} → {w}x{h}")
+            )
+        return bool(result["written"])
@@ -1,21 +1,12 @@
 from __future__ import annotations
 
-import os
 from typing import Tuple
 
 from django.core.management.base import BaseCommand
-from django.core.files.storage import default_storage
-from django.conf import settings
 
 from goods.models import Products
-from common.image_utils import generate_card_variants
-
-
-def _fs_path(name: str) -> str:
-    try:
-        return default_storage.path(name)  # type: ignore[attr-defined]
-    except Exception:
-        return os.path.join(settings.MEDIA_ROOT, name)
+from common.image_utils import encoding_profile
+from common.media_pipeline import process_image
 
 
 class Command(BaseCommand):
@@ -36,6 +27,7 @@ class Command(BaseCommand):
         parser.add_argument("--mobile", type=str, default="200x160",
                             help="Mobile canvas WxH (default: 200x160)")
 
+    @encoding_profile("archival")
     def handle(self, *args, **options):
         only_missing: bool = options["only_missing"]
         force: bool = options["force"]
@@ -51,28 +43,26 @@ class Command(BaseCommand):
             img_field = getattr(p, "card_image", None) or getattr(p, "image", None)
             if not img_field or not getattr(img_field, "name", ""):
                 continue
-            src_path = _fs_path(img_field.name)
-            if not os.path.exists(src_path):
-                continue
 
             total += 1
-
-            if only_missing and not force:
-                # check if both sizes have at least one of avif/webp
-                if self._has_variants(src_path, size_d) and self._has_variants(src_path, size_m):
-                    continue
-
             try:
-                generate_card_variants(
-                    src_path,
-                    size_desktop=size_d,
-                    size_mobile=size_m,
-                    background_blur=True,
+                # blur-extend canvases, read and written through default_storage (local media or a bucket)
+                result = process_image(
+                    img_field.name,
+                    image_type="product",
+                    noresize=False,
+                    sizes=[size_d, size_m],
+                    mode="blur",
+                    overwrite=force or not only_missing,
                     quality_webp=webp_q,
                     quality_avif=avif_q,
                 )
+                if not result["written"]:
+                    continue
                 converted += 1
                 self.stdout.write(self.style.SUCCESS(f"✓ {img_field.name} → card variants"))
+            except FileNotFoundError:
+                total -= 1
             except Exception as e:
                 self.stderr.write(self.style.ERROR(f"✗ {img_field.name}: {e}"))
 
@@ -84,10 +74,3 @@ class Command(BaseCommand):
             return (w, h)
         except Exception:
             return default
-
-    def _has_variants(self, src_path: str, size: Tuple[int, int]) -> bool:
-        root, _ = os.path.splitext(src_path)
-        size_name = f"{size[0]}x{size[1]}"
-        avif_path = f"{root}_{size_name}.avif"
-        webp_path = f"{root}_{size_name}.webp"
-        return os.path.exists(avif_path) or os.path.exists(webp_path)
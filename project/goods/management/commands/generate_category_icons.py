@@ -1,19 +1,10 @@
 from __future__ import annotations
 
-import os
 from django.core.management.base import BaseCommand
-from django.core.files.storage import default_storage
-from django.conf import settings
 
 from goods.models import Categories
-from common.image_utils import generate_icon_variants
-
-
-def _fs_path(name: str) -> str:
-    try:
-        return default_storage.path(name)  # type: ignore[attr-defined]
-    except Exception:
-        return os.path.join(settings.MEDIA_ROOT, name)
+from common.image_utils import encoding_profile
+from common.media_pipeline import process_image
 
 
 class Command(BaseCommand):
@@ -29,6 +20,7 @@ class Command(BaseCommand):
         parser.add_argument("--quality-webp", type=int, default=None,
                             help="WebP quality (0..100). If omitted, defaults from image_utils are used.")
 
+    @encoding_profile("archival")
     def handle(self, *args, **options):
         size_str: str = options["size"]
         try:
@@ -47,18 +39,17 @@ class Command(BaseCommand):
             if not img or not getattr(img, "name", ""):
                 continue
             total += 1
-            src = _fs_path(img.name)
-            if options["only_missing"]:
-                root, _ = os.path.splitext(src)
-                avif = f"{root}_{size_str}.avif"
-                webp = f"{root}_{size_str}.webp"
-                if os.path.exists(avif) and os.path.exists(webp):
-                    continue
             try:
-                generate_icon_variants(src, size=(w, h), mode=mode,
-                                       quality_avif=q_avif, quality_webp=q_webp)
+                # read and written through default_storage: local media or a bucket alike
+                result = process_image(img.name, image_type="icon", noresize=False, sizes=[(w, h)], mode=mode,
+                                       overwrite=not options["only_missing"],
+                                       quality_avif=q_avif if q_avif is not None else 70, quality_webp=q_webp)
+                if not result["written"]:
+                    continue
                 ok += 1
                 self.stdout.write(self.style.SUCCESS(f"OK: {cat.name}"))
+            except FileNotFoundError:
+                total -= 1
             except Exception as e:
                 self.stderr.write(self.style.WARNING(f"Skip {cat.name}: {e}"))
         self.stdout.write(self.style.SUCCESS(f"Done. Processed={total}, generated={ok}"))
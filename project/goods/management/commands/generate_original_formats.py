@@ -1,17 +1,16 @@
-import os
+import posixpath
 from django.core.management.base import BaseCommand
-from django.conf import settings
-from django.db.models import Q
 
-from goods.models import Products, ProductImage
-from common.image_utils import generate_formats_noresize
+from goods.models import Products
+from common.image_utils import encoding_profile
+from common.media_pipeline import list_siblings, process_image
 
 
 class Command(BaseCommand):
     help = (
         "Generate AVIF/WebP next to original product images WITHOUT resizing.\n"
         "Processes main product image, card_image, and gallery images by default.\n"
-        "Writes <root>.avif and <root>.webp beside the original file."
+        "Writes <root>.avif and <root>.webp beside the original file (any media storage)."
     )
 
     def add_arguments(self, parser):
@@ -67,6 +66,7 @@ class Command(BaseCommand):
             help="Optional comma-separated product IDs to limit processing (e.g., '12,15,21')",
         )
 
+    @encoding_profile("archival")
     def handle(self, *args, **opts):
         dry = opts["dry_run"]
         overwrite = opts["overwrite"]
@@ -96,63 +96,66 @@ class Command(BaseCommand):
         skipped = 0
         errors = 0
 
-        def process_path(fs_path: str, origin_label: str):
+        def process_name(name: str, origin_label: str):
             nonlocal total_files, created_avif, created_webp, skipped, errors
-            if not fs_path or not os.path.exists(fs_path):
+            if not name:
                 return
 
-            root, _ = os.path.splitext(fs_path)
-            avif_path = f"{root}.avif"
-            webp_path = f"{root}.webp"
+            root, _ = posixpath.splitext(name)
+            avif_name = f"{root}.avif"
+            webp_name = f"{root}.webp"
+            basename = posixpath.basename(name)
 
-            if only_missing and os.path.exists(avif_path) and os.path.exists(webp_path):
+            if only_missing and not overwrite and {avif_name, webp_name} <= list_siblings(name):
                 skipped += 1
-                self.stdout.write(f"⏩ Skip (exists): {origin_label} -> {os.path.basename(fs_path)}")
+                self.stdout.write(f"⏩ Skip (exists): {origin_label} -> {basename}")
                 return
 
             total_files += 1
             if dry:
                 action = "OVERWRITE" if overwrite else ("ONLY-MISSING" if only_missing else "CREATE")
                 self.stdout.write(
-                    f"🔍 Would generate ({action}): {origin_label} -> {os.path.basename(fs_path)}"
+                    f"🔍 Would generate ({action}): {origin_label} -> {basename}"
                 )
                 return
 
             try:
-                result = generate_formats_noresize(
-                    fs_path,
+                result = process_image(
+                    name,
                     image_type="product",
                     quality_avif=q_avif,
                     quality_webp=q_webp,
                     overwrite=overwrite,
                 )
-                if result.get("avif"):
+                if avif_name in result["written"]:
                     created_avif += 1
-                if result.get("webp"):
+                if webp_name in result["written"]:
                     created_webp += 1
                 self.stdout.write(
-                    f"✅ Done: {origin_label} -> {os.path.basename(fs_path)}"
+                    f"✅ Done: {origin_label} -> {basename}"
                 )
+            except FileNotFoundError:
+                total_files -= 1
             except Exception as e:
                 errors += 1
-                self.stdout.write(self.style.ERROR(f"❌ Error: {origin_label} -> {fs_path}: {e}"))
+                self.stdout.write(self.style.ERROR(f"❌ Error: {origin_label} -> {name}: {e}"))
 
         # Iterate
         for p in qs.iterator():
             # main image
-            if inc_main and getattr(p, "image", None) and getattr(p.image, "path", None):
-                process_path(p.image.path, f"Product #{p.id} main")
+            if inc_main and getattr(p, "image", None):
+                process_name(p.image.name, f"Product #{p.id} main")
             # card_image
-            if inc_card and getattr(p, "card_image", None) and getattr(p.card_image, "path", None):
-                process_path(p.card_image.path, f"Product #{p.id} card")
+            if inc_card and getattr(p, "card_image", None):
+                process_name(p.card_image.name, f"Product #{p.id} card")
 
             # gallery images
             if inc_gallery:
                 imgs = getattr(p, "images", None)
                 if imgs is not None:
                     for gi in imgs.all().iterator():
-                        if getattr(gi, "image", None) and getattr(gi.image, "path", None):
-                            process_path(gi.image.path, f"Product #{p.id} gallery #{gi.id}")
+                        if getattr(gi, "image", None):
+                            process_name(gi.image.name, f"Product #{p.id} gallery #{gi.id}")
 
         # Summary
         self.stdout.write("\n📊 Summary:")
@@ -8,7 +8,7 @@ from django.core.management.base import BaseCommand, CommandParser
 from django.conf import settings
 from PIL import Image
 
-from common.image_utils import ensure_dir, _fit_box, save_avif, save_webp
+from common.image_utils import ensure_dir, _fit_box, save_avif, save_webp, encoding_profile
 
 
 class Command(BaseCommand):
@@ -43,6 +43,7 @@ class Command(BaseCommand):
             help="Regenerate even if target files exist.",
         )
 
+    @encoding_profile("archival")
     def handle(self, *args, **options):
         pattern: str = options["glob"]
         sizes_raw: str = options["sizes"]
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common.synthetic import SyntheticCatalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-insert a deterministic synthetic catalog (categories, products, gallery images,\n"
+        "users, carts, orders) for scale testing of search, catalog views and image commands."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=20, help="Number of categories (default: 20)")
+        parser.add_argument("--products", type=int, default=10000, help="Number of products (default: 10000)")
+        parser.add_argument("--images-per-product", type=int, default=2,
+                            help="Gallery images per product (default: 2)")
+        parser.add_argument("--users", type=int, default=500, help="Number of users (default: 500)")
+        parser.add_argument("--carts-per-user", type=int, default=3, help="Cart rows per user (default: 3)")
+        parser.add_argument("--anonymous-carts", type=int, default=1000,
+                            help="Cart rows for anonymous sessions (default: 1000)")
+        parser.add_argument("--orders", type=int, default=5000, help="Number of orders (default: 5000)")
+        parser.add_argument("--items-per-order", type=int, default=3, help="Items per order (default: 3)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="bulk_create batch size (default: 1000)")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+        parser.add_argument("--prefix", default="syn",
+                            help="Prefix for names/slugs/usernames of generated rows (default: syn)")
+        parser.add_argument("--no-files", action="store_true",
+                            help="Do not write placeholder image files, only set ImageField names")
+        parser.add_argument("--purge", action="store_true",
+                            help="Delete rows from a previous run with the same --prefix first")
+        parser.add_argument("--force", action="store_true",
+                            help="Allow running with DEBUG=False (never do this on the production database)")
+
+    def handle(self, *args, **opts):
+        if not settings.DEBUG and not opts["force"]:
+            raise CommandError("Refusing to generate synthetic data with DEBUG=False; pass --force if this is a scratch DB.")
+        if opts["categories"] < 1:
+            raise CommandError("--categories must be at least 1")
+
+        generator = SyntheticCatalog(
+            seed=opts["seed"],
+            prefix=opts["prefix"],
+            batch_size=opts["batch_size"],
+            write_files=not opts["no_files"],
+            log=lambda msg: self.stdout.write(f"   ✅ {msg}"),
+        )
+
+        if opts["purge"]:
+            self.stdout.write(f"🧹 Purging previous '{opts['prefix']}' rows...")
+            generator.purge()
+
+        self.stdout.write(f"🔄 Generating synthetic catalog (seed={opts['seed']}, batch={opts['batch_size']})...")
+        started = time.perf_counter()
+        generator.generate(
+            categories=opts["categories"],
+            products=opts["products"],
+            images_per_product=opts["images_per_product"],
+            users=opts["users"],
+            carts_per_user=opts["carts_per_user"],
+            anonymous_carts=opts["anonymous_carts"],
+            orders=opts["orders"],
+            items_per_order=opts["items_per_order"],
+        )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(f"\n📊 Done in {elapsed:.1f}s"))
+        self.stdout.write("\n💡 Tips:")
+        self.stdout.write("   • Re-run with --purge to replace the previous data set")
+        self.stdout.write("   • Use --no-files to benchmark DB-only paths (search, catalog) faster")
+        self.stdout.write("   • Same --seed and arguments always produce the same rows")
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common.image_utils import encoding_profile
+from common.media_pipeline import process_image
+from goods.models import Categories, ProductImage, Products
+
+
+def _sources(role: str):
+    """Image fields that get the role's ladder (same mapping as goods.signals)."""
+    if role == "card":
+        for p in Products.objects.only("image", "card_image"):
+            yield p.card_image
+            yield p.image
+    elif role == "gallery":
+        for p in Products.objects.only("image"):
+            yield p.image
+        for img in ProductImage.objects.only("image"):
+            yield img.image
+    elif role == "icon":
+        for c in Categories.objects.only("image"):
+            yield c.image
+    elif role == "seo":
+        # the presentation banner falls back to the category image
+        for c in Categories.objects.only("image", "seo_image"):
+            yield c.seo_image or c.image
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate AVIF/WebP width ladders (settings.IMAGE_WIDTH_LADDERS) for existing media:\n"
+        "card, gallery, icon and seo roles. New uploads get them from goods.signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("roles", nargs="*", help="Roles to generate (default: all)")
+        parser.add_argument("--force", action="store_true", help="Re-encode variants that already exist")
+        parser.add_argument("--webp-quality", type=int, default=None, help="WebP quality (default: 82)")
+        parser.add_argument("--avif-quality", type=int, default=None, help="AVIF quality (default: 60)")
+
+    @encoding_profile("archival")
+    def handle(self, *args, **options):
+        roles = options["roles"] or list(settings.IMAGE_WIDTH_LADDERS)
+        unknown = set(roles) - set(settings.IMAGE_WIDTH_LADDERS)
+        if unknown:
+            raise CommandError(f"Unknown roles: {', '.join(sorted(unknown))}")
+
+        for role in roles:
+            self.stdout.write(f"🔄 {role}: widths {settings.IMAGE_WIDTH_LADDERS[role]['widths']}")
+            seen, done = set(), 0
+            for field in _sources(role):
+                if not field or not getattr(field, "name", "") or field.name in seen:
+                    continue
+                seen.add(field.name)
+                try:
+                    result = process_image(
+                        field.name, roles=(role,), noresize=False,
+                        quality_webp=options["webp_quality"],
+                        quality_avif=options["avif_quality"],
+                        overwrite=options["force"],
+                    )
+                    done += 1
+                    written = [n.rsplit("/", 1)[-1] for n in result["written"]]
+                    self.stdout.write(f"   ✅ {field.name}: {', '.join(written) or 'up to date'}")
+                except FileNotFoundError:
+                    continue
+                except Exception as e:
+                    self.stderr.write(self.style.ERROR(f"   ✗ {field.name}: {e}"))
+            self.stdout.write(f"📊 {role}: {done}/{len(seen)} images")
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -3,7 +3,7 @@ import glob
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from PIL import Image
-from common.image_utils import save_avif_optimized, save_webp, ensure_dir
+from common.image_utils import save_avif_optimized, save_webp, ensure_dir, ssim_target, encoding_profile
 
 
 class Command(BaseCommand):
@@ -33,6 +33,13 @@ class Command(BaseCommand):
             default=None,
             help='Override AVIF quality specifically for product images (takes priority over --quality)'
         )
+        parser.add_argument(
+            '--target-ssim',
+            type=float,
+            default=None,
+            help='Pick the lowest AVIF/WebP quality reaching this SSIM per image, e.g. 0.98 '
+                 '(takes priority over --quality; default: settings.IMAGE_SSIM_TARGET, 0 disables)'
+        )
         parser.add_argument(
             '--force',
             action='store_true',
@@ -45,6 +52,7 @@ class Command(BaseCommand):
             help='Max longest side for background images (0 disables resize, default: 2400)'
         )
 
+    @encoding_profile("archival")
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         quality = options['quality']
@@ -52,6 +60,11 @@ class Command(BaseCommand):
         product_quality = options.get('product_quality')
         force = options['force']
         bg_max_size = options.get('bg_max_size')
+        target_ssim = options.get('target_ssim')
+        if target_ssim is None:
+            target_ssim = ssim_target()
+        if target_ssim:
+            self.stdout.write(f"🎯 SSIM target: {target_ssim}")
         
         if dry_run:
             self.stdout.write(self.style.WARNING("DRY RUN MODE - No files will be modified"))
@@ -163,16 +176,27 @@ class Command(BaseCommand):
                                 chosen_quality = bg_quality
                             elif (not is_background) and isinstance(product_quality, int):
                                 chosen_quality = product_quality
-                            elif isinstance(quality, int):
+                            elif isinstance(quality, int) and not target_ssim:
                                 chosen_quality = quality
 
-                            # Save optimized AVIF (internal heuristics will adapt if chosen_quality is None)
-                            save_avif_optimized(img, avif_path, image_type=image_type, quality=chosen_quality)
+                            # Save optimized AVIF (internal heuristics / the SSIM search if chosen_quality is None)
+                            result = save_avif_optimized(img, avif_path, image_type=image_type, quality=chosen_quality,
+                                                         target_ssim=target_ssim or 0)
+                            if result is not None:
+                                self.stdout.write(
+                                    f"🎯 AVIF q{result.quality} (SSIM {result.ssim:.4f}, preset q{result.baseline_quality}: "
+                                    f"{result.saved_bytes//1024:+d}KB saved)"
+                                )
                             
                             # Save WebP as fallback
                             # Keep backgrounds crisp enough
                             webp_quality = 82 if is_background else 80
-                            save_webp(img, webp_path, quality=webp_quality)
+                            if target_ssim:
+                                from common.image_quality import save_to_target
+                                result = save_to_target(img, webp_path, "webp", target_ssim, webp_quality)
+                                self.stdout.write(f"🎯 WebP q{result.quality} (SSIM {result.ssim:.4f})")
+                            else:
+                                save_webp(img, webp_path, quality=webp_quality)
                         
                         # Calculate size after
                         if os.path.exists(avif_path):
@@ -215,4 +239,5 @@ class Command(BaseCommand):
         self.stdout.write(f"\n💡 Tips:")
         self.stdout.write(f"   • Use --quality 8 for even more aggressive compression")
         self.stdout.write(f"   • Background images use quality={quality} by default")
+        self.stdout.write(f"   • Use --target-ssim 0.98 to pick the quality per image instead")
         self.stdout.write(f"   • Check visual quality after optimization")
@@ -1,8 +1,16 @@
-import os
+from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand
-from django.conf import settings
 from goods.models import Categories, Products, ProductImage
-from common.image_utils import generate_icon_variants
+from common.image_utils import encoding_profile
+from common.media_pipeline import list_siblings, planned_variants, process_image
+
+ICON_SIZES = [(128, 128)]
+PRODUCT_SIZES = [(400, 300), (800, 600)]
+
+
+def _missing(name: str, sizes) -> bool:
+    """Any of the sizes' variants not stored yet (one listing, any media storage)."""
+    return bool(set(planned_variants(name, 0, noresize=False, sizes=sizes)) - list_siblings(name))
 
 
 class Command(BaseCommand):
@@ -20,6 +28,7 @@ class Command(BaseCommand):
             help='Regenerate even if AVIF files already exist',
         )
 
+    @encoding_profile("archival")
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         force = options['force']
@@ -38,22 +47,20 @@ class Command(BaseCommand):
                 continue
                 
             try:
-                src_path = os.path.join(settings.MEDIA_ROOT, category.image.name)
-                if not os.path.exists(src_path):
+                name = category.image.name
+                if not default_storage.exists(name):
                     continue
                 
                 # Check if AVIF already exists
-                root, _ = os.path.splitext(src_path)
-                avif_path = f"{root}_128.avif"
-                
-                if os.path.exists(avif_path) and not force:
+                if not force and not _missing(name, ICON_SIZES):
                     self.stdout.write(f"⏭️  Skipping {category.name} - AVIF exists")
                     continue
                 
                 if dry_run:
                     self.stdout.write(f"🔍 Would regenerate: {category.name}")
                 else:
-                    generate_icon_variants(src_path, size=(128, 128), image_type="icon")
+                    process_image(name, image_type="icon", noresize=False, sizes=ICON_SIZES, mode="contain",
+                                  overwrite=force)
                     self.stdout.write(f"✅ Regenerated: {category.name}")
                 
                 total_processed += 1
@@ -72,25 +79,20 @@ class Command(BaseCommand):
                 continue
                 
             try:
-                src_path = os.path.join(settings.MEDIA_ROOT, product.image.name)
-                if not os.path.exists(src_path):
+                name = product.image.name
+                if not default_storage.exists(name):
                     continue
                 
                 # Check if AVIF files already exist
-                root, _ = os.path.splitext(src_path)
-                avif_400_path = f"{root}_400x300.avif"
-                avif_800_path = f"{root}_800x600.avif"
-                
-                if (os.path.exists(avif_400_path) and os.path.exists(avif_800_path) 
-                    and not force):
+                if not force and not _missing(name, PRODUCT_SIZES):
                     self.stdout.write(f"⏭️  Skipping {product.name} - AVIF exists")
                     continue
                 
                 if dry_run:
                     self.stdout.write(f"🔍 Would regenerate: {product.name}")
                 else:
-                    generate_icon_variants(src_path, size=(400, 300), image_type="product")
-                    generate_icon_variants(src_path, size=(800, 600), image_type="product")
+                    process_image(name, image_type="product", noresize=False, sizes=PRODUCT_SIZES, mode="contain",
+                                  overwrite=force)
                     self.stdout.write(f"✅ Regenerated: {product.name}")
                 
                 total_processed += 1
@@ -109,24 +111,19 @@ class Command(BaseCommand):
                 continue
                 
             try:
-                src_path = os.path.join(settings.MEDIA_ROOT, prod_img.image.name)
-                if not os.path.exists(src_path):
+                name = prod_img.image.name
+                if not default_storage.exists(name):
                     continue
                 
                 # Check if AVIF files already exist
-                root, _ = os.path.splitext(src_path)
-                avif_400_path = f"{root}_400x300.avif"
-                avif_800_path = f"{root}_800x600.avif"
-                
-                if (os.path.exists(avif_400_path) and os.path.exists(avif_800_path) 
-                    and not force):
+                if not force and not _missing(name, PRODUCT_SIZES):
                     continue
                 
                 if dry_run:
                     self.stdout.write(f"🔍 Would regenerate: Additional image for {prod_img.product.name}")
                 else:
-                    generate_icon_variants(src_path, size=(400, 300), image_type="product")
-                    generate_icon_variants(src_path, size=(800, 600), image_type="product")
+                    process_image(name, image_type="product", noresize=False, sizes=PRODUCT_SIZES, mode="contain",
+                                  overwrite=force)
                     self.stdout.write(f"✅ Regenerated: Additional image for {prod_img.product.name}")
                 
                 total_processed += 1
@@ -3,7 +3,7 @@ import shutil
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from PIL import Image
-from common.image_utils import save_avif_optimized, ensure_dir
+from common.image_utils import avif_preset_quality, encoding_profile, save_avif_optimized, ensure_dir
 
 
 class Command(BaseCommand):
@@ -23,6 +23,19 @@ class Command(BaseCommand):
             choices=['background', 'product', 'icon', 'hero'],
             help='Image type for quality settings',
         )
+        parser.add_argument(
+            '--target-ssim',
+            type=float,
+            default=0,
+            help='Also report the lowest quality reaching this SSIM (e.g. 0.98; needs NumPy)',
+        )
+        parser.add_argument(
+            '--profile',
+            type=str,
+            default='archival',
+            choices=list(settings.IMAGE_ENCODING_PROFILES),
+            help='Encoder speed/effort profile (default: archival, as the batch commands)',
+        )
         parser.add_argument(
             '--backup',
             action='store_true',
@@ -33,6 +46,7 @@ class Command(BaseCommand):
         file_path = options['file']
         image_type = options['type']
         create_backup = options['backup']
+        target_ssim = options['target_ssim']
         
         # Resolve file path
         if not os.path.isabs(file_path):
@@ -52,6 +66,7 @@ class Command(BaseCommand):
         self.stdout.write(f"   📁 File: {filename}")
         self.stdout.write(f"   📏 Original size: {original_size//1024}KB")
         self.stdout.write(f"   🎨 Image type: {image_type}")
+        self.stdout.write(f"   ⚙️  Profile: {options['profile']}")
         
         # Create backup if requested
         if create_backup:
@@ -65,7 +80,7 @@ class Command(BaseCommand):
             root, ext = os.path.splitext(file_path)
             test_avif_path = f"{root}_test_conservative.avif"
             
-            with Image.open(file_path) as img:
+            with Image.open(file_path) as img, encoding_profile(options['profile']):
                 # Convert to RGB if necessary
                 if img.mode in ('RGBA', 'LA', 'P'):
                     rgb_img = Image.new('RGB', img.size, (255, 255, 255))
@@ -74,8 +89,15 @@ class Command(BaseCommand):
                     rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
                     img = rgb_img
                 
-                # Save with conservative settings
-                save_avif_optimized(img, test_avif_path, image_type=image_type)
+                # Save with conservative settings (the preset, not the SSIM search)
+                save_avif_optimized(img, test_avif_path, image_type=image_type, target_ssim=0)
+                preset_quality = avif_preset_quality(img, image_type)
+                if target_ssim:
+                    from common.image_quality import encode_to_target, ssim
+                    with Image.open(test_avif_path) as encoded:
+                        encoded.load()
+                        preset_ssim = ssim(img, encoded)
+                    targeted = encode_to_target(img, "avif", target_ssim, preset_quality)
             
             if os.path.exists(test_avif_path):
                 avif_size = os.path.getsize(test_avif_path)
@@ -85,6 +107,12 @@ class Command(BaseCommand):
                 self.stdout.write(f"   📁 Test file: {os.path.basename(test_avif_path)}")
                 self.stdout.write(f"   📏 AVIF size: {avif_size//1024}KB")
                 self.stdout.write(f"   📉 Reduction: {reduction:.1f}%")
+                if target_ssim:
+                    self.stdout.write(f"   🎯 Preset q{preset_quality}: SSIM {preset_ssim:.4f}")
+                    self.stdout.write(
+                        f"   🎯 Target {target_ssim}: q{targeted.quality}, SSIM {targeted.ssim:.4f}, "
+                        f"{targeted.size//1024}KB ({targeted.saved_bytes//1024:+d}KB vs preset)"
+                    )
                 
                 # Quality assessment
                 if image_type == 'background':
@@ -1,67 +1,68 @@
 from __future__ import annotations
 
-import os
-from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.core.files.storage import default_storage
 
 from .models import Categories, Products, ProductImage
-from common.image_utils import (
-    generate_icon_variants,
-    generate_formats_noresize,
-    generate_card_variants,
-)
+from .utils import invalidate_cached_categories
+from common.image_utils import encoding_profile
+from common.media_pipeline import process_image
 
 
-def _fs_path_from_storage(name: str) -> str:
-    """Resolve absolute filesystem path for a stored file name.
-    Works for FileSystemStorage; for others, best-effort using MEDIA_ROOT.
-    """
-    # default_storage may have .path (FileSystemStorage)
-    try:
-        return default_storage.path(name)  # type: ignore[attr-defined]
-    except Exception:
-        return os.path.join(settings.MEDIA_ROOT, name)
+def _images_untouched(kwargs, *fields: str) -> bool:
+    """True for saves limited by update_fields that don't include any image field
+    (e.g. stock updates at checkout) — nothing to regenerate, and touching deferred
+    image fields would cost an extra query each."""
+    update_fields = kwargs.get("update_fields")
+    return update_fields is not None and not set(fields) & set(update_fields)
 
 
 @receiver(post_save, sender=Categories)
+@receiver(post_delete, sender=Categories)
+def categories_invalidate_cache(sender, instance: Categories, **kwargs):
+    """Drop the cached category list so catalog pages resolve the fresh set of slugs."""
+    invalidate_cached_categories()
+
+
+@receiver(post_save, sender=Categories)
+@encoding_profile("interactive")  # admin saves: return quickly
 def categories_generate_icon_variants(sender, instance: Categories, **kwargs):
-    """On category save, (re)generate 128x128 AVIF/WebP variants next to original image."""
-    # Icon-sized variants for main category image (used in lists/cards)
+    """On category save, (re)generate the 'icon' width ladder (128x128, ...) of AVIF/WebP variants next to original image."""
+    if _images_untouched(kwargs, "image", "seo_image"):
+        return
+    # Icon-sized variants for main category image (used in lists/cards); without an SEO image it is
+    # also the presentation banner, which needs the 16:9 'seo' ladder
     image_field = getattr(instance, "image", None)
+    seo_field = getattr(instance, "seo_image", None)
+    has_seo = bool(seo_field and getattr(seo_field, "name", ""))
     if image_field and getattr(image_field, "name", ""):
         try:
-            src_path = _fs_path_from_storage(image_field.name)
-            generate_icon_variants(src_path, size=(128, 128))
+            process_image(image_field.name, roles=("icon",) if has_seo else ("icon", "seo"), noresize=False)
         except Exception:
             # Fail silently; this is a best-effort optimization and should not block saving
             pass
 
-    # SEO image: generate no-resize formats and 800x450 cover variants for category presentation block
-    seo_field = getattr(instance, "seo_image", None)
-    if seo_field and getattr(seo_field, "name", ""):
+    # SEO image: generate no-resize formats and the 'seo' cover ladder (..., 800x450) for category presentation block
+    if has_seo:
         try:
-            seo_src = _fs_path_from_storage(seo_field.name)
-            # Create side-by-side AVIF/WebP without resizing
-            generate_formats_noresize(seo_src, image_type="background", overwrite=False)
-            # Create sized cover variants expected by templates (800x450)
-            generate_icon_variants(seo_src, size=(800, 450), mode="cover")
+            # Side-by-side AVIF/WebP without resizing + sized cover variants expected by templates (srcset over the ladder)
+            process_image(seo_field.name, image_type="background", roles=("seo",))
         except Exception:
             pass
 
 
 @receiver(post_save, sender=Products)
+@encoding_profile("interactive")
 def products_generate_image_variants(sender, instance: Products, **kwargs):
-    """On product save, generate AVIF/WebP next to original files WITHOUT resizing."""
+    """On product save, generate AVIF/WebP next to original files WITHOUT resizing, plus the width ladders."""
+    if _images_untouched(kwargs, "image", "card_image"):
+        return
     # Main product image
     image_field = getattr(instance, "image", None)
     if image_field and getattr(image_field, "name", ""):
         try:
-            src_path = _fs_path_from_storage(image_field.name)
-            generate_formats_noresize(src_path, image_type="product", overwrite=False)
-            # Generate card-sized variants (no blur-extend), to avoid "baked" background
-            generate_card_variants(src_path, size_desktop=(230,160), size_mobile=(200,160), background_blur=False)
+            # Card-sized variants (cover, no blur-extend, to avoid "baked" background) + product page gallery
+            process_image(image_field.name, image_type="product", roles=("card", "gallery"))
         except Exception:
             pass
 
@@ -69,21 +70,21 @@ def products_generate_image_variants(sender, instance: Products, **kwargs):
     card_field = getattr(instance, "card_image", None)
     if card_field and getattr(card_field, "name", ""):
         try:
-            src_path = _fs_path_from_storage(card_field.name)
-            generate_formats_noresize(src_path, image_type="product", overwrite=False)
             # Ensure card image also has card-sized variants (no blur-extend)
-            generate_card_variants(src_path, size_desktop=(230,160), size_mobile=(200,160), background_blur=False)
+            process_image(card_field.name, image_type="product", roles=("card",))
         except Exception:
             pass
 
 
 @receiver(post_save, sender=ProductImage)
+@encoding_profile("interactive")
 def product_images_generate_variants(sender, instance: ProductImage, **kwargs):
-    """On gallery image save, generate AVIF/WebP next to original WITHOUT resizing."""
+    """On gallery image save, generate AVIF/WebP next to original WITHOUT resizing, plus the 'gallery' ladder."""
+    if _images_untouched(kwargs, "image"):
+        return
     image_field = getattr(instance, "image", None)
     if image_field and getattr(image_field, "name", ""):
         try:
-            src_path = _fs_path_from_storage(image_field.name)
-            generate_formats_noresize(src_path, image_type="product", overwrite=False)
+            process_image(image_field.name, image_type="product", roles=("gallery",))
         except Exception:
             pass
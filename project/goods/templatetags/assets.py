@@ -0,0 +1,50 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from common.assets import bundle_entry
+
+register = template.Library()
+
+
+def _spec(name):
+    try:
+        return settings.ASSET_BUNDLES[name]
+    except KeyError:
+        raise template.TemplateSyntaxError(f"Unknown asset bundle: {name!r}")
+
+
+@register.simple_tag
+def bundle_css(name):
+    """
+    Styles of a bundle from settings.ASSET_BUNDLES.
+    Built: inline critical CSS + the bundle loaded without blocking render (or a plain
+    <link> when there is no critical CSS). Not built / disabled: one <link> per source file.
+      {% load assets %}{% bundle_css 'home' %}
+    """
+    spec = _spec(name)
+    entry = bundle_entry(name)
+    if not entry or "css" not in entry:
+        return format_html_join("\n", '<link rel="stylesheet" href="{}">', ((static(p),) for p in spec.get("css", ())))
+    href = static(entry["css"])
+    if not entry.get("critical"):
+        return format_html('<link rel="stylesheet" href="{}">', href)
+    # critical CSS is our own build output, not user input
+    return format_html(
+        '<style>{}</style>\n'
+        '<link rel="preload" as="style" href="{}" onload="this.onload=null;this.rel=\'stylesheet\'">\n'
+        '<noscript><link rel="stylesheet" href="{}"></noscript>',
+        mark_safe(entry["critical"]), href, href,
+    )
+
+
+@register.simple_tag
+def bundle_js(name):
+    """Deferred scripts of a bundle (one file when built)."""
+    spec = _spec(name)
+    entry = bundle_entry(name)
+    if not entry or "js" not in entry:
+        return format_html_join("\n", '<script defer src="{}"></script>', ((static(p),) for p in spec.get("js", ())))
+    return format_html('<script defer src="{}"></script>', static(entry["js"]))
@@ -1,66 +1,63 @@
 from __future__ import annotations
 
-from urllib.parse import quote
-
 from django import template
-from django.conf import settings
-
-register = template.Library()
+from django.utils.html import format_html
 
+from common.image_resize import resized_url
+from common.image_utils import ladder_sizes, width_ladder
 
-def _cloud_name() -> str | None:
-    return getattr(settings, 'CLOUDINARY_CLOUD_NAME', None)
+register = template.Library()
 
 
 def _best_product_img(product):
     # Prefer dedicated card image, then main image
     img = getattr(product, 'card_image', None) or getattr(product, 'image', None)
-    if img and getattr(img, 'url', None):
-        try:
-            return img.url
-        except Exception:
-            return None
+    if img and getattr(img, 'name', ''):
+        return img
     return None
 
 
-@register.simple_tag(takes_context=True)
-def cloud_card_picture(context, product, classes: str = 'tm-card-img', alt: str | None = None,
-                       loading: str = 'lazy'):
+@register.simple_tag
+def resized_image_url(image_field, width: int, height: int = 0, mode: str = 'cover') -> str:
     """
-    Render <picture> for product card via Cloudinary fetch:
-      - Desktop (>=768px): 230x160, c_fill,g_auto
-      - Mobile/default:    200x160, c_fill,g_auto
-      - Auto format/quality: f_auto,q_auto
-    Requires settings.CLOUDINARY_CLOUD_NAME and access to request to build absolute media URL.
-    Falls back to original <img> if Cloudinary not configured.
+    Signed URL of the on-demand /img/ endpoint (common.image_resize) for any size:
+      {% resized_image_url product.image 320 240 %}  {% resized_image_url banner.image 1200 %}
+    Empty string without a file.
     """
-    cloud = _cloud_name()
-    req = context.get('request')
-    src_rel = _best_product_img(product)
-    alt_attr = alt or getattr(product, 'name', '')
-
-    if not cloud or not req or not src_rel:
-        # Fallback to original URL
-        src = src_rel or ''
-        return template.mark_safe(f'<img src="{src}" alt="{alt_attr}" class="{classes}" width="230" height="160" loading="{loading}" decoding="async">')
+    if not image_field or not getattr(image_field, 'name', ''):
+        return ''
+    return resized_url(image_field.name, int(width), int(height), mode)
 
-    try:
-        abs_url = req.build_absolute_uri(src_rel)
-    except Exception:
-        abs_url = src_rel
 
-    enc = quote(abs_url, safe='')
-    base = f"https://res.cloudinary.com/{cloud}/image/fetch/"
-
-    # Build transformations
-    desk = f"{base}f_auto,q_auto,w_230,h_160,c_fill,g_auto/{enc}"
-    mob = f"{base}f_auto,q_auto,w_200,h_160,c_fill,g_auto/{enc}"
-
-    parts = [
-        '<picture>',
-        f'<source media="(min-width: 768px)" srcset="{desk}">',
-        f'<source srcset="{mob}">',
-        f'<img src="{mob}" alt="{alt_attr}" class="{classes}" width="230" height="160" loading="{loading}" decoding="async">',
-        '</picture>'
-    ]
-    return template.mark_safe('\n'.join(parts))
+@register.simple_tag
+def resized_card_picture(product, classes: str = 'tm-card-img', alt: str | None = None,
+                         loading: str = 'lazy', role: str = 'card'):
+    """
+    Product card <img> served by the /img/ endpoint: srcset over the role's width ladder
+    (settings.IMAGE_WIDTH_LADDERS) with `w` descriptors and its `sizes`. Nothing has to be
+    pre-generated; the format (AVIF/WebP/JPEG) is negotiated from Accept.
+    """
+    img = _best_product_img(product)
+    alt_attr = alt or getattr(product, 'name', '')
+    spec = width_ladder(role)
+    sizes = ladder_sizes(role)
+    # the width the card renders at on desktop (the legacy 230x160 canvas)
+    width, height = next(((w, h) for w, h in sizes if w >= 230), sizes[-1])
+
+    if not img:
+        return format_html(
+            '<img src="" alt="{}" class="{}" width="{}" height="{}" loading="{}" decoding="async">',
+            alt_attr, classes, width, height, loading,
+        )
+
+    mode = spec.get('mode', 'cover')
+    srcset = ', '.join(f'{resized_url(img.name, w, h, mode)} {w}w' for w, h in sizes)
+    src = resized_url(img.name, width, height, mode)
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" width="{}" height="{}" loading="{}" decoding="async">',
+        src, srcset, spec.get('sizes') or f'{width}px', alt_attr, classes, width, height, loading,
+    )
+
+
+# Former Cloudinary fetch tag; now served by the self-hosted /img/ endpoint
+register.simple_tag(resized_card_picture, name='cloud_card_picture')
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import json
 import os
+import time
 from typing import Optional
 
 from django import template
@@ -12,10 +14,19 @@ from django.contrib.staticfiles import finders
 from django.conf import settings
 import logging
 
+from common.image_utils import ladder_sizes, meta_path, width_ladder
+
 register = template.Library()
 
 logger = logging.getLogger(__name__)
 
+# image sidecars (<root>.meta.json: intrinsic size + LQIP), memoized per process: a card grid would
+# otherwise cost one shared-cache round trip per image; a missing sidecar is re-checked sooner
+IMAGE_META_TIMEOUT = 60 * 60
+IMAGE_META_MISSING_TIMEOUT = 5 * 60
+IMAGE_META_MAX_ENTRIES = 4096
+_image_meta_cache: dict[str, tuple[float, dict]] = {}
+
 
 @register.simple_tag
 def product_image_picture(product, size: str = "400x300", classes: str = "", alt: Optional[str] = None,
@@ -33,9 +44,7 @@ def product_image_picture(product, size: str = "400x300", classes: str = "", alt
     if not img_field or not getattr(img_field, "name", ""):
         # Try first additional image
         try:
-            images = getattr(product, "images", None)
-            if images and images.exists():
-                img_field = images.first().image
+            img_field = _first_gallery_image(product) or img_field
         except Exception:
             pass
     
@@ -52,8 +61,8 @@ def product_image_picture(product, size: str = "400x300", classes: str = "", alt
             avif_name = _variant_name(name, size, "avif")
             webp_name = _variant_name(name, size, "webp")
 
-            avif_url = _url_if_exists(avif_name)
-            webp_url = _url_if_exists(webp_name)
+            avif_url = _url_if_exists(avif_name, name)
+            webp_url = _url_if_exists(webp_name, name)
 
             if getattr(settings, 'DEBUG', False):
                 logger.debug("product_image_picture: name=%s size=%s avif=%s webp=%s orig=%s", name, size, bool(avif_url), bool(webp_url), bool(orig_url))
@@ -65,9 +74,10 @@ def product_image_picture(product, size: str = "400x300", classes: str = "", alt
                 parts.append(f"<source srcset=\"{webp_url}\" type=\"image/webp\">")
             # Prefer modern fallback in <img>: webp -> avif -> original
             img_src = webp_url or avif_url or orig_url
+            width, height, ph_attr = _placeholder(name, img_src, orig_url, width, height)
             fp_attr = f" fetchpriority=\"{fetchpriority}\"" if fetchpriority else ""
             parts.append(
-                f"<img src=\"{img_src}\" alt=\"{alt_attr}\" class=\"{class_attr}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}>"
+                f"<img src=\"{img_src}\" alt=\"{alt_attr}\" class=\"{class_attr}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}{ph_attr}>"
             )
             parts.append("</picture>")
             return mark_safe("".join(parts))
@@ -80,12 +90,26 @@ def product_image_picture(product, size: str = "400x300", classes: str = "", alt
     )
 
 
+def _first_gallery_image(product):
+    """First gallery ImageField; reuses prefetched product.images instead of exists() + first()."""
+    images = getattr(product, "images", None)
+    if images is None:
+        return None
+    first = next(iter(images.all()[:1]), None)
+    return first.image if first is not None else None
+
+
 def _variant_name(orig_name: str, size: str, ext: str) -> str:
     root, _ext = os.path.splitext(orig_name)
     return f"{root}_{size}.{ext}"
 
 
-def _url_if_exists(name: str) -> Optional[str]:
+def _url_if_exists(name: str, original: Optional[str] = None) -> Optional[str]:
+    # common.media_pipeline lists the generated variants in the original's sidecar: no storage
+    # round trip per <source> (a HEAD request each on S3); older sidecars fall back to exists()
+    listed = _image_meta(original).get("variants") if original else None
+    if listed is not None:
+        return default_storage.url(name) if os.path.basename(name) in listed else None
     try:
         if default_storage.exists(name):
             return default_storage.url(name)
@@ -93,6 +117,36 @@ def _url_if_exists(name: str) -> Optional[str]:
         return None
     return None
 
+def _image_meta(name: str) -> dict:
+    """Sidecar written by common.image_utils.write_image_meta ({} when not generated yet)."""
+    now = time.monotonic()
+    cached = _image_meta_cache.get(name)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    try:
+        with default_storage.open(meta_path(name), "rb") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+    if len(_image_meta_cache) >= IMAGE_META_MAX_ENTRIES:
+        _image_meta_cache.clear()
+    _image_meta_cache[name] = (now + (IMAGE_META_TIMEOUT if meta else IMAGE_META_MISSING_TIMEOUT), meta)
+    return meta
+
+
+def _placeholder(name: str, img_src: Optional[str], orig_url: Optional[str], width, height, fit: str = "cover"):
+    """
+    (width, height, style attr) for the <img> of a stored image: the LQIP inlined as background
+    (no extra request, no blank box while the lazy file loads) and, when <img> shows the original
+    itself, a height that follows its intrinsic aspect ratio so nothing shifts on load.
+    """
+    meta = _image_meta(name)
+    if img_src and img_src == orig_url and meta.get("width") and meta.get("height"):
+        height = max(1, round(int(width) * meta["height"] / meta["width"]))
+    style = f' style="background:url({meta["lqip"]}) center/{fit} no-repeat"' if meta.get("lqip") else ""
+    return width, height, style
+
+
 def _orig_url_safe(image_field) -> Optional[str]:
     try:
         return image_field.url
@@ -103,7 +157,50 @@ def _best_variant_urls(name: str, size: str):
     """Return tuple (avif_url, webp_url) if those sized variants exist."""
     avif_name = _variant_name(name, size, "avif")
     webp_name = _variant_name(name, size, "webp")
-    return _url_if_exists(avif_name), _url_if_exists(webp_name)
+    return _url_if_exists(avif_name, name), _url_if_exists(webp_name, name)
+
+def _ladder_variants(name: str, role: str) -> list[tuple[int, Optional[str], Optional[str]]]:
+    """(width, avif_url, webp_url) of the role's generated width ladder, smallest first."""
+    variants = []
+    for w, h in ladder_sizes(role):
+        avif_url, webp_url = _best_variant_urls(name, f"{w}x{h}")
+        if avif_url or webp_url:
+            variants.append((w, avif_url, webp_url))
+    return variants
+
+
+def _ladder_picture(name: str, role: str, *, alt: str, classes: str, width: int, height: int,
+                    loading: str, fetchpriority: Optional[str]) -> Optional[str]:
+    """
+    <picture> with `w`-descriptor srcsets over the role's width ladder (settings.IMAGE_WIDTH_LADDERS)
+    and its `sizes`, so the browser picks the smallest adequate file for the viewport and DPR.
+    None when no ladder variant exists yet or the role's aspect ratio doesn't fit the width x height
+    box (a square icon ladder in a 16:9 banner); callers then fall back to the fixed-size markup.
+    """
+    aspect_w, aspect_h = width_ladder(role)["aspect"]
+    if width and height and abs(aspect_w * height / (aspect_h * width) - 1) > 0.02:
+        return None
+    variants = _ladder_variants(name, role)
+    if not variants:
+        return None
+    sizes = width_ladder(role).get("sizes") or f"{width}px"
+    parts = ["<picture>"]
+    for mime, index in (("image/avif", 1), ("image/webp", 2)):
+        srcset = ", ".join(f"{v[index]} {v[0]}w" for v in variants if v[index])
+        if srcset:
+            parts.append(f'<source type="{mime}" srcset="{srcset}" sizes="{sizes}">')
+    # src for browsers without srcset support: the first variant covering the rendered box
+    fallback = next((v for v in variants if v[0] >= width), variants[-1])
+    img_src = fallback[2] or fallback[1]
+    fit = "contain" if width_ladder(role).get("mode") == "contain" else "cover"
+    width, height, ph_attr = _placeholder(name, img_src, None, width, height, fit)
+    fp_attr = f" fetchpriority=\"{fetchpriority}\"" if fetchpriority else ""
+    parts.append(
+        f"<img src=\"{img_src}\" alt=\"{alt}\" class=\"{classes}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}{ph_attr}>"
+    )
+    parts.append("</picture>")
+    return mark_safe("".join(parts))
+
 
 def _append_sources_for_breakpoint(parts, media_query: str, avif_url: Optional[str], webp_url: Optional[str]):
     if avif_url:
@@ -117,7 +214,8 @@ def product_card_picture(product, classes: str = "tm-card-img", alt: Optional[st
                          loading: str = "lazy", fetchpriority: Optional[str] = None):
     """
     Render a <picture> for product card (bestsellers). Prefers product.card_image if provided,
-    otherwise falls back to product.image. Uses size 230x160 for >=768px and 200x160 for default.
+    otherwise falls back to product.image. Emits the 'card' width ladder as srcset/sizes; until it is
+    generated, uses size 230x160 for >=768px and 200x160 for default.
     """
     alt_attr = alt or getattr(product, "name", "")
     class_attr = classes or "tm-card-img"
@@ -131,12 +229,17 @@ def product_card_picture(product, classes: str = "tm-card-img", alt: Optional[st
         )
 
     name = img_field.name
+    ladder = _ladder_picture(name, "card", alt=alt_attr, classes=class_attr, width=230, height=160,
+                             loading=loading, fetchpriority=fetchpriority)
+    if ladder:
+        return ladder
+
     # Desktop
-    avif_230 = _url_if_exists(_variant_name(name, "230x160", "avif"))
-    webp_230 = _url_if_exists(_variant_name(name, "230x160", "webp"))
+    avif_230 = _url_if_exists(_variant_name(name, "230x160", "avif"), name)
+    webp_230 = _url_if_exists(_variant_name(name, "230x160", "webp"), name)
     # Mobile/default
-    avif_200 = _url_if_exists(_variant_name(name, "200x160", "avif"))
-    webp_200 = _url_if_exists(_variant_name(name, "200x160", "webp"))
+    avif_200 = _url_if_exists(_variant_name(name, "200x160", "avif"), name)
+    webp_200 = _url_if_exists(_variant_name(name, "200x160", "webp"), name)
 
     parts = ["<picture>"]
     # >=768px first (will be ignored on smaller viewports)
@@ -153,9 +256,10 @@ def product_card_picture(product, classes: str = "tm-card-img", alt: Optional[st
     except Exception:
         orig_url = None
     img_src = webp_200 or avif_200 or webp_230 or avif_230 or orig_url or static("deps/images/placeholder.png")
+    width, height, ph_attr = _placeholder(name, img_src, orig_url, 230, 160)
     fp_attr = f" fetchpriority=\"{fetchpriority}\"" if fetchpriority else ""
     parts.append(
-        f"<img src=\"{img_src}\" alt=\"{alt_attr}\" class=\"{class_attr}\" width=\"230\" height=\"160\" loading=\"{loading}\" decoding=\"async\"{fp_attr}>"
+        f"<img src=\"{img_src}\" alt=\"{alt_attr}\" class=\"{class_attr}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}{ph_attr}>"
     )
     parts.append("</picture>")
     return mark_safe("".join(parts))
@@ -166,7 +270,8 @@ def responsive_product_picture(product, classes: str = "", alt: Optional[str] =
                                width: int = 800, height: int = 600,
                                loading: str = "lazy", fetchpriority: Optional[str] = None):
     """
-    Responsive <picture> for product main image with media breakpoints:
+    Responsive <picture> for product main image: the 'gallery' width ladder as srcset/sizes,
+    or (ladder not generated yet) media breakpoints:
       - (min-width: 1200px): 1200x900
       - (min-width: 992px): 1024x768
       - (min-width: 768px): 800x600
@@ -178,9 +283,7 @@ def responsive_product_picture(product, classes: str = "", alt: Optional[str] =
     img_field = getattr(product, "image", None)
     if not img_field or not getattr(img_field, "name", ""):
         try:
-            images = getattr(product, "images", None)
-            if images and images.exists():
-                img_field = images.first().image
+            img_field = _first_gallery_image(product) or img_field
         except Exception:
             pass
 
@@ -193,6 +296,10 @@ def responsive_product_picture(product, classes: str = "", alt: Optional[str] =
 
     name = img_field.name
     orig = _orig_url_safe(img_field)
+    ladder = _ladder_picture(name, "gallery", alt=alt_attr, classes=class_attr, width=width, height=height,
+                             loading=loading, fetchpriority=fetchpriority)
+    if ladder:
+        return ladder
 
     parts = ["<picture>"]
     # Desktop XL
@@ -217,9 +324,10 @@ def responsive_product_picture(product, classes: str = "", alt: Optional[str] =
         avif_s, webp_s = _best_variant_urls(name, "800x600")
         img_src = webp_s or avif_s or orig or static("deps/images/placeholder.png")
 
+    width, height, ph_attr = _placeholder(name, img_src, orig, width, height, "contain")
     fp_attr = f" fetchpriority=\"{fetchpriority}\"" if fetchpriority else ""
     parts.append(
-        f"<img src=\"{img_src}\" alt=\"{alt_attr}\" class=\"{class_attr}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}>"
+        f"<img src=\"{img_src}\" alt=\"{alt_attr}\" class=\"{class_attr}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}{ph_attr}>"
     )
     parts.append("</picture>")
     return mark_safe("".join(parts))
@@ -243,8 +351,8 @@ def category_best_img_src(category, size: str = "128x128") -> Optional[str]:
         name = img_field.name
         avif_name = _variant_name(name, size, "avif")
         webp_name = _variant_name(name, size, "webp")
-        webp_url = _url_if_exists(webp_name)
-        avif_url = _url_if_exists(avif_name)
+        webp_url = _url_if_exists(webp_name, name)
+        avif_url = _url_if_exists(avif_name, name)
         # Prefer modern src for <img>
         return webp_url or avif_url or orig_url
 
@@ -270,9 +378,11 @@ def category_best_img_src(category, size: str = "128x128") -> Optional[str]:
 
 @register.simple_tag
 def category_icon_picture(category, size: str = "128x128", classes: str = "", alt: Optional[str] = None,
-                          width: int = 128, height: int = 128, loading: str = "lazy", fetchpriority: Optional[str] = None):
+                          width: int = 128, height: int = 128, loading: str = "lazy", fetchpriority: Optional[str] = None,
+                          role: str = "icon"):
     """
     Render a <picture> for category.image with AVIF/WebP priority and fallback to original.
+    The role's width ladder (srcset/sizes) is used when generated, else the fixed `size` variant.
     Usage:
       {% category_icon_picture category '128x128' 'catalog-category-icon' category.name 128 128 %}
     """
@@ -290,11 +400,16 @@ def category_icon_picture(category, size: str = "128x128", classes: str = "", al
                 orig_url = None
 
         name = img_field.name
+        ladder = _ladder_picture(name, role, alt=alt_attr, classes=class_attr, width=width, height=height,
+                                 loading=loading, fetchpriority=fetchpriority)
+        if ladder:
+            return ladder
+
         avif_name = _variant_name(name, size, "avif")
         webp_name = _variant_name(name, size, "webp")
 
-        avif_url = _url_if_exists(avif_name)
-        webp_url = _url_if_exists(webp_name)
+        avif_url = _url_if_exists(avif_name, name)
+        webp_url = _url_if_exists(webp_name, name)
 
         if getattr(settings, 'DEBUG', False):
             logger.debug("category_icon_picture: name=%s size=%s avif=%s webp=%s orig=%s", name, size, bool(avif_url), bool(webp_url), bool(orig_url))
@@ -307,9 +422,10 @@ def category_icon_picture(category, size: str = "128x128", classes: str = "", al
         # Prefer modern fallback in <img>: webp -> avif -> original
         if orig_url or webp_url or avif_url:
             img_src = webp_url or avif_url or orig_url
+            width, height, ph_attr = _placeholder(name, img_src, orig_url, width, height)
             fp_attr = f" fetchpriority=\"{fetchpriority}\"" if fetchpriority else ""
             parts.append(
-                f"<img src=\"{img_src}\" alt=\"{alt_attr}\" class=\"{class_attr}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}>"
+                f"<img src=\"{img_src}\" alt=\"{alt_attr}\" class=\"{class_attr}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}{ph_attr}>"
             )
         parts.append("</picture>")
         return mark_safe("".join(parts))
@@ -358,11 +474,14 @@ def category_icon_picture(category, size: str = "128x128", classes: str = "", al
 
 @register.simple_tag
 def field_image_picture(image_field, size: str = "400x300", classes: str = "", alt: str = "",
-                        width: int = 400, height: int = 300, loading: str = "lazy", fetchpriority: Optional[str] = None):
+                        width: int = 400, height: int = 300, loading: str = "lazy", fetchpriority: Optional[str] = None,
+                        role: Optional[str] = None):
     """
     Render <picture> for arbitrary ImageField/FileField with AVIF/WebP priority and fallback.
+    With a role, its width ladder (srcset/sizes) is preferred over the fixed `size` variant.
     Usage:
       {% field_image_picture img.image '400x300' 'class' product.name 400 300 'lazy' %}
+      {% field_image_picture category.seo_image '800x450' 'class' category.name 800 450 'lazy' role='seo' %}
     """
     if not image_field or not getattr(image_field, "name", ""):
         fallback = static("deps/images/placeholder.png")
@@ -377,11 +496,17 @@ def field_image_picture(image_field, size: str = "400x300", classes: str = "", a
         orig_url = None
 
     name = image_field.name
+    if role:
+        ladder = _ladder_picture(name, role, alt=alt, classes=classes, width=width, height=height,
+                                 loading=loading, fetchpriority=fetchpriority)
+        if ladder:
+            return ladder
+
     avif_name = _variant_name(name, size, "avif")
     webp_name = _variant_name(name, size, "webp")
 
-    avif_url = _url_if_exists(avif_name)
-    webp_url = _url_if_exists(webp_name)
+    avif_url = _url_if_exists(avif_name, name)
+    webp_url = _url_if_exists(webp_name, name)
 
     if getattr(settings, 'DEBUG', False):
         logger.debug("field_image_picture: name=%s size=%s avif=%s webp=%s orig=%s", name, size, bool(avif_url), bool(webp_url), bool(orig_url))
@@ -393,8 +518,9 @@ def field_image_picture(image_field, size: str = "400x300", classes: str = "", a
         parts.append(f"<source srcset=\"{webp_url}\" type=\"image/webp\">")
     fp_attr = f" fetchpriority=\"{fetchpriority}\"" if fetchpriority else ""
     img_src = webp_url or avif_url or orig_url or static("deps/images/placeholder.png")
+    width, height, ph_attr = _placeholder(name, img_src, orig_url, width, height)
     parts.append(
-        f"<img src=\"{img_src}\" alt=\"{alt}\" class=\"{classes}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}>"
+        f"<img src=\"{img_src}\" alt=\"{alt}\" class=\"{classes}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}{ph_attr}>"
     )
     parts.append("</picture>")
     return mark_safe("".join(parts))
@@ -416,6 +542,11 @@ def responsive_field_picture(image_field, classes: str = "", alt: str = "",
 
     name = image_field.name
     orig = _orig_url_safe(image_field)
+    ladder = _ladder_picture(name, "gallery", alt=alt, classes=classes, width=width, height=height,
+                             loading=loading, fetchpriority=fetchpriority)
+    if ladder:
+        return ladder
+
     parts = ["<picture>"]
     avif, webp = _best_variant_urls(name, "1200x900"); _append_sources_for_breakpoint(parts, "(min-width: 1200px)", avif, webp)
     avif, webp = _best_variant_urls(name, "1024x768"); _append_sources_for_breakpoint(parts, "(min-width: 992px)", avif, webp)
@@ -428,9 +559,10 @@ def responsive_field_picture(image_field, classes: str = "", alt: str = "",
     if not img_src:
         avif_s, webp_s = _best_variant_urls(name, "800x600")
         img_src = webp_s or avif_s or orig or static("deps/images/placeholder.png")
+    width, height, ph_attr = _placeholder(name, img_src, orig, width, height, "contain")
     fp_attr = f" fetchpriority=\"{fetchpriority}\"" if fetchpriority else ""
     parts.append(
-        f"<img src=\"{img_src}\" alt=\"{alt}\" class=\"{classes}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}>"
+        f"<img src=\"{img_src}\" alt=\"{alt}\" class=\"{classes}\" width=\"{width}\" height=\"{height}\" loading=\"{loading}\" decoding=\"async\"{fp_attr}{ph_attr}>"
     )
     parts.append("</picture>")
     return mark_safe("".join(parts))
@@ -1,3 +1,600 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
+from django.urls import reverse
+from PIL import Image, ImageFilter
+
+from common.db import routers
+from common import image_quality
+from common import image_utils
+from common.image_utils import encoding_profile, generate_formats_noresize, generate_width_ladder
+from common.media_pipeline import process_image
+from common.testing import LOCMEM_CACHES, FakeS3, QueryBudgetMixin, seed_catalog
+from app.storage import DedupFileSystemStorage, S3MediaStorage
+from carts.models import Cart
+from goods import signals as goods_signals
+from goods.models import Categories, Products
+from goods.templatetags import media_extras
+from goods.utils import CATEGORIES_CACHE_KEY
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogViewTests(TestCase):
+    # categories come from the warm cache; one COUNT for the paginator and one page query
+    CATALOG_QUERIES = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.mushrooms = Categories.objects.create(name="Гриби", slug="griby", sort_order=1)
+        cls.prints = Categories.objects.create(name="Відбитки", slug="sporovi-vidbitki", sort_order=2)
+        cls.empty = Categories.objects.create(name="Порожня", slug="empty", sort_order=3)
+        for i in range(15):
+            Products.objects.create(
+                name=f"Гриб {i}", slug=f"grib-{i}", category=cls.mushrooms, quantity=5,
+                price=100, discount=10 if i % 2 else 0,
+            )
+        for i, species in enumerate(["cubensis", "cubensis", "panaeolus"]):
+            Products.objects.create(
+                name=f"Відбиток {i}", slug=f"vidbitok-{i}", category=cls.prints, quantity=1, species=species,
+            )
+
+    def setUp(self):
+        cache.clear()
+        # warm the category cache the same way the first visitor would
+        self.client.get(reverse("catalog:catalog_all"))
+
+    def test_category_page_query_budget(self):
+        with self.assertNumQueries(self.CATALOG_QUERIES):
+            response = self.client.get(reverse("catalog:index", args=["griby"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["current_category_obj"], self.mushrooms)
+        self.assertEqual(len(response.context["goods"]), 10)
+
+    def test_all_and_filtered_pages_query_budget(self):
+        for url in (
+            reverse("catalog:catalog_all"),
+            reverse("catalog:index", args=["all"]) + "?on_sale=1",
+            reverse("catalog:index", args=["griby"]) + "?page=2",
+            reverse("catalog:index", args=["griby"]) + "?order_by=-price",
+        ):
+            with self.subTest(url=url), self.assertNumQueries(self.CATALOG_QUERIES):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_all_has_no_category_object(self):
+        response = self.client.get(reverse("catalog:index", args=["all"]))
+        self.assertIsNone(response.context["current_category_obj"])
+        self.assertEqual(response.context["current_category"], "all")
+
+    def test_species_defaults_to_cubensis(self):
+        response = self.client.get(reverse("catalog:index", args=["sporovi-vidbitki"]))
+        self.assertEqual(response.context["species"], "cubensis")
+        self.assertEqual({p.species for p in response.context["goods"]}, {"cubensis"})
+
+        response = self.client.get(reverse("catalog:index", args=["sporovi-vidbitki"]) + "?species=Panaeolus")
+        self.assertEqual(response.context["species"], "panaeolus")
+        self.assertEqual(len(response.context["goods"]), 1)
+
+    def test_unknown_and_empty_categories_404(self):
+        self.assertEqual(self.client.get(reverse("catalog:index", args=["missing"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("catalog:index", args=["empty"])).status_code, 404)
+
+    def test_category_save_invalidates_cache(self):
+        self.assertIsNotNone(cache.get(CATEGORIES_CACHE_KEY))
+        Categories.objects.create(name="Нова", slug="nova")
+        self.assertIsNone(cache.get(CATEGORIES_CACHE_KEY))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GoodsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_catalog()
+
+    def setUp(self):
+        cache.clear()
+        self.client.get(reverse("catalog:catalog_all"))
+
+    def test_catalog_filters(self):
+        category = self.data["categories"][0]
+        for params in ("", "?on_sale=1", "?order_by=price", "?order_by=-price", "?page=3",
+                       "?species=panaeolus", "?on_sale=1&order_by=-price&page=2"):
+            for slug in ("all", category.slug):
+                url = reverse("catalog:index", args=[slug]) + params
+                with self.subTest(url=url), self.assertQueryBudget(2, 0.5):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_catalog_ajax_partial(self):
+        url = reverse("catalog:index", args=["all"]) + "?page=2"
+        with self.assertQueryBudget(2, 0.5):
+            response = self.client.get(url, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(response.status_code, 200)
+
+    def test_search(self):
+        for q in ("гриб", "spore print", str(self.data["products"][17].pk)):
+            url = reverse("catalog:search") + f"?q={q}"
+            with self.subTest(q=q), self.assertQueryBudget(2, 1.0):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_product_page(self):
+        # with and without a main image (the latter falls back to the gallery)
+        for product in self.data["products"][:2]:
+            url = product.get_absolute_url()
+            # product + category, gallery prefetch, related products
+            with self.subTest(url=url), self.assertQueryBudget(3, 0.5):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_product_page_with_gift_options(self):
+        product = self.data["products"][3]
+        Categories.objects.filter(pk=self.data["categories"][1].pk).update(slug="sporovi-vidbitki")
+        Products.objects.filter(pk=product.pk).update(gift_enabled=True)
+        with self.assertQueryBudget(5, 0.5):
+            response = self.client.get(product.get_absolute_url())
+        self.assertTrue(response.context["gift_options"])
+
+
+class GenerateSyntheticCatalogCommandTests(TestCase):
+    ARGS = ["--categories=2", "--products=30", "--users=3", "--anonymous-carts=4", "--orders=5",
+            "--no-files", "--prefix=cmd", "--force"]
+
+    def test_generate_and_purge_is_repeatable(self):
+        call_command("generate_synthetic_catalog", *self.ARGS, stdout=StringIO())
+        first = list(Products.objects.filter(slug__startswith="cmd-").order_by("slug").values_list("slug", "price"))
+        self.assertEqual(len(first), 30)
+
+        call_command("generate_synthetic_catalog", *self.ARGS, "--purge", stdout=StringIO())
+        second = list(Products.objects.filter(slug__startswith="cmd-").order_by("slug").values_list("slug", "price"))
+        self.assertEqual(first, second)
+
+    def test_refuses_without_debug(self):
+        with self.assertRaises(CommandError):
+            call_command("generate_synthetic_catalog", "--products=1", stdout=StringIO())
+
+
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    def _with_state(self, **state):
+        token = routers._state.set({"replica": False, "wrote": False, **state})
+        self.addCleanup(routers._state.reset, token)
+
+    def test_outside_marked_views_everything_reads_primary(self):
+        self.assertEqual(self.router.db_for_read(Products), "default")
+        self._with_state()
+        self.assertEqual(self.router.db_for_read(Products), "default")
+
+    def test_catalog_models_read_replica_until_a_write(self):
+        self._with_state(replica=True)
+        atomic = mock.patch.object(connections["default"], "in_atomic_block", False)
+        atomic.start()
+        self.addCleanup(atomic.stop)
+        self.assertEqual(self.router.db_for_read(Products), routers.REPLICA_ALIAS)
+        self.assertEqual(self.router.db_for_read(Cart), "default")
+
+        self.router.db_for_write(Cart)  # carts/sessions don't pin
+        self.assertEqual(self.router.db_for_read(Products), routers.REPLICA_ALIAS)
+        self.assertEqual(self.router.db_for_write(Products), "default")
+        self.assertEqual(self.router.db_for_read(Products), "default")
+
+    def test_transactions_read_primary(self):
+        self._with_state(replica=True)
+        # TestCase wraps every test in atomic(), like checkout's transaction
+        self.assertEqual(self.router.db_for_read(Products), "default")
+
+    def test_never_migrates_replica(self):
+        self.assertFalse(self.router.allow_migrate(routers.REPLICA_ALIAS, "goods"))
+        self.assertTrue(self.router.allow_migrate("default", "goods"))
+
+
+@skipUnless(routers.replica_configured(), "set DB_REPLICA_HOST (may point at the primary) to run")
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReplicaRoutingIntegrationTests(TransactionTestCase):
+    # TransactionTestCase: the replica connection can't see a TestCase's uncommitted data
+    databases = "__all__"
+
+    def setUp(self):
+        self.data = seed_catalog(products=30)
+
+    def _replica_queries(self, method, url, **kwargs):
+        with CaptureQueriesContext(connections[routers.REPLICA_ALIAS]) as ctx:
+            response = getattr(self.client, method)(url, **kwargs)
+        return response, len(ctx.captured_queries)
+
+    def test_catalog_reads_replica_cart_and_pinned_clients_primary(self):
+        response, on_replica = self._replica_queries("get", reverse("catalog:catalog_all"))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(on_replica, 0)
+
+        product = self.data["products"][1]
+        response, on_replica = self._replica_queries("post", reverse("carts:cart_add"), data={"product_id": product.pk})
+        self.assertEqual(on_replica, 0)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+        # the pin cookie is now set on the client
+        _, on_replica = self._replica_queries("get", reverse("catalog:catalog_all"))
+        self.assertEqual(on_replica, 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class WidthLadderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_extras._image_meta_cache.clear()
+        self.media = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media)
+        media = override_settings(MEDIA_ROOT=self.media, MEDIA_URL="/media/")
+        media.enable()
+        self.addCleanup(media.disable)
+        (self.media / "goods_images").mkdir()
+
+    def _image(self, name, size):
+        Image.new("RGB", size, (120, 60, 30)).save(self.media / name)
+        return str(self.media / name)
+
+    def test_ladder_skips_upscaling_but_keeps_smallest(self):
+        created = generate_width_ladder(self._image("goods_images/big.png", (800, 600)), "card")
+        self.assertEqual(list(created), ["200x139", "230x160", "320x223", "460x320", "690x480"])
+        created = generate_width_ladder(self._image("goods_images/small.png", (300, 225)), "gallery")
+        self.assertEqual(list(created), ["400x300"])
+        with Image.open(created["400x300"]["webp"]) as img:
+            self.assertEqual(img.size, (400, 300))
+
+    def test_category_banner_never_uses_the_square_icon_ladder(self):
+        generate_width_ladder(self._image("goods_images/cat.png", (1600, 900)), "icon")
+        field = SimpleNamespace(name="goods_images/cat.png", url="/media/goods_images/cat.png")
+        context = Context({"category": SimpleNamespace(image=field, name="C")})
+        banner = "{% load media_extras %}{% category_icon_picture category '800x450' '' 'C' 800 450 'lazy' ROLE %}"
+
+        html = Template(banner.replace(" ROLE", "")).render(context)
+        self.assertNotIn("384x384", html)
+        self.assertIn('src="/media/goods_images/cat.png"', html)
+
+        generate_width_ladder(str(self.media / "goods_images/cat.png"), "seo")
+        html = Template(banner.replace("ROLE", "role='seo'")).render(context)
+        self.assertIn("goods_images/cat_800x450.webp 800w", html)
+        self.assertNotIn("384x384", html)
+
+    def test_card_picture_emits_w_descriptors_and_sizes(self):
+        template = Template("{% load media_extras %}{% product_card_picture product 'tm-card-img' 'P' 'lazy' %}")
+        field = SimpleNamespace(name="goods_images/card.png", url="/media/goods_images/card.png")
+        product = SimpleNamespace(card_image=None, image=field, name="P")
+
+        legacy = template.render(Context({"product": product}))
+        self.assertNotIn(" 230w", legacy)
+
+        generate_width_ladder(self._image("goods_images/card.png", (500, 400)), "card")
+        html = template.render(Context({"product": product}))
+        self.assertIn("/media/goods_images/card_230x160.webp 230w, /media/goods_images/card_320x223.webp 320w, "
+                      "/media/goods_images/card_460x320.webp 460w", html)
+        self.assertNotIn("690w", html)
+        self.assertIn('sizes="(min-width: 768px) 230px, 50vw"', html)
+        self.assertIn('src="/media/goods_images/card_230x160.webp"', html)
+
+    def test_placeholder_and_intrinsic_size(self):
+        path = self._image("goods_images/photo.png", (600, 300))
+        generate_formats_noresize(path, overwrite=True)
+        with open(self.media / "goods_images/photo.meta.json") as f:
+            meta = json.load(f)
+        self.assertEqual((meta["width"], meta["height"]), (600, 300))
+        self.assertTrue(meta["lqip"].startswith("data:image/webp;base64,"))
+        self.assertLess(len(meta["lqip"]), 400)
+
+        # only the no-resize formats exist: <img> shows the full image, so its height follows 2:1
+        field = SimpleNamespace(name="goods_images/photo.png", url="/media/goods_images/photo.png")
+        html = Template(
+            "{% load media_extras %}{% field_image_picture field '400x300' '' 'P' 400 300 %}"
+        ).render(Context({"field": field}))
+        self.assertIn('width="400" height="200"', html)
+        self.assertIn(f'style="background:url({meta["lqip"]}) center/cover no-repeat"', html)
+
+        # transparency would show the blur through the image: no placeholder
+        Image.new("RGBA", (64, 64), (0, 0, 0, 0)).save(self.media / "goods_images/icon.png")
+        generate_formats_noresize(str(self.media / "goods_images/icon.png"))
+        with open(self.media / "goods_images/icon.meta.json") as f:
+            self.assertIsNone(json.load(f)["lqip"])
+
+
+def _textured(size=(240, 180)):
+    """Deterministic detail (gradients + stripes) so the encoder quality actually matters."""
+    img = Image.new("RGB", size)
+    img.putdata([((x * 7) % 256, (y * 5 + x) % 256, ((x // 6 + y // 6) % 2) * 200) for y in range(size[1]) for x in range(size[0])])
+    return img
+
+
+class SsimTargetTests(TestCase):
+    def setUp(self):
+        self.media = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media)
+
+    def test_ssim_scores(self):
+        img = _textured()
+        self.assertAlmostEqual(image_quality.ssim(img, img), 1.0)
+        self.assertLess(image_quality.ssim(img, img.filter(ImageFilter.GaussianBlur(2))), 0.9)
+        with self.assertRaises(ValueError):
+            image_quality.ssim(img, img.resize((120, 90)))
+
+    def test_encode_to_target_picks_lowest_passing_quality(self):
+        img = _textured()
+        result = image_quality.encode_to_target(img, "webp", 0.95, baseline_quality=90)
+        self.assertGreaterEqual(result.ssim, 0.95)
+        self.assertLess(result.quality, 90)
+        self.assertLessEqual(result.size, result.baseline_size)
+        self.assertGreater(result.saved_bytes, 0)
+        lower = Image.open(BytesIO(image_quality.encode(img, "webp", result.quality - 1)))
+        self.assertLess(image_quality.ssim(img, lower), 0.95)
+
+        # unreachable target: the top of the range
+        top = image_quality.encode_to_target(img, "webp", 1.01, baseline_quality=80)
+        self.assertEqual(top.quality, image_quality.QUALITY_RANGE["webp"][1])
+
+    def test_pipeline_records_chosen_quality_in_sidecar(self):
+        (self.media / "goods_images").mkdir()
+        path = self.media / "goods_images/texture.png"
+        _textured().save(path)
+        with override_settings(MEDIA_ROOT=self.media, IMAGE_SSIM_TARGET=0.95):
+            generate_formats_noresize(str(path), overwrite=True)
+            generate_width_ladder(str(path), "icon")
+        with open(self.media / "goods_images/texture.meta.json") as f:
+            meta = json.load(f)
+        webp = meta["encodings"]["webp"]
+        self.assertGreaterEqual(webp["ssim"], 0.95)
+        self.assertEqual(webp["baseline_quality"], 80)
+        self.assertEqual(set(webp), {"format", "quality", "ssim", "size", "baseline_quality", "baseline_size"})
+        with Image.open(self.media / "goods_images/texture.webp") as img:
+            self.assertEqual(img.size, (240, 180))
+
+
+class BenchmarkImagesCommandTests(TestCase):
+    def test_reports_matrix_for_sampled_sources(self):
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root)
+        _textured((120, 90)).save(root / "a.png")
+        _textured((90, 120)).save(root / "b.jpg")
+        _textured((46, 32)).save(root / "a_230x160.png")  # generated variant, not a source
+        out = root / "report"
+
+        stdout = StringIO()
+        call_command("benchmark_images", str(root), "--formats", "webp,jpeg", "--qualities", "50,80",
+                     "--webp-methods", "4,6", "--repeat", "1", "--output", str(out), stdout=stdout)
+
+        with open(out / "results.csv", newline="") as f:
+            rows = list(csv.DictReader(f))
+        # 2 images x (webp: 2 qualities x 2 methods + jpeg: 2 qualities)
+        self.assertEqual(len(rows), 12)
+        self.assertEqual({r["image"] for r in rows}, {"a.png", "b.jpg"})
+        for r in rows:
+            self.assertGreater(int(r["bytes"]), 0)
+            self.assertGreater(float(r["ssim"]), 0.5)
+        with open(out / "summary.csv", newline="") as f:
+            self.assertEqual(len(list(csv.DictReader(f))), 6)
+        html = (out / "report.html").read_text()
+        self.assertIn("<h2>Per setting (mean over images)</h2>", html)
+        self.assertIn("📊", stdout.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command("benchmark_images", str(root), "--formats", "gif", stdout=StringIO())
+        for empty in (["--qualities", ""], ["--formats", "webp", "--webp-methods", ""]):
+            with self.subTest(empty=empty), self.assertRaisesMessage(CommandError, "Nothing to benchmark"):
+                call_command("benchmark_images", str(root), *empty, stdout=StringIO())
+
+
+class EncodingProfileTests(TestCase):
+    def test_profiles_select_encoder_effort(self):
+        with override_settings(IMAGE_ENCODING_PROFILE="interactive"):
+            self.assertEqual(image_utils.avif_options(), {"speed": 8, "max_threads": 2, "subsampling": "4:2:0"})
+            self.assertEqual(image_utils.webp_options(), {"method": 4})
+            with encoding_profile("archival"):
+                self.assertEqual(image_utils.avif_options()["speed"], 4)
+                self.assertEqual(image_utils.avif_options()["max_threads"], os.cpu_count())
+                self.assertEqual(image_utils.webp_options(), {"method": 6})
+            self.assertEqual(image_utils.webp_options(), {"method": 4})
+        with self.assertRaises(ValueError):
+            with encoding_profile("turbo"):
+                pass
+
+    def test_admin_saves_encode_interactive(self):
+        seen = []
+        with override_settings(IMAGE_ENCODING_PROFILE="archival"), \
+                mock.patch("goods.signals.process_image",
+                           side_effect=lambda *a, **kw: seen.append(image_utils.webp_options()["method"])):
+            product = SimpleNamespace(image=SimpleNamespace(name="goods_images/p.png"), card_image=None)
+            goods_signals.products_generate_image_variants(Products, product)
+        self.assertEqual(seen, [4])
+
+
+@override_settings(IMAGE_MAX_EDGE=1000, IMAGE_MAX_PIXELS=20_000_000)
+class BoundedIngestTests(TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def _jpeg(self, name, size, orientation=None):
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        exif[0x010F] = "PhoneMaker"
+        path = self.dir / name
+        _textured(size).save(path, quality=90, exif=exif.tobytes())
+        return str(path)
+
+    def test_large_jpeg_decodes_in_draft_mode_within_max_edge(self):
+        path = self._jpeg("big.jpg", (3600, 2700))
+        decoded = []
+        thumbnail = Image.Image.thumbnail
+
+        def spy(im, *args, **kwargs):
+            decoded.append(im.size)
+            return thumbnail(im, *args, **kwargs)
+
+        with mock.patch.object(Image.Image, "thumbnail", spy):
+            img = image_utils._open_image(path)
+        self.assertEqual(img.size, (1000, 750))
+        # DCT scaling already brought 3600x2700 down to 1800x1350 before the resample
+        self.assertEqual(decoded, [(1800, 1350)])
+        self.assertNotIn("exif", img.info)
+
+        generate_formats_noresize(path, overwrite=True)
+        with Image.open(self.dir / "big.webp") as webp:
+            self.assertEqual(webp.size, (1000, 750))
+
+    def test_exif_orientation_and_pixel_limit(self):
+        img = image_utils.open_bounded(self._jpeg("rotated.jpg", (300, 200), orientation=6))
+        self.assertEqual(img.size, (200, 300))
+        with override_settings(IMAGE_MAX_PIXELS=50_000):
+            with self.assertRaises(image_utils.ImageTooLarge):
+                image_utils.open_bounded(self._jpeg("small.jpg", (300, 200)))
+
+    def test_upload_validator_reads_header_only(self):
+        from django.core.exceptions import ValidationError
+
+        with open(self._jpeg("upload.jpg", (300, 200)), "rb") as f:
+            image_utils.validate_image_upload(f)
+            with override_settings(IMAGE_MAX_PIXELS=50_000), self.assertRaises(ValidationError):
+                image_utils.validate_image_upload(f)
+            self.assertEqual(f.tell(), 0)
+
+    def test_normalize_original_rewrites_once(self):
+        path = self._jpeg("phone.jpg", (3000, 2000), orientation=6)
+        self.assertTrue(image_utils.normalize_original(path))
+        with Image.open(path) as img:
+            self.assertEqual(img.size, (667, 1000))
+            self.assertNotIn("exif", img.info)
+        self.assertFalse(image_utils.normalize_original(path))
+
+
+@override_settings(IMAGE_MAX_EDGE=1000, IMAGE_SSIM_TARGET=None)
+class MediaPipelineTests(TestCase):
+    def setUp(self):
+        media_extras._image_meta_cache.clear()
+        self.s3 = FakeS3()
+        self.storage = S3MediaStorage(endpoint="http://s3.test", bucket="media", access_key="key", secret_key="secret",
+                                      public_url="https://cdn.test", transport=self.s3.transport)
+
+    def _upload(self, name, img, **save_kwargs):
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=90, **save_kwargs)
+        return self.storage.save(name, ContentFile(buf.getvalue()))
+
+    def test_variants_are_generated_in_the_bucket_with_one_listing(self):
+        name = self._upload("goods_images/p.jpg", _textured((500, 400)))
+        self.s3.requests.clear()
+        result = process_image(name, roles=("card",), storage=self.storage)
+
+        formats = ["avif", "webp"] if image_utils.AVIF_AVAILABLE else ["webp"]
+        expected = [f"p{size}.{fmt}" for size in ["", "_200x139", "_230x160", "_320x223", "_460x320"] for fmt in formats]
+        self.assertEqual(result["variants"], sorted(expected))
+        self.assertEqual(self.s3.requests[("GET", "list")], 1)
+        self.assertEqual(self.s3.requests[("GET", "object")], 1)  # the original, once
+        self.assertEqual(self.s3.requests[("HEAD", "object")], 0)
+        with Image.open(BytesIO(self.s3.objects["goods_images/p_230x160.webp"][0])) as img:
+            self.assertEqual(img.size, (230, 160))
+        meta = json.loads(self.s3.objects["goods_images/p.meta.json"][0])
+        self.assertEqual((meta["width"], meta["height"], meta["variants"]), (500, 400, result["variants"]))
+
+        # everything there: the listing and the sidecar, nothing decoded or written
+        self.s3.requests.clear()
+        self.assertEqual(process_image(name, roles=("card",), storage=self.storage)["written"], [])
+        self.assertEqual(dict(self.s3.requests), {("GET", "list"): 1, ("GET", "object"): 1})
+
+        # a new role only adds its ladder
+        written = process_image(name, roles=("card", "icon"), noresize=False, storage=self.storage)["written"]
+        self.assertEqual(sorted(written), sorted(f"goods_images/p_{s}.{fmt}" for s in ["128x128", "256x256", "384x384"]
+                                                 for fmt in formats))
+
+    def test_templates_read_the_variant_list_instead_of_probing(self):
+        name = self._upload("goods_images/card.jpg", _textured((500, 400)))
+        process_image(name, roles=("card",), storage=self.storage)
+        self.s3.requests.clear()
+        field = SimpleNamespace(name=name, url="https://cdn.test/goods_images/card.jpg")
+        product = SimpleNamespace(card_image=None, image=field, name="P")
+        with mock.patch.object(media_extras, "default_storage", self.storage):
+            html = Template("{% load media_extras %}{% product_card_picture product %}").render(Context({"product": product}))
+        self.assertIn("https://cdn.test/goods_images/card_230x160.webp 230w", html)
+        self.assertNotIn("690w", html)
+        self.assertEqual(dict(self.s3.requests), {("GET", "object"): 1})  # the sidecar
+
+    def test_batch_commands_work_on_the_bucket(self):
+        formats = ["avif", "webp"] if image_utils.AVIF_AVAILABLE else ["webp"]
+        icon = self._upload("categories_images/c.jpg", _textured((300, 200)))
+        photo = self._upload("products/p.jpg", _textured((900, 700)))
+        category = Categories.objects.create(name="C", slug="c")
+        product = Products.objects.create(name="P", slug="p", category=category)
+        # update(): no post_save, which would generate against the local media
+        Categories.objects.filter(pk=category.pk).update(image=icon)
+        Products.objects.filter(pk=product.pk).update(image=photo)
+
+        with mock.patch("common.media_pipeline.default_storage", self.storage), \
+                mock.patch("goods.management.commands.regenerate_avif_optimized.default_storage", self.storage):
+            call_command("generate_category_icons", stdout=StringIO(), stderr=StringIO())
+            call_command("generate_card_images", stdout=StringIO(), stderr=StringIO())
+            call_command("convert_product_images", "--sizes", "400x300", stdout=StringIO(), stderr=StringIO())
+            out = StringIO()
+            call_command("regenerate_avif_optimized", stdout=out)
+            self.assertIn("Processed: 1 items", out.getvalue())  # only 800x600 was missing
+            self.s3.requests.clear()
+            call_command("generate_card_images", "--only-missing", stdout=StringIO(), stderr=StringIO())
+            self.assertEqual(self.s3.requests[("PUT", "object")], 0)
+
+        for name in [f"categories_images/c_128x128.{fmt}" for fmt in formats] + [
+            f"products/p_{size}.{fmt}" for size in ["230x160", "200x160", "400x300", "800x600"] for fmt in formats
+        ]:
+            self.assertIn(name, self.s3.objects)
+        with Image.open(BytesIO(self.s3.objects["categories_images/c_128x128.webp"][0])) as img:
+            self.assertEqual(img.size, (128, 128))
+        self.assertIn("p_800x600.webp", json.loads(self.s3.objects["products/p.meta.json"][0])["variants"])
+
+    def test_generate_original_formats_counts_only_written_files(self):
+        photo = self._upload("products/o.jpg", _textured((300, 200)))
+        product = Products.objects.create(name="O", slug="o", category=Categories.objects.create(name="C", slug="c"))
+        Products.objects.filter(pk=product.pk).update(image=photo)
+        with mock.patch("common.media_pipeline.default_storage", self.storage):
+            first, second = StringIO(), StringIO()
+            call_command("generate_original_formats", stdout=first)
+            call_command("generate_original_formats", stdout=second)
+        self.assertIn("Created WebP:      1", first.getvalue())
+        self.assertIn("Created WebP:      0", second.getvalue())
+        self.assertIn("products/o.webp", self.s3.objects)
+
+    @override_settings(IMAGE_NORMALIZE_ORIGINALS=True)
+    def test_admin_save_normalizes_and_generates_through_default_storage(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees
+        name = self._upload("goods_images/phone.jpg", _textured((1600, 1200)), exif=exif.tobytes())
+        product = SimpleNamespace(image=SimpleNamespace(name=name), card_image=None)
+        with mock.patch("common.media_pipeline.default_storage", self.storage):
+            goods_signals.products_generate_image_variants(Products, product)
+
+        with Image.open(BytesIO(self.s3.objects[name][0])) as img:
+            self.assertEqual(img.size, (750, 1000))
+            self.assertNotIn(0x0112, img.getexif())
+        self.assertIn("goods_images/phone_400x300.webp", self.s3.objects)  # gallery ladder
+        self.assertIn("goods_images/phone_230x160.webp", self.s3.objects)  # card ladder
+
+    def test_content_addressed_originals_keep_variant_names(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        storage = DedupFileSystemStorage(location=media)
+        buf = BytesIO()
+        _textured((300, 300)).save(buf, format="PNG")
+        name = storage.save("categories_images/c.png", ContentFile(buf.getvalue()))
+        process_image(name, roles=("icon",), noresize=False, storage=storage)
+        root = name[:-len(".png")]
+        self.assertTrue(storage.exists(f"{root}_128x128.webp"))
+        self.assertTrue(storage.exists(f"{root}_256x256.webp"))
+        self.assertFalse(storage.exists(f"{root}_384x384.webp"))  # no upscaling
+        self.assertEqual(len(list(Path(media, "cas").rglob("*.png"))), 1)
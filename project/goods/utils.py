@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.db.models import Q
 from django.contrib.postgres.search import (
     SearchVector,
@@ -6,7 +7,82 @@ from django.contrib.postgres.search import (
     SearchHeadline,
 )
 
-from goods.models import Products
+from goods.models import Categories, Products
+
+
+CATEGORIES_CACHE_KEY = 'categories_ordered'
+CATEGORIES_CACHE_TIMEOUT = 1800  # 30 minutes
+
+SPECIES_VALUES = ('cubensis', 'panaeolus')
+# Категории с мягким разделением по виду и вид по умолчанию
+DEFAULT_SPECIES = {'sporovi-vidbitki': 'cubensis'}
+
+
+def get_cached_categories():
+    """Ordered list of categories, cached to avoid repeated DB hits."""
+    categories = cache.get(CATEGORIES_CACHE_KEY)
+    if categories is None:
+        categories = list(Categories.objects.order_by('sort_order', 'name'))
+        cache.set(CATEGORIES_CACHE_KEY, categories, CATEGORIES_CACHE_TIMEOUT)
+    return categories
+
+
+def invalidate_cached_categories():
+    cache.delete(CATEGORIES_CACHE_KEY)
+
+
+class CatalogState:
+    """
+    Request-scoped catalog state: normalized filters plus the category resolved
+    from the cached category map. Built once per request and shared by
+    CatalogView.get_queryset() and get_context_data().
+    """
+
+    def __init__(self, category_slug, params):
+        self.category_slug = category_slug or 'all'
+        self.query = (params.get('q') or '').strip()
+        self.on_sale = bool(params.get('on_sale'))
+        order_by = params.get('order_by')
+        self.order_by = order_by if order_by and order_by != 'default' else None
+
+        species = (params.get('species') or '').strip().lower()
+        if not species:
+            species = DEFAULT_SPECIES.get(self.category_slug, '')
+        self.species = species if species in SPECIES_VALUES else ''
+
+        self.categories = get_cached_categories()
+        self.category = None
+        if self.category_slug != 'all':
+            self.category = next((c for c in self.categories if c.slug == self.category_slug), None)
+
+    @classmethod
+    def from_request(cls, request, category_slug=None):
+        return cls(category_slug, request.GET)
+
+    @property
+    def is_unknown_category(self):
+        """True when a concrete category slug was requested but does not exist."""
+        return self.category_slug != 'all' and self.category is None
+
+    def get_queryset(self):
+        if self.query:
+            goods = q_search(self.query)
+        elif self.category is not None:
+            goods = Products.objects.filter(category_id=self.category.pk)
+        else:
+            goods = Products.objects.all()
+
+        # Soft subdivision for 'Спорові відбитки': filter by species when provided or defaulted
+        if self.species:
+            goods = goods.filter(species=self.species)
+
+        if self.on_sale:
+            goods = goods.filter(discount__gt=0)
+
+        if self.order_by:
+            goods = goods.order_by(self.order_by)
+
+        return goods
 
 
 def q_search(query):
@@ -1,85 +1,51 @@
 from django.http import Http404
 from django.shortcuts import render
+from django.utils.functional import cached_property
 from django.views.generic import DetailView, ListView
 
 from .models import Products, Categories
-from .utils import q_search
-from django.core.cache import cache
+from .utils import CatalogState, get_cached_categories
 
 
 class CatalogView(ListView):
     model = Products
     template_name = "goods/catalog.html"
     context_object_name = "goods"
+    replica_reads = True  # read-only: may use the replica (common.db.routers)
     paginate_by = 10
     allow_empty = False
     slug_url_kwarg = "category_slug"
 
+    @cached_property
+    def catalog_state(self):
+        return CatalogState.from_request(self.request, self.kwargs.get(self.slug_url_kwarg))
+
+    def get(self, request, *args, **kwargs):
+        # With allow_empty=False the paginator already raises 404 on an empty first page
+        # (its count query), so ListView's extra exists() round-trip is skipped.
+        self.object_list = self.get_queryset()
+        context = self.get_context_data()
+        return self.render_to_response(context)
+
     def get_queryset(self):
-        # Base queryset with prefetch of related images to avoid N+1 in templates
-        base_qs = Products.objects.all().prefetch_related('images')
-
-        category_slug = self.kwargs.get(self.slug_url_kwarg)
-        species = (self.request.GET.get("species") or "").strip().lower()
-        # Default to cubensis for 'sporovi-vidbitki' when no explicit filter provided
-        if (category_slug == 'sporovi-vidbitki') and not species:
-            species = 'cubensis'
-        on_sale = self.request.GET.get("on_sale")
-        order_by = self.request.GET.get("order_by")
-        query = self.request.GET.get("q")
-
-        # Text search (ensure prefetch is preserved if q_search returns a queryset)
-        if query:
-            goods = q_search(query)
-            try:
-                goods = goods.prefetch_related('images')
-            except AttributeError:
-                goods = base_qs.none()
-        else:
-            if not category_slug or category_slug == "all":
-                goods = base_qs
-            else:
-                goods = base_qs.filter(category__slug=category_slug)
-                if not goods.exists():
-                    raise Http404()
-
-        # Soft subdivision for 'Спорові відбитки': filter by species when provided or defaulted
-        if species in ("cubensis", "panaeolus"):
-            goods = goods.filter(species=species)
-
-        if on_sale:
-            goods = goods.filter(discount__gt=0)
-
-        if order_by and order_by != "default":
-            goods = goods.order_by(order_by)
-
-        return goods
+        state = self.catalog_state
+        if state.is_unknown_category and not state.query:
+            raise Http404()
+        return state.get_queryset()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        state = self.catalog_state
         context["title"] = "Home - Каталог"
         context["slug_url"] = self.kwargs.get(self.slug_url_kwarg)
-        # Cache categories list to avoid repeated DB hits
-        categories = cache.get('categories_ordered')
-        if categories is None:
-            categories = Categories.objects.order_by('sort_order', 'name')
-            cache.set('categories_ordered', categories, 1800)  # 30 minutes
-        context["categories"] = categories
-        context['current_category'] = self.kwargs.get(self.slug_url_kwarg, 'all')
+        context["categories"] = state.categories
+        context['current_category'] = state.category_slug
         # Provide selected category object (for image + description presentation)
-        current_slug = context['current_category']
-        context['current_category_obj'] = None
-        if current_slug:
-            context['current_category_obj'] = Categories.objects.filter(slug=current_slug).first()
-
+        context['current_category_obj'] = state.category
         # Expose active species in context (default to cubensis for 'sporovi-vidbitki')
-        species = (self.request.GET.get("species") or "").strip().lower()
-        if current_slug == 'sporovi-vidbitki' and not species:
-            species = 'cubensis'
-        context['species'] = species
+        context['species'] = state.species
         return context
 
-
     def render_to_response(self, context, **response_kwargs):
         # Если AJAX — возвращаем только partial с товарами
         if self.request.headers.get('x-requested-with') == 'XMLHttpRequest':
@@ -91,10 +57,12 @@ class ProductView(DetailView):
     model = Products
     template_name = "goods/product.html"
     context_object_name = "product"
+    replica_reads = True  # read-only: may use the replica (common.db.routers)
     slug_url_kwarg = "product_slug"
 
     def get_queryset(self):
-        return super().get_queryset().prefetch_related('images')
+        # category is rendered in the breadcrumbs and used for related products
+        return super().get_queryset().select_related('category').prefetch_related('images')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -132,9 +100,10 @@ class CategoriesView(ListView):
     model = Categories
     template_name = 'goods/categories.html'
     context_object_name = 'categories'
+    replica_reads = True  # read-only: may use the replica (common.db.routers)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["title"] = "Все категории"
-        context["categories"] = Categories.objects.order_by('sort_order', 'name')
+        context["categories"] = get_cached_categories()
         return context
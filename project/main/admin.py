@@ -0,0 +1,40 @@
+import json
+
+from django.contrib import admin
+from django.utils.html import format_html
+
+from main.models import SlowQuery
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ("source", "short_sql", "count", "avg_ms", "max_ms", "plan_summary", "last_seen")
+    list_filter = ("source",)
+    search_fields = ("sql", "source", "plan_summary")
+    readonly_fields = ("fingerprint", "source", "sql", "count", "avg_ms", "max_ms", "plan_summary",
+                       "explain_pretty", "first_seen", "last_seen")
+    exclude = ("explain", "total_time", "max_time")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Запрос")
+    def short_sql(self, obj):
+        return obj.sql[:120]
+
+    @admin.display(description="Среднее, мс", ordering="total_time")
+    def avg_ms(self, obj):
+        return round(obj.avg_time * 1000, 1)
+
+    @admin.display(description="Макс., мс", ordering="max_time")
+    def max_ms(self, obj):
+        return round(obj.max_time * 1000, 1)
+
+    @admin.display(description="EXPLAIN")
+    def explain_pretty(self, obj):
+        if obj.explain is None:
+            return "—"
+        return format_html("<pre>{}</pre>", json.dumps(obj.explain, indent=2, ensure_ascii=False))
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        # Perf sampling and the slow-query log: attach their execute wrappers to every new DB connection
+        from django.db.backends.signals import connection_created
+
+        from common import perf, slow_queries
+        connection_created.connect(perf.install, dispatch_uid="common.perf.install")
+        connection_created.connect(slow_queries.install, dispatch_uid="common.slow_queries.install")
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common import assets
+
+
+class Command(BaseCommand):
+    help = (
+        "Concatenate and minify the CSS/JS bundles from settings.ASSET_BUNDLES into hashed files\n"
+        "and extract critical CSS per page template. Run before collectstatic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("bundles", nargs="*", help="Bundle names (default: all)")
+
+    def handle(self, *args, **options):
+        names = options["bundles"]
+        unknown = set(names) - set(getattr(settings, "ASSET_BUNDLES", {}))
+        if unknown:
+            raise CommandError(f"Unknown bundles: {', '.join(sorted(unknown))}")
+
+        self.stdout.write(f"🔄 Building bundles into {assets.build_dir() / assets.BUNDLE_SUBDIR}")
+        try:
+            manifest = assets.build_all(names or None)
+        except FileNotFoundError as exc:
+            raise CommandError(str(exc))
+
+        for name in names or manifest:
+            entry = manifest[name]
+            parts = []
+            if "css" in entry:
+                parts.append(f"css {entry['css_size'] / 1024:.1f} KB")
+                if entry.get("critical") is not None:
+                    parts.append(f"critical {len(entry['critical'].encode('utf-8')) / 1024:.1f} KB")
+            if "js" in entry:
+                parts.append(f"js {entry['js_size'] / 1024:.1f} KB")
+            self.stdout.write(f"   ✅ {name}: {', '.join(parts)}")
+
+        if not getattr(settings, "ASSET_BUNDLES_ENABLED", False):
+            self.stdout.write("💡 ASSET_BUNDLES is off (DEBUG): templates still link the source files")
+        if str(assets.build_dir()) not in {str(d) for d in settings.STATICFILES_DIRS}:
+            self.stdout.write("💡 Run collectstatic in a new process: ASSET_BUILD_DIR is added to STATICFILES_DIRS at startup")
+        self.stdout.write(self.style.SUCCESS("📊 Done"))
@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions in small batches (replacement for `clearsessions` on large\n"
+        "django_session tables: no single long DELETE, no long lock)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per DELETE (default: 5000)")
+        parser.add_argument("--sleep", type=float, default=0.0, help="Pause between batches, seconds (default: 0)")
+        parser.add_argument("--dry-run", action="store_true", help="Only count expired sessions")
+
+    def handle(self, *args, **options):
+        if not settings.SESSION_ENGINE.endswith(("backends.db", "backends.cached_db")):
+            self.stdout.write(f"ℹ️ SESSION_ENGINE={settings.SESSION_ENGINE} does not store sessions in the DB, nothing to do")
+            return
+
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now)
+        if options["dry_run"]:
+            self.stdout.write(f"🔍 Expired sessions: {expired.count()}")
+            return
+
+        batch_size = max(1, options["batch_size"])
+        total = 0
+        started = time.perf_counter()
+        while True:
+            keys = list(expired.values_list("session_key", flat=True)[:batch_size])
+            if not keys:
+                break
+            with transaction.atomic():
+                deleted, _ = Session.objects.filter(session_key__in=keys, expire_date__lt=now).delete()
+            total += deleted
+            self.stdout.write(f"   ✅ deleted {deleted} (total {total})")
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"📊 Deleted {total} expired sessions in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import os
+import posixpath
+import shutil
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from app.storage import DedupFileSystemStorage, content_digest, file_fields
+from common.image_utils import is_generated_from
+
+
+def _link(src: str, dst: str) -> None:
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:  # other filesystem / no hard links
+        shutil.copy2(src, dst)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move existing uploads into the content-addressed media storage (app.storage.DedupFileSystemStorage):\n"
+        "every image field is pointed at cas/<hash>.<ext>, duplicates share one file, and the variants\n"
+        "already generated for the first copy are reused. Run gc_media afterwards to drop the old names.\n"
+        "Fields uploading under a MEDIA_ACCESS_RULES prefix (avatars) stay out of the public cas/ and are\n"
+        "moved back under their upload_to if an earlier run put them there."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report duplicates and the bytes they take")
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not isinstance(storage, DedupFileSystemStorage):
+            raise CommandError("DEFAULT_FILE_STORAGE is not app.storage.DedupFileSystemStorage")
+        dry_run = options["dry_run"]
+
+        blobs: dict[str, str] = {}  # old name -> blob name
+        adopted: set[str] = set()
+        released: set[str] = set()  # blobs private fields were moved out of
+        files = unique = duplicate_bytes = missing = restored = 0
+        for model, fields in file_fields():
+            private = self._private_fields(storage, model, fields)
+            for row in model._base_manager.values_list("pk", *fields).iterator():
+                updates = {}
+                for field, name in zip(fields, row[1:]):
+                    if field in private:
+                        if name and name.startswith(f"{storage.dedup_prefix}/") and storage.exists(name):
+                            restored += 1
+                            if not dry_run:
+                                updates[field] = self._restore(storage, private[field], name)
+                                released.add(name)
+                        continue
+                    if not name or name.startswith(f"{storage.dedup_prefix}/"):
+                        continue
+                    if name not in blobs:
+                        path = storage.path(name)
+                        if not os.path.exists(path):
+                            missing += 1
+                            continue
+                        with open(path, "rb") as f:
+                            blob = storage.blob_name(content_digest(File(f)), name)
+                        if blob in adopted or storage.exists(blob):
+                            duplicate_bytes += os.path.getsize(path)
+                        else:
+                            unique += 1
+                            adopted.add(blob)
+                            if not dry_run:
+                                self._adopt(storage, name, blob)
+                        blobs[name] = blob
+                    files += 1
+                    updates[field] = blobs[name]
+                if updates and not dry_run:
+                    model._base_manager.filter(pk=row[0]).update(**updates)
+        for blob in released:
+            storage.delete(blob)  # kept while a public field still points at it
+
+        self.stdout.write(f"📊 {files} file references, {unique} unique files, "
+                          f"{missing} missing, duplicates: {duplicate_bytes / 1024 / 1024:.1f}MB")
+        if restored:
+            self.stdout.write(f"🔒 {restored} private files {'to move' if dry_run else 'moved'} out of {storage.dedup_prefix}/")
+        if dry_run:
+            self.stdout.write("💡 Run without --dry-run to move them into the content-addressed storage")
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Done. `manage.py gc_media` removes the old copies"))
+
+    @staticmethod
+    def _private_fields(storage, model, fields) -> dict[str, str]:
+        """{field: upload_to} for fields whose uploads fall under an access rule (callable upload_to: public)."""
+        private = {}
+        for field in fields:
+            upload_to = model._meta.get_field(field).upload_to
+            if isinstance(upload_to, str) and storage.is_private(upload_to.rstrip("/") + "/"):
+                private[field] = upload_to
+        return private
+
+    def _restore(self, storage, upload_to: str, blob: str) -> str:
+        """Copy a blob (and its siblings) back under the field's upload_to; returns the new name."""
+        name = storage.get_available_name(posixpath.join(upload_to, posixpath.basename(blob)))
+        self._adopt(storage, blob, name)
+        return name
+
+    def _adopt(self, storage, name: str, blob: str) -> None:
+        """Link the original and its generated siblings (AVIF/WebP, sizes, .meta.json) under the blob name."""
+        _link(storage.path(name), storage.path(blob))
+        old_root, new_root = os.path.splitext(name)[0], os.path.splitext(blob)[0]
+        directory, stem = os.path.split(storage.path(old_root))
+        prefix = os.path.dirname(name)
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                sibling = f"{prefix}/{entry.name}" if prefix else entry.name
+                if entry.name.startswith(stem) and entry.is_file() and is_generated_from(sibling, old_root):
+                    target = storage.path(new_root + sibling[len(old_root):])
+                    if not os.path.exists(target):
+                        _link(entry.path, target)
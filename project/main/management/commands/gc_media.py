@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import os
+import posixpath
+import shutil
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from app.storage import file_fields
+from common.image_utils import candidate_roots, original_root
+
+GENERATED_EXTENSIONS = (".avif", ".webp")
+QUARANTINE_DIR = ".quarantine"
+
+
+def referenced_names() -> tuple[set[str], list[str]]:
+    """Stored names of all file fields (one query per model) and the upload_to directories they use."""
+    names, dirs = set(), set()
+    for model, fields in file_fields():
+        for field in fields:
+            upload_to = model._meta.get_field(field).upload_to
+            if isinstance(upload_to, str) and upload_to.strip("/"):
+                dirs.add(upload_to.strip("/").split("/")[0])
+        for row in model._base_manager.values_list(*fields).iterator():
+            names.update(posixpath.normpath(name) for name in row if name)
+    # app.storage.DedupFileSystemStorage keeps every upload under one content-addressed directory
+    prefix = getattr(default_storage, "dedup_prefix", None)
+    if prefix:
+        dirs.add(prefix)
+    return names, sorted(dirs)
+
+
+def scan(media_root: Path, top_dirs, min_age: float):
+    """Yield (relative posix name, size) of every file under the upload directories (os.scandir walk)."""
+    cutoff = time.time() - min_age
+    stack = [media_root / d for d in top_dirs]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith(".tmp-") or entry.name == QUARANTINE_DIR:
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat()
+                        if st.st_mtime <= cutoff:  # an upload may not be committed yet
+                            yield Path(entry.path).relative_to(media_root).as_posix(), st.st_size
+        except FileNotFoundError:
+            continue
+
+
+def find_orphans(media_root: Path, min_age: float = 0):
+    """[(name, size, kind)] of unreferenced files; kind is 'original' or 'variant'."""
+    names, dirs = referenced_names()
+    roots = {posixpath.splitext(name)[0] for name in names}
+    orphans = []
+    for name, size in scan(media_root, dirs, min_age):
+        if name in names or candidate_roots(name) & roots:
+            continue
+        root, ext = posixpath.splitext(name)
+        generated = original_root(name) != root or ext.lower() in GENERATED_EXTENSIONS
+        orphans.append((name, size, "variant" if generated else "original"))
+    return orphans
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f}MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete (or quarantine) media files no image field references: replaced/deleted originals and\n"
+        "their generated AVIF/WebP variants and .meta.json sidecars, under the upload_to directories of\n"
+        "Categories, Products, ProductImage, User and any other model with file fields."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+        parser.add_argument("--quarantine", nargs="?", const="", default=None, metavar="DIR",
+                            help=f"Move files here instead of deleting (default: MEDIA_ROOT/{QUARANTINE_DIR}/<timestamp>)")
+        parser.add_argument("--min-age", type=float, default=24,
+                            help="Skip files modified within this many hours (default: 24)")
+        parser.add_argument("--verbose-files", action="store_true", help="List every orphaned file")
+
+    def handle(self, *args, **options):
+        try:
+            default_storage.path("")
+        except NotImplementedError:
+            raise CommandError("gc_media scans MEDIA_ROOT; DEFAULT_FILE_STORAGE is not a local filesystem storage")
+        media_root = Path(settings.MEDIA_ROOT)
+        if not media_root.is_dir():
+            raise CommandError(f"MEDIA_ROOT does not exist: {media_root}")
+
+        started = time.perf_counter()
+        orphans = find_orphans(media_root, min_age=options["min_age"] * 3600)
+        self.stdout.write(f"🔍 Scanned media in {time.perf_counter() - started:.1f}s")
+
+        by_dir = defaultdict(lambda: [0, 0])
+        by_kind = defaultdict(lambda: [0, 0])
+        for name, size, kind in orphans:
+            top = name.split("/", 1)[0]
+            by_dir[top][0] += 1
+            by_dir[top][1] += size
+            by_kind[kind][0] += 1
+            by_kind[kind][1] += size
+            if options["verbose_files"]:
+                self.stdout.write(f"   {name} ({size // 1024}KB, {kind})")
+
+        total = sum(size for _, size, _ in orphans)
+        self.stdout.write("\n📊 Unreferenced files:")
+        for top, (count, size) in sorted(by_dir.items()):
+            self.stdout.write(f"   {top}/: {count} files, {_mb(size)}")
+        for kind, (count, size) in sorted(by_kind.items()):
+            self.stdout.write(f"   {kind}s: {count} files, {_mb(size)}")
+        self.stdout.write(f"   total: {len(orphans)} files, {_mb(total)}")
+
+        if options["dry_run"] or not orphans:
+            if orphans:
+                self.stdout.write("💡 Run without --dry-run to delete them, or with --quarantine to move them aside")
+            return
+
+        quarantine = options["quarantine"]
+        if quarantine is not None:
+            target = Path(quarantine) if quarantine else media_root / QUARANTINE_DIR / f"{datetime.now():%Y%m%d-%H%M%S}"
+        removed = 0
+        for name, _, _ in orphans:
+            path = media_root / name
+            try:
+                if quarantine is not None:
+                    dest = target / name
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.move(path, dest)
+                else:
+                    path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                continue
+        action = f"Moved to {target}" if quarantine is not None else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"✅ {action}: {removed} files, {_mb(total)}"))
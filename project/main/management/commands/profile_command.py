@@ -0,0 +1,21 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from common.profiling import profile, profiles_dir
+
+
+class Command(BaseCommand):
+    help = (
+        "Run another management command under the profiler and save the result next to request profiles\n"
+        "(see /admin/profiles/). Example: manage.py profile_command regenerate_avif_optimized --dry-run"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("command_name", help="Command to profile")
+        parser.add_argument("command_args", nargs="...", help="Arguments passed to the command as-is")
+
+    def handle(self, *args, **options):
+        name = options["command_name"]
+        with profile("command", name) as prof:
+            call_command(name, *options["command_args"], stdout=self.stdout, stderr=self.stderr)
+        self.stdout.write(self.style.SUCCESS(f"\n📊 Profile saved: {profiles_dir() / prof.name}"))
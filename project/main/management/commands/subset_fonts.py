@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common import fonts
+
+
+class Command(BaseCommand):
+    help = (
+        "Subset settings.FONT_SUBSETS fonts and the ICON_FONT_CSS icon fonts to the characters/icons\n"
+        "used by templates, JS and CSS; writes WOFF2 files + trimmed icons.css. Run before collectstatic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the icons/characters found")
+
+    def handle(self, *args, **options):
+        try:
+            import fontTools  # noqa: F401
+        except ImportError:
+            raise CommandError("fontTools is not installed (pip install fonttools brotli)")
+
+        if options["dry_run"]:
+            icons, chars = fonts.scan_usage()
+            self.stdout.write(f"🔍 Icons used: {', '.join(sorted(icons)) or '—'}")
+            self.stdout.write(f"🔍 Template characters: {len(chars)}")
+            return
+
+        self.stdout.write(f"🔄 Subsetting fonts into {fonts.build_dir() / fonts.FONTS_SUBDIR}")
+
+        def log(path, before, after):
+            self.stdout.write(f"   ✅ {path}: {before / 1024:.1f} KB → {after / 1024:.1f} KB")
+
+        try:
+            manifest = fonts.build(log)
+        except FileNotFoundError as exc:
+            raise CommandError(str(exc))
+
+        if getattr(settings, "ICON_FONT_CSS", None) and not any(p.endswith(".woff2") and "fa-" in p for p in manifest):
+            self.stdout.write("ℹ️ No fa-* icons in use: icon fonts are not needed")
+        self.stdout.write("💡 Collect with an app.storage.Compressed* storage to rewrite the CSS references")
+        self.stdout.write(self.style.SUCCESS("📊 Done"))
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:19
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_delete_promo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=16, verbose_name='Отпечаток')),
+                ('source', models.CharField(max_length=150, verbose_name='Источник')),
+                ('sql', models.TextField(verbose_name='Запрос')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('total_time', models.FloatField(default=0, verbose_name='Суммарное время, с')),
+                ('max_time', models.FloatField(default=0, verbose_name='Максимальное время, с')),
+                ('explain', models.JSONField(blank=True, null=True, verbose_name='EXPLAIN')),
+                ('plan_summary', models.CharField(blank=True, default='', max_length=255, verbose_name='План')),
+                ('first_seen', models.DateTimeField(auto_now_add=True, verbose_name='Впервые')),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Последний раз')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'db_table': 'slow_query',
+                'ordering': ('-total_time',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='slowquery',
+            constraint=models.UniqueConstraint(fields=('fingerprint', 'source'), name='slow_query_fingerprint_source'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+
+class SlowQuery(models.Model):
+    """Aggregated slow queries, written by common.slow_queries."""
+
+    fingerprint = models.CharField(max_length=16, verbose_name="Отпечаток")
+    source = models.CharField(max_length=150, verbose_name="Источник")
+    sql = models.TextField(verbose_name="Запрос")
+    count = models.PositiveIntegerField(default=0, verbose_name="Количество")
+    total_time = models.FloatField(default=0, verbose_name="Суммарное время, с")
+    max_time = models.FloatField(default=0, verbose_name="Максимальное время, с")
+    explain = models.JSONField(null=True, blank=True, verbose_name="EXPLAIN")
+    plan_summary = models.CharField(max_length=255, blank=True, default="", verbose_name="План")
+    first_seen = models.DateTimeField(auto_now_add=True, verbose_name="Впервые")
+    last_seen = models.DateTimeField(default=timezone.now, verbose_name="Последний раз")
+
+    class Meta:
+        db_table = "slow_query"
+        verbose_name = "Медленный запрос"
+        verbose_name_plural = "Медленные запросы"
+        ordering = ("-total_time",)
+        constraints = [
+            models.UniqueConstraint(fields=("fingerprint", "source"), name="slow_query_fingerprint_source"),
+        ]
+
+    def __str__(self):
+        return f"{self.source}: {self.sql[:80]}"
+
+    @property
+    def avg_time(self):
+        return self.total_time / self.count if self.count else 0
+
+    @classmethod
+    def record(cls, fingerprint, source, sql, elapsed, explain=None):
+        obj, _ = cls.objects.get_or_create(fingerprint=fingerprint, source=source[:150], defaults={"sql": sql})
+        updates = {
+            "count": F("count") + 1,
+            "total_time": F("total_time") + elapsed,
+            "max_time": Greatest("max_time", elapsed),
+            "last_seen": timezone.now(),
+        }
+        if explain is not None:
+            updates["explain"] = explain
+            updates["plan_summary"] = summarize_plan(explain)[:255]
+        cls.objects.filter(pk=obj.pk).update(**updates)
+
+
+def summarize_plan(explain) -> str:
+    """'Limit > Sort > Seq Scan on goods_products' from EXPLAIN (FORMAT JSON) output."""
+    node = explain[0]["Plan"] if isinstance(explain, list) and explain else None
+    parts = []
+    while node:
+        label = node.get("Node Type", "?")
+        if node.get("Relation Name"):
+            label += f" on {node['Relation Name']}"
+        parts.append(label)
+        children = node.get("Plans") or []
+        # follow the most expensive branch
+        node = max(children, key=lambda n: n.get("Total Cost", 0)) if children else None
+    return " > ".join(parts)
@@ -1,3 +1,836 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+from datetime import timedelta
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from prometheus_client import REGISTRY
+
+from app.storage import CompressedManifestStaticFilesStorageLoose, DedupFileSystemStorage, S3MediaStorage
+from common import assets, fonts, image_resize, media_serving, profiling, slow_queries
+from common.metrics import DB_CONNECTION_ACQUIRE_SECONDS
+from common.profiling import ProfilerMiddleware, list_profiles, make_token
+from common.s3 import S3Error
+from common.testing import LOCMEM_CACHES, FakeS3, QueryBudgetMixin, seed_catalog
+from goods.models import Categories
+from main.models import SlowQuery
+from users.models import User
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class HomeQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_home(self):
+        # cold cache: categories + bestsellers
+        with self.assertQueryBudget(2, 0.5):
+            self.assertEqual(self.client.get(reverse("main:home")).status_code, 200)
+        # warm cache: bestsellers only
+        with self.assertQueryBudget(1, 0.5):
+            response = self.client.get(reverse("main:home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["bestsellers"])
+
+    def test_about(self):
+        with self.assertQueryBudget(0, 0.5):
+            self.assertEqual(self.client.get(reverse("main:about")).status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PerfMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=30)
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(PERF_SAMPLE_RATE=1.0)
+    def test_sampled_request_reports_timings(self):
+        with self.assertLogs("perf", "INFO") as logs:
+            response = self.client.get(reverse("main:home"))
+        timing = response["Server-Timing"]
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="2 queries"', timing)
+        self.assertIn('desc="0 hit / 1 miss"', timing)
+        self.assertIn("tpl;dur=", timing)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["view"], "main:home")
+        self.assertEqual(line["status"], 200)
+        self.assertEqual(line["db_queries"], 2)
+        self.assertGreater(line["tpl_ms"], 0)
+
+        with self.assertLogs("perf", "INFO") as logs:
+            self.client.get(reverse("main:home"))
+        self.assertEqual(json.loads(logs.records[0].getMessage())["cache_hits"], 1)
+
+    @override_settings(PERF_SAMPLE_RATE=1.0)
+    async def test_async_stack_counts_queries_from_worker_threads(self):
+        # under ASGI the sync view (and the async ORM) run on sync_to_async threads
+        with self.assertLogs("perf", "INFO") as logs:
+            response = await self.async_client.get(reverse("main:home"))
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+        self.assertEqual(json.loads(logs.records[0].getMessage())["view"], "main:home")
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse("main:about"))
+        self.assertNotIn("Server-Timing", response)
+
+
+class MetricsEndpointTests(TestCase):
+    def test_exposes_request_latency_by_url_name(self):
+        self.client.get(reverse("main:about"))
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_request_duration_seconds_count{method="GET",view="main:about"}', response.content.decode())
+        self.assertNotIn('view="metrics"', response.content.decode())
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_internal_only(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="203.0.113.7").status_code, 404)
+        response = self.client.get(url, REMOTE_ADDR="203.0.113.7", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", password="pw", is_staff=True)
+        cls.customer = User.objects.create_user("customer", password="pw")
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        settings_override = override_settings(PROFILER_DIR=Path(self.dir), PROFILER_MAX_FILES=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_signed_request_is_profiled(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("main:about"), {"_profile": make_token(self.staff)})
+        self.assertIn("-view-main_about-", response["X-Profile-Id"])
+        self.assertEqual([p.name for p in list_profiles()], [response["X-Profile-Id"]])
+
+        download = self.client.get(reverse("admin_profile_download", args=[response["X-Profile-Id"]]))
+        self.assertEqual(download.status_code, 200)
+        self.assertContains(self.client.get(reverse("admin_profiles")), response["X-Profile-Id"])
+
+    def test_token_only_for_its_staff_owner(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse("main:about"), {"_profile": make_token(self.customer)})
+        self.assertNotIn("X-Profile-Id", response)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("main:about"), HTTP_X_PROFILE=make_token(self.customer))
+        self.assertNotIn("X-Profile-Id", response)
+        response = self.client.get(reverse("main:about"), HTTP_X_PROFILE=make_token(self.staff) + "x")
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(list_profiles(), [])
+
+    def test_overlapping_async_requests_are_served_unprofiled(self):
+        async def view(request):
+            return HttpResponse("ok")
+
+        request = RequestFactory().get("/", {"_profile": make_token(self.staff)})
+        request.user = self.staff
+
+        async def overlapping():
+            # what a second profiled request on the same event loop thread finds
+            with profiling.profile("view", "first"):
+                return await ProfilerMiddleware(view)(request)
+
+        response = asyncio.run(overlapping())
+        self.assertEqual(response.content, b"ok")
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(len(list_profiles()), 1)  # the first one's
+
+    def test_ring_buffer_and_commands(self):
+        for _ in range(3):
+            call_command("profile_command", "check", stdout=StringIO())
+        profiles = list_profiles()
+        self.assertEqual(len(profiles), 2)
+        self.assertIn("-command-check-", profiles[0].name)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SlowQueryLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=30)
+
+    def setUp(self):
+        slow_queries._buffer.clear()
+        slow_queries._explained.clear()
+        self.addCleanup(slow_queries._buffer.clear)
+
+    def test_queries_are_aggregated_per_view_with_explain(self):
+        url = reverse("catalog:index", args=["all"])
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs("slow_query", "WARNING"):
+            self.client.get(url)
+            self.client.get(url)
+
+        rows = SlowQuery.objects.filter(source="catalog:index")
+        self.assertTrue(rows)
+        self.assertEqual({row.count for row in rows}, {2})
+        page_query = rows.get(sql__contains="LIMIT")
+        self.assertIsInstance(page_query.explain, list)
+        self.assertIn(" on product", page_query.plan_summary)
+        self.assertEqual(slow_queries._buffer, [])
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=-1)
+    def test_disabled(self):
+        self.client.get(reverse("catalog:index", args=["all"]))
+        self.assertFalse(SlowQuery.objects.exists())
+
+
+class DatabaseConnectionTests(TransactionTestCase):
+    def test_health_check_rearmed_after_idling(self):
+        self.assertTrue(connection.settings_dict["CONN_HEALTH_CHECKS"])
+        connection.ensure_connection()
+        opened = DB_CONNECTION_ACQUIRE_SECONDS.labels("default")._sum.get()
+
+        # a long-running command that has not touched the DB for a while, and the server dropped it
+        connection.health_check_done = True
+        connection._last_used = time.monotonic() - 3600
+        with mock.patch.object(connection, "is_usable", return_value=False):
+            connection.close_if_health_check_failed()
+        self.assertIsNone(connection.connection)
+
+        # the next query reconnects, and the acquire time is observed
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.assertGreater(DB_CONNECTION_ACQUIRE_SECONDS.labels("default")._sum.get(), opened)
+
+    def test_recently_used_connection_is_not_rechecked(self):
+        connection.ensure_connection()
+        connection.health_check_done = True
+        connection._last_used = time.monotonic()
+        with mock.patch.object(connection, "is_usable") as is_usable:
+            connection.close_if_health_check_failed()
+        is_usable.assert_not_called()
+
+
+class ClearSessionsBatchedTests(TestCase):
+    def test_deletes_only_expired_sessions_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f"old{i:037}", session_data="x", expire_date=now - timedelta(days=1)) for i in range(7)]
+            + [Session(session_key=f"new{i:037}", session_data="x", expire_date=now + timedelta(days=1)) for i in range(3)]
+        )
+        out = StringIO()
+        call_command("clearsessions_batched", "--batch-size=3", stdout=out)
+        self.assertEqual(Session.objects.count(), 3)
+        self.assertFalse(Session.objects.filter(session_key__startswith="old").exists())
+        self.assertIn("Deleted 7", out.getvalue())
+
+
+class PrecompressedStaticTests(TestCase):
+    CSS = "body { color: #333; }\n" * 200
+
+    def setUp(self):
+        self.src_dir = Path(tempfile.mkdtemp())
+        self.out_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.src_dir)
+        self.addCleanup(shutil.rmtree, self.out_dir)
+        self.source = FileSystemStorage(location=self.src_dir)
+        for name, content in (("css/site.css", self.CSS), ("js/tiny.js", "x=1"), ("img/a.png", b"\x89PNG" * 500)):
+            self.source.save(name, ContentFile(content))
+
+    def _collect(self):
+        # what collectstatic does: copy, then post-process
+        storage = CompressedManifestStaticFilesStorageLoose(location=self.out_dir)
+        paths = {}
+        for name in ("css/site.css", "js/tiny.js", "img/a.png"):
+            if not storage.exists(name):
+                with self.source.open(name) as f:
+                    storage.save(name, f)
+            paths[name] = (self.source, name)
+        list(storage.post_process(paths))
+        return storage
+
+    @override_settings(STATIC_COMPRESS_WORKERS=2)
+    def test_text_assets_get_gzip_and_brotli_siblings(self):
+        storage = self._collect()
+        hashed = storage.stored_name("css/site.css")
+        with open(storage.path(hashed) + ".gz", "rb") as f:
+            self.assertEqual(gzip.decompress(f.read()).decode(), self.CSS)
+        self.assertTrue(os.path.exists(storage.path(hashed) + ".br"))
+        self.assertTrue(os.path.exists(storage.path("css/site.css") + ".gz"))
+        # too small to gain anything; images are never compressed
+        self.assertFalse(os.path.exists(storage.path(storage.stored_name("js/tiny.js")) + ".gz"))
+        self.assertFalse(os.path.exists(storage.path(storage.stored_name("img/a.png")) + ".gz"))
+
+        # unchanged content is not compressed again
+        self.assertEqual(storage.precompress([hashed, "css/site.css"]), [])
+        os.remove(storage.path(hashed) + ".br")
+        self.assertEqual(storage.precompress([hashed]), [hashed])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AssetBundleTests(TestCase):
+    def setUp(self):
+        self.build_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.build_dir)
+        settings = override_settings(ASSET_BUILD_DIR=self.build_dir, ASSET_BUNDLES_ENABLED=True)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_minify_and_critical_css(self):
+        css = assets.minify_css("""
+            /* comment */ :root { --c: red; }
+            .hero  > .title , .later { color : var(--c); }
+            .below-fold { content: "a  b"; }
+            div :hover { color: blue; }
+            @media (max-width: 600px) { .hero { padding: 0; } .below-fold { padding: 1px; } }
+            @font-face { font-family: X; src: url(x.woff2); }
+        """)
+        self.assertIn('.hero>.title,.later{color:var(--c)}', css)
+        self.assertIn('content:"a  b"', css)
+        self.assertIn("div :hover", css)
+
+        critical = assets.critical_css(css, {".hero", ".title", "div"})
+        self.assertEqual(
+            critical,
+            ":root{--c:red}.hero>.title,.later{color:var(--c)}div :hover{color:blue}"
+            "@media (max-width:600px){.hero{padding:0}}",
+        )
+
+    def test_built_bundles_replace_source_links(self):
+        call_command("build_assets", stdout=StringIO())
+        manifest = assets.load_manifest()
+        self.assertEqual(set(manifest), {"base", "home", "product"})
+        home = manifest["home"]
+        self.assertTrue((self.build_dir / home["css"]).is_file())
+        # categories are above the fold marker of main/home.html, the FAQ is not
+        self.assertIn(".tm-paging-link", home["critical"])
+        self.assertNotIn(".faq-box", home["critical"])
+
+        response = self.client.get(reverse("main:home"))
+        html = response.content.decode()
+        self.assertIn(home["css"], html)
+        self.assertIn(home["js"], html)
+        self.assertIn("<style>" + home["critical"], html)
+        self.assertNotIn("deps/css/faq.css", html)
+
+        with override_settings(ASSET_BUNDLES_ENABLED=False):
+            html = self.client.get(reverse("main:home")).content.decode()
+        self.assertNotIn(home["css"], html)
+        self.assertIn("deps/css/faq.css", html)
+
+
+class SubsetFontsTests(TestCase):
+    def setUp(self):
+        self.build_dir = Path(tempfile.mkdtemp())
+        self.out_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.build_dir)
+        self.addCleanup(shutil.rmtree, self.out_dir)
+        settings = override_settings(ASSET_BUILD_DIR=self.build_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_subset_fonts_and_trimmed_icon_css(self):
+        with mock.patch.object(fonts, "scan_usage", return_value=({"cart-plus", "not-an-icon"}, {ord("Ї")})):
+            call_command("subset_fonts", stdout=StringIO())
+        manifest = fonts.load_manifest()
+
+        woff2 = self.build_dir / manifest["deps/webfonts/TagesschriftCyrillic-Regular.ttf"]
+        source = Path(finders.find("deps/webfonts/TagesschriftCyrillic-Regular.ttf"))
+        self.assertLess(woff2.stat().st_size, source.stat().st_size / 2)
+        with open(woff2, "rb") as f:
+            self.assertEqual(f.read(4), b"wOF2")
+
+        icons_css = (self.build_dir / manifest["deps/css/all.min.css"]).read_text()
+        self.assertIn(".fa-cart-plus:before", icons_css)
+        self.assertNotIn(".fa-500px:before", icons_css)
+        self.assertIn("url(fa-solid-900.subset.woff2)", icons_css)
+        self.assertNotIn(".eot", icons_css)
+        self.assertTrue((self.build_dir / "fonts/fa-solid-900.subset.woff2").exists())
+
+    def test_collectstatic_points_css_at_the_subsets(self):
+        fonts.manifest_path().parent.mkdir(parents=True)
+        fonts.manifest_path().write_text(json.dumps({"deps/webfonts/Font.ttf": "fonts/Font.subset.woff2"}))
+        css = (
+            "@font-face{src:url('/static/deps/webfonts/Font.ttf') format('truetype')}"
+            "@font-face{src:url(../webfonts/Font.ttf)}"
+            "@font-face{src:url(https://fonts.example.com/Other.ttf)}"
+        )
+        storage = CompressedManifestStaticFilesStorageLoose(location=self.out_dir)
+        source = FileSystemStorage(location=self.build_dir)
+        for name, content in (("deps/css/site.css", css), ("fonts/Font.subset.woff2", b"wOF2")):
+            source.save(name, ContentFile(content))
+            with source.open(name) as f:
+                storage.save(name, f)
+        paths = {name: (source, name) for name in ("deps/css/site.css", "fonts/Font.subset.woff2")}
+        list(storage.post_process(paths))
+
+        with storage.open(storage.stored_name("deps/css/site.css")) as f:
+            collected = f.read().decode()
+        hashed_font = storage.stored_name("fonts/Font.subset.woff2")
+        self.assertIn(f'url("/static/{hashed_font}") format("woff2")', collected)
+        self.assertIn(f'url("../../{hashed_font}") format("woff2")', collected)
+        self.assertIn("url(https://fonts.example.com/Other.ttf)", collected)
+
+    def test_collectstatic_substitutes_the_trimmed_icon_css(self):
+        fonts.manifest_path().parent.mkdir(parents=True)
+        fonts.manifest_path().write_text(json.dumps({
+            "deps/webfonts/fa.woff2": "fonts/fa.subset.woff2", "deps/css/all.min.css": "fonts/icons.css",
+        }))
+        (self.build_dir / "fonts/icons.css").write_text(
+            '@font-face{font-family:fa;src:url(fa.subset.woff2) format("woff2")}.fa-cart-plus:before{content:"\\f217"}'
+        )
+        full = '@font-face{src:url(../webfonts/fa.woff2)}.fa-cart-plus:before{content:"\\f217"}.fa-500px:before{content:"\\f26e"}'
+        storage = CompressedManifestStaticFilesStorageLoose(location=self.out_dir)
+        source = FileSystemStorage(location=self.build_dir)
+        for name, content in (("deps/css/all.min.css", full), ("fonts/fa.subset.woff2", b"wOF2")):
+            source.save(name, ContentFile(content))
+            with source.open(name) as f:
+                storage.save(name, f)
+        paths = {name: (source, name) for name in ("deps/css/all.min.css", "fonts/fa.subset.woff2")}
+        list(storage.post_process(paths))
+
+        with storage.open(storage.stored_name("deps/css/all.min.css")) as f:
+            collected = f.read().decode()
+        self.assertIn(".fa-cart-plus:before", collected)
+        self.assertNotIn(".fa-500px", collected)
+        self.assertIn(f'url("../../{storage.stored_name("fonts/fa.subset.woff2")}") format("woff2")', collected)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ImageResizeTests(TestCase):
+    def setUp(self):
+        self.media = Path(tempfile.mkdtemp())
+        self.cache_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        settings = override_settings(MEDIA_ROOT=self.media, IMAGE_RESIZE_CACHE_DIR=self.cache_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        (self.media / "goods_images").mkdir()
+        Image.new("RGB", (600, 400), (10, 120, 30)).save(self.media / "goods_images/a.png")
+
+    def _hits(self):
+        return REGISTRY.get_sample_value("image_resize_requests_total", {"result": "hit"}) or 0
+
+    def test_signed_url_is_resized_negotiated_and_cached(self):
+        url = image_resize.resized_url("goods_images/a.png", 230, 160)
+        response = self.client.get(url, HTTP_ACCEPT="image/webp,*/*")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("Accept", response["Vary"])
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as img:
+            self.assertEqual((img.format, img.size), ("WEBP", (230, 160)))
+
+        hits = self._hits()
+        self.client.get(url, HTTP_ACCEPT="image/webp,*/*")
+        self.assertEqual(self._hits(), hits + 1)
+        revalidated = self.client.get(url, HTTP_ACCEPT="image/webp,*/*", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+        response = self.client.get(url, HTTP_ACCEPT="*/*")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(len(list(self.cache_dir.rglob("*.*"))), 2)
+
+        # width only keeps the aspect ratio
+        response = self.client.get(image_resize.resized_url("goods_images/a.png", 300), HTTP_ACCEPT="image/webp")
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as img:
+            self.assertEqual(img.size, (300, 200))
+
+    def test_unsigned_or_tampered_urls_are_rejected(self):
+        url = image_resize.resized_url("goods_images/a.png", 230, 160)
+        self.assertEqual(self.client.get(url.replace("230x160", "2300x160")).status_code, 404)
+        self.assertEqual(self.client.get(url.replace("a.png", "b.png")).status_code, 404)
+        self.assertEqual(self.client.get("/img/230x160/goods_images/a.png").status_code, 404)
+        # signed, but the source is missing
+        self.assertEqual(self.client.get(image_resize.resized_url("goods_images/none.png", 230, 160)).status_code, 404)
+
+    def test_cloud_card_picture_tag(self):
+        template = Template("{% load cdn_extras %}{% cloud_card_picture product classes %}")
+        field = SimpleNamespace(name="goods_images/a.png")
+        html = template.render(Context({
+            "product": SimpleNamespace(card_image=None, image=field, name="P&Co"), "classes": 'card "x',
+        }))
+        src = image_resize.resized_url("goods_images/a.png", 230, 160)
+        self.assertIn(f'src="{src}"', html)
+        self.assertIn(" 230w", html)
+        self.assertIn('alt="P&amp;Co" class="card &quot;x"', html)
+        self.assertEqual(self.client.get(src).status_code, 200)
+
+        html = template.render(Context({"product": SimpleNamespace(card_image=None, image=None, name="P")}))
+        self.assertIn('<img src="" alt="P"', html)
+
+    def test_revalidation_survives_lru_touches(self):
+        url = image_resize.resized_url("goods_images/a.png", 230, 160)
+        etag = self.client.get(url, HTTP_ACCEPT="image/webp")["ETag"]
+        cached = next(self.cache_dir.rglob("*.webp"))
+        later = time.time() + 300
+        with mock.patch.object(image_resize.time, "time", return_value=later):
+            response = self.client.get(url, HTTP_ACCEPT="image/webp", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        # the hit was recorded for eviction without touching what the validators come from
+        self.assertEqual(cached.stat().st_atime, later)
+
+    def test_disk_cache_evicts_least_recently_used(self):
+        cache = image_resize.DiskLRUCache(self.cache_dir, max_bytes=1000)
+        now = time.time()
+        for i, key in enumerate(("aa01", "bb02", "cc03")):
+            path = cache.path(key, "webp")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"x" * 400)
+            os.utime(path, (now - 100 + i, now - 100 + i))
+        # a hit makes the oldest entry the most recent one
+        cache.get("aa01", "webp")
+        # 1200 bytes > 1000: down to 90% by dropping the least recently used
+        self.assertEqual(cache.evict(), 1)
+        self.assertIsNone(cache.get("bb02", "webp"))
+        self.assertIsNotNone(cache.get("aa01", "webp"))
+
+        # writers check the size themselves every max_bytes/20 written
+        cache.put("dd04", "webp", lambda tmp: Path(tmp).write_bytes(b"x" * 700))
+        self.assertIsNone(cache.get("aa01", "webp"))
+        self.assertIsNotNone(cache.get("dd04", "webp"))
+
+
+class GcMediaTests(TestCase):
+    def setUp(self):
+        self.media = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+        Categories.objects.create(name="Keep", slug="keep", image="categories_images/keep.png")
+        User.objects.create(username="u", image="users_images/me.jpg")
+        for name in [
+            "categories_images/keep.png", "categories_images/keep.webp", "categories_images/keep_128x128.avif",
+            "categories_images/keep.meta.json", "users_images/me.jpg",
+            # replaced / deleted uploads and what was generated from them
+            "categories_images/old.png", "categories_images/old_256x256.webp", "categories_images/old.meta.json",
+            "users_images/ghost.jpg",
+            # not an upload_to directory: never touched
+            "tinymce/page.png",
+        ]:
+            path = self.media / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"x" * 1024)
+        self.orphans = {"categories_images/old.png", "categories_images/old_256x256.webp",
+                        "categories_images/old.meta.json", "users_images/ghost.jpg"}
+
+    def _files(self, root):
+        return {p.relative_to(root).as_posix() for p in root.rglob("*") if p.is_file()}
+
+    def test_dry_run_reports_orphans_by_kind(self):
+        before = self._files(self.media)
+        out = StringIO()
+        call_command("gc_media", "--dry-run", "--min-age", "0", stdout=out)
+        self.assertEqual(self._files(self.media), before)
+        self.assertIn("originals: 2 files", out.getvalue())
+        self.assertIn("variants: 2 files", out.getvalue())
+        self.assertIn("total: 4 files", out.getvalue())
+
+        # fresh files may belong to an upload that is not committed yet
+        out = StringIO()
+        call_command("gc_media", "--dry-run", stdout=out)
+        self.assertIn("total: 0 files", out.getvalue())
+
+    def test_quarantine_and_delete(self):
+        before = self._files(self.media)
+        quarantine = self.media.parent / f"{self.media.name}-q"
+        self.addCleanup(shutil.rmtree, quarantine, True)
+        call_command("gc_media", "--min-age", "0", "--quarantine", str(quarantine), stdout=StringIO())
+        self.assertEqual(self._files(quarantine), self.orphans)
+        self.assertEqual(self._files(self.media), before - self.orphans)
+
+        (self.media / "users_images/ghost.jpg").write_bytes(b"x")
+        os.utime(self.media / "users_images/ghost.jpg", (0, 0))
+        call_command("gc_media", stdout=StringIO())
+        self.assertFalse((self.media / "users_images/ghost.jpg").exists())
+        self.assertTrue((self.media / "tinymce/page.png").exists())
+
+    def test_originals_named_like_variants_keep_their_files(self):
+        Categories.objects.create(name="Banner", slug="banner", image="categories_images/banner_1200x400.jpg")
+        kept = {"categories_images/banner_1200x400.jpg", "categories_images/banner_1200x400.webp",
+                "categories_images/banner_1200x400.avif", "categories_images/banner_1200x400.meta.json",
+                "categories_images/banner_1200x400_256x256.webp"}
+        for name in kept:
+            (self.media / name).write_bytes(b"x")
+            os.utime(self.media / name, (0, 0))
+        call_command("gc_media", "--min-age", "0", stdout=StringIO())
+        self.assertLessEqual(kept, self._files(self.media))
+        self.assertFalse(self._files(self.media) & self.orphans)
+
+
+class DedupStorageTests(TestCase):
+    def setUp(self):
+        self.media = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media)
+        self.storage = DedupFileSystemStorage(location=self.media)
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.storage.save("products/photo.JPG", ContentFile(b"same bytes"))
+        again = self.storage.save("products/cards/other-name.jpg", ContentFile(b"same bytes"))
+        other = self.storage.save("products/photo.jpg", ContentFile(b"other bytes"))
+        self.assertRegex(first, r"^cas/[0-9a-f]{2}/[0-9a-f]{32}\.jpg$")
+        self.assertEqual(first, again)
+        self.assertNotEqual(first, other)
+        self.assertEqual(len(list((self.media / "cas").rglob("*.jpg"))), 2)
+
+        # still referenced by a field: kept
+        Categories.objects.create(name="C", slug="c", image=first)
+        self.storage.delete(first)
+        self.assertTrue(self.storage.exists(first))
+        self.storage.delete(other)
+        self.assertFalse(self.storage.exists(other))
+
+    def test_private_uploads_are_not_content_addressed(self):
+        avatar = self.storage.save("users_images/me.jpg", ContentFile(b"same bytes"))
+        again = self.storage.save("users_images/me.jpg", ContentFile(b"same bytes"))
+        self.assertEqual(avatar, "users_images/me.jpg")
+        self.assertTrue(again.startswith("users_images/"))
+        self.assertNotEqual(avatar, again)
+        self.assertFalse((self.media / "cas").exists())
+
+    def test_dedup_media_moves_private_fields_out_of_cas(self):
+        with override_settings(MEDIA_ACCESS_RULES={}):
+            blob = self.storage.save("users_images/me.jpg", ContentFile(b"avatar"))
+            shared = self.storage.save("users_images/you.jpg", ContentFile(b"also a product photo"))
+        self.assertTrue(blob.startswith("cas/"))
+        (self.media / f"{blob[:-4]}.meta.json").write_bytes(b"{}")
+        me = User.objects.create(username="me", image=blob)
+        you = User.objects.create(username="you", image=shared)
+        Categories.objects.create(name="C", slug="c", image=shared)
+
+        with mock.patch("main.management.commands.dedup_media.default_storage", self.storage):
+            out = StringIO()
+            call_command("dedup_media", "--dry-run", stdout=out)
+            self.assertIn("2 private files to move", out.getvalue())
+            call_command("dedup_media", stdout=StringIO())
+
+        me.refresh_from_db()
+        you.refresh_from_db()
+        self.assertEqual(me.image.name, f"users_images/{Path(blob).name}")
+        self.assertEqual((self.media / me.image.name).read_bytes(), b"avatar")
+        self.assertTrue((self.media / f"{me.image.name[:-4]}.meta.json").exists())
+        self.assertFalse(self.storage.exists(blob))
+        # the category still uses the public copy
+        self.assertTrue(you.image.name.startswith("users_images/"))
+        self.assertTrue(self.storage.exists(shared))
+
+    def test_dedup_media_moves_uploads_and_reuses_variants(self):
+        for name in ["categories_images/a.png", "categories_seo/b.png"]:
+            (self.media / name).parent.mkdir(parents=True, exist_ok=True)
+            (self.media / name).write_bytes(b"duplicate photo")
+        (self.media / "categories_images/a_128x128.webp").write_bytes(b"variant")
+        (self.media / "categories_images/a.meta.json").write_bytes(b"{}")
+        # another upload, not a variant of a.png
+        (self.media / "categories_images/a_100x100.png").write_bytes(b"other upload")
+        category = Categories.objects.create(name="C", slug="c")
+        Categories.objects.filter(pk=category.pk).update(image="categories_images/a.png", seo_image="categories_seo/b.png")
+
+        with mock.patch("main.management.commands.dedup_media.default_storage", self.storage):
+            out = StringIO()
+            call_command("dedup_media", "--dry-run", stdout=out)
+            self.assertIn("2 file references, 1 unique files", out.getvalue())
+            self.assertFalse((self.media / "cas").exists())
+            call_command("dedup_media", stdout=StringIO())
+
+        category.refresh_from_db()
+        self.assertEqual(category.image.name, category.seo_image.name)
+        blob_root = self.media / category.image.name[:-len(".png")]
+        self.assertEqual(Path(f"{blob_root}.png").read_bytes(), b"duplicate photo")
+        self.assertEqual(Path(f"{blob_root}_128x128.webp").read_bytes(), b"variant")
+        self.assertTrue(Path(f"{blob_root}.meta.json").exists())
+
+        with override_settings(MEDIA_ROOT=self.media), \
+                mock.patch("main.management.commands.gc_media.default_storage", self.storage):
+            call_command("gc_media", "--min-age", "0", stdout=StringIO())
+        self.assertEqual(
+            {p.relative_to(self.media).as_posix() for p in self.media.rglob("*") if p.is_file()},
+            {f"{category.image.name[:-4]}{suffix}" for suffix in (".png", "_128x128.webp", ".meta.json")},
+        )
+
+
+@override_settings(MEDIA_S3_PART_SIZE_MB=5, MEDIA_S3_CACHE_CONTROL="public, max-age=60")
+class S3MediaStorageTests(TestCase):
+    def setUp(self):
+        self.s3 = FakeS3(page_size=2)
+        self.storage = S3MediaStorage(endpoint="http://s3.test", bucket="media", access_key="key", secret_key="secret",
+                                      public_url="https://cdn.test/", transport=self.s3.transport)
+
+    def test_roundtrip_listing_and_urls(self):
+        name = self.storage.save("products/a b.jpg", ContentFile(b"jpeg bytes"))
+        self.assertEqual(name, "products/a b.jpg")
+        # taken name: save() picks another one, like FileSystemStorage
+        self.assertNotEqual(self.storage.save("products/a b.jpg", ContentFile(b"other")), name)
+        for other in ["products/a b.webp", "products/cards/c.png", "categories/d.png"]:
+            self.storage.save(other, ContentFile(b"x"))
+
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b"jpeg bytes")
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), 10)
+        self.assertIsNotNone(self.storage.get_modified_time(name))
+        self.assertEqual(self.storage.url(name), "https://cdn.test/products/a%20b.jpg")
+        self.assertEqual(self.s3.objects[name][1], {"content-type": "image/jpeg", "cache-control": "public, max-age=60"})
+
+        # paginated (2 per page) listings
+        dirs, files = self.storage.listdir("products")
+        self.assertEqual(dirs, ["cards"])
+        self.assertEqual(len(files), 3)
+        self.assertEqual(self.storage.listdir("")[0], ["categories", "products"])
+        self.assertEqual(len(self.storage.list_prefix("products/a b")), 3)
+        self.assertEqual(self.storage.list_prefix("products/cards/"), ["products/cards/c.png"])
+
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open(name)
+
+    def test_large_files_are_uploaded_in_parts(self):
+        data = os.urandom(11 * 1024 * 1024)
+        self.storage.save("products/huge.png", ContentFile(data))
+        self.assertEqual(self.s3.requests[("PUT", "multipart")], 3)
+        self.assertEqual(self.s3.objects["products/huge.png"][0], data)
+        self.assertEqual(self.s3.objects["products/huge.png"][1]["content-type"], "image/png")
+
+    def test_failed_multipart_upload_is_aborted(self):
+        def chunks():
+            yield os.urandom(6 * 1024 * 1024)
+            raise OSError("upload stream broke")
+
+        with self.assertRaises(OSError):
+            self.storage.client.upload("products/broken.png", chunks(), part_size=5 * 1024 * 1024)
+        self.assertEqual(self.s3.uploads, {})
+        self.assertEqual(self.s3.requests[("DELETE", "multipart")], 1)
+        self.assertNotIn("products/broken.png", self.s3.objects)
+
+    def test_signing_errors_surface(self):
+        self.s3.bucket = "elsewhere"
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open("products/a.jpg")
+        self.s3.bucket = "media"
+        with mock.patch.object(self.s3, "_list", return_value=FakeS3._error(403, "AccessDenied")):
+            with self.assertRaises(S3Error) as ctx:
+                self.storage.listdir("")
+        self.assertEqual((ctx.exception.status, ctx.exception.code), (403, "AccessDenied"))
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.media = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media)
+        media = override_settings(MEDIA_ROOT=self.media, MEDIA_X_ACCEL_LOCATIONS={str(self.media): "/_protected/media/"})
+        media.enable()
+        self.addCleanup(media.disable)
+        for name, data in [("products/a b.jpg", b"0123456789"), ("users_images/me.jpg", b"avatar"),
+                           (".quarantine/old.jpg", b"x"), ("cas/ab/abcdef.webp", b"variant")]:
+            (self.media / name).parent.mkdir(parents=True, exist_ok=True)
+            (self.media / name).write_bytes(data)
+        self.storage = FileSystemStorage(location=self.media)
+        patcher = mock.patch.object(media_serving, "default_storage", self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_validators_and_conditional_get(self):
+        response = self.client.get("/media/products/a%20b.jpg")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response["Cache-Control"], "public, max-age=604800")
+        etag = response["ETag"]
+        self.assertRegex(etag, r'^"[0-9a-f]+-a"$')  # nginx's "<mtime>-<size>"
+
+        self.assertEqual(self.client.get("/media/products/a%20b.jpg", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get("/media/products/a%20b.jpg",
+                                         HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+        self.assertEqual(self.client.get("/media/products/a%20b.jpg", HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_range_requests(self):
+        url = "/media/products/a%20b.jpg"
+        response = self.client.get(url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        self.assertEqual((response["Content-Range"], response["Content-Length"]), ("bytes 2-5/10", "4"))
+        self.assertEqual(b"".join(self.client.get(url, HTTP_RANGE="bytes=-3").streaming_content), b"789")
+        self.assertEqual(b"".join(self.client.get(url, HTTP_RANGE="bytes=8-").streaming_content), b"89")
+
+        unsatisfiable = self.client.get(url, HTTP_RANGE="bytes=20-")
+        self.assertEqual((unsatisfiable.status_code, unsatisfiable["Content-Range"]), (416, "bytes */10"))
+        # stale If-Range, multiple ranges: the whole file
+        self.assertEqual(self.client.get(url, HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"stale"').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_RANGE="bytes=0-1,4-5").status_code, 200)
+
+    def test_hands_off_to_nginx(self):
+        with override_settings(MEDIA_X_ACCEL_REDIRECT=True):
+            response = self.client.get("/media/products/a%20b.jpg")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], "/_protected/media/products/a%20b.jpg")
+        self.assertEqual(response.content, b"")
+        self.assertIn("ETag", response)
+
+    def test_content_addressed_names_are_immutable(self):
+        self.storage.dedup_prefix = "cas"
+        response = self.client.get("/media/cas/ab/abcdef.webp")
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+
+    def test_access_rules(self):
+        url = "/media/users_images/me.jpg"
+        self.assertEqual(self.client.get(url).status_code, 404)
+        owner = User.objects.create_user("owner", password="pw", image="users_images/me.jpg")
+        User.objects.create_user("other", password="pw")
+        self.client.force_login(User.objects.get(username="other"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(owner)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+        self.assertEqual(response["Vary"], "Cookie")
+
+        self.client.force_login(User.objects.create_user("staff", password="pw", is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # dot-directories are never served; rules apply to the normalized name
+        self.assertEqual(self.client.get("/media/.quarantine/old.jpg").status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get("/media/products/../users_images/me.jpg").status_code, 404)
+        self.assertEqual(self.client.post("/media/products/a%20b.jpg").status_code, 405)
+
+    def test_access_rules_hold_with_dedup_storage(self):
+        storage = DedupFileSystemStorage(location=self.media)
+        name = storage.save("users_images/new.jpg", ContentFile(b"private avatar"))
+        self.assertEqual(name, "users_images/new.jpg")
+        self.assertFalse(any(p.read_bytes() == b"private avatar" for p in (self.media / "cas").rglob("*") if p.is_file()))
+
+        owner = User.objects.create_user("owner", password="pw", image=name)
+        with mock.patch.object(media_serving, "default_storage", storage):
+            self.assertEqual(self.client.get(f"/media/{name}").status_code, 404)
+            self.client.force_login(owner)
+            response = self.client.get(f"/media/{name}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
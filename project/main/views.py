@@ -3,16 +3,18 @@ from django.shortcuts import render
 from django.views.generic import TemplateView, ListView
 
 from goods.models import Categories, Products
+from goods.utils import get_cached_categories
 
 
 class HomeView(ListView):
     model = Categories
     template_name = 'main/home.html'  # путь к шаблону
     context_object_name = 'categories'
+    replica_reads = True  # read-only: may use the replica (common.db.routers)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Categories.objects.order_by('sort_order', 'name')
+        context['categories'] = get_cached_categories()
         context['bestsellers'] = Products.objects.filter(is_bestseller=True).order_by('name')
         return context
 
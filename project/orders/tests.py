@@ -1,3 +1,118 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from carts.models import Cart
+from common.metrics import CHECKOUT, NOVA_POSHTA_ERRORS
+from common.testing import LOCMEM_CACHES, QueryBudgetMixin, seed_catalog
+from orders.models import Order
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class CheckoutQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_catalog()
+        cls.user = cls.data["users"][0]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _order_form(self):
+        return {
+            "first_name": "Тест", "last_name": "Тестовий", "phone_number": "+380000000000",
+            "email": "buyer@example.com", "delivery_address": "Київ, відділення 1", "payment_on_get": "1",
+        }
+
+    def test_checkout_page(self):
+        with self.assertQueryBudget(4):
+            self.assertEqual(self.client.get(reverse("orders:create_order")).status_code, 200)
+
+    def test_checkout_submit(self):
+        successes = CHECKOUT.labels("success")._value.get()
+        cart_count = Cart.objects.filter(user=self.user).count()
+        # stock lock, order + one insert and one stock update per cart row, two e-mails, session save
+        with self.assertQueryBudget(21):
+            response = self.client.post(reverse("orders:create_order"), self._order_form())
+        order = Order.objects.filter(user=self.user).latest("id")
+        self.assertRedirects(response, reverse("orders:order_success", args=[order.uuid]), fetch_redirect_response=False)
+        self.assertEqual(order.orderitem_set.count(), cart_count)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(CHECKOUT.labels("success")._value.get(), successes + 1)
+
+        with self.assertQueryBudget(3):
+            self.assertEqual(self.client.get(response.url).status_code, 200)
+
+    def test_checkout_insufficient_stock_is_counted(self):
+        failures = CHECKOUT.labels("insufficient_stock")._value.get()
+        Cart.objects.filter(user=self.user).update(quantity=10_000)
+        response = self.client.post(reverse("orders:create_order"), self._order_form())
+        self.assertRedirects(response, reverse("orders:create_order"), fetch_redirect_response=False)
+        self.assertEqual(CHECKOUT.labels("insufficient_stock")._value.get(), failures + 1)
+
+    def test_anonymous_checkout_without_session_leaves_other_carts(self):
+        # session_key=None would match every logged-in user's rows (session_key IS NULL)
+        self.client.logout()
+        carts, orders = Cart.objects.count(), Order.objects.count()
+        self.assertTrue(Cart.objects.filter(session_key__isnull=True).exists())
+        self.client.get(reverse("orders:create_order"))
+        self.client.cookies.clear()
+        self.client.post(reverse("orders:create_order"), self._order_form())
+        self.assertEqual(Cart.objects.count(), carts)
+        self.assertEqual(Order.objects.count(), orders)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, NOVA_POSHTA_API_KEY="test")
+class NovaPoshtaViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _mock_api(self, *responses):
+        """Serve (status, body) pairs in order; returns the list of received payloads."""
+        calls, queue = [], list(responses)
+
+        def handler(request):
+            calls.append(json.loads(request.content))
+            status, body = queue.pop(0)
+            return httpx.Response(status, json=body)
+
+        transport = httpx.MockTransport(handler)
+        for patcher in (
+            mock.patch("orders.views._np_async_client",
+                       lambda timeout: httpx.AsyncClient(transport=transport, timeout=timeout)),
+            mock.patch("orders.views.NP_BACKOFF", 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return calls
+
+    async def test_search_city_is_cached(self):
+        calls = self._mock_api((200, {"success": True, "data": [{"Addresses": [{"Present": "м. Київ", "Ref": "r1"}]}]}))
+        url = reverse("orders:search_city") + "?q=Київ"
+        for _ in range(2):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.json(), [{"label": "м. Київ", "ref": "r1"}])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0]["calledMethod"], "searchSettlements")
+
+    async def test_get_warehouses_retries_server_errors(self):
+        calls = self._mock_api((503, {}), (200, {"success": True, "data": [{"Description": "Відділення №1"}]}))
+        response = await self.async_client.get(reverse("orders:get_warehouses") + "?settlement_ref=abc")
+        self.assertEqual(response.json(), {"success": True, "warehouses": ["Відділення №1"]})
+        self.assertEqual(len(calls), 2)
+
+    async def test_get_warehouses_fails_soft(self):
+        calls = self._mock_api(*[(502, {})] * 4)
+        errors = NOVA_POSHTA_ERRORS.labels("getWarehouses", "http")._value.get()
+        url = reverse("orders:get_warehouses") + "?settlement_ref=abc"
+        response = await self.async_client.get(url)
+        self.assertEqual(response.json(), {"success": False, "warehouses": []})
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(NOVA_POSHTA_ERRORS.labels("getWarehouses", "http")._value.get(), errors + 1)
+
+        self.assertEqual((await self.async_client.post(url)).status_code, 405)
@@ -1,33 +1,30 @@
+import asyncio
 import logging
+import time
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
 from django.shortcuts import redirect, render, get_object_or_404
 from django.urls import reverse_lazy
-from django.views.decorators.http import require_GET
 from django.views.generic import FormView, TemplateView
 from django.conf import settings
-from django.http import JsonResponse, Http404
+from django.http import JsonResponse, Http404, HttpResponseNotAllowed
 from django.core.cache import cache
 
+import httpx
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-from carts.models import Cart
+from carts.utils import get_user_carts
 from orders.forms import CreateOrderForm
 from orders.models import Order, OrderItem
 from orders.utils import send_order_email_to_seller, send_order_email_to_customer
 from goods.models import Products
+from common.metrics import CHECKOUT, NOVA_POSHTA_ERRORS, NOVA_POSHTA_SECONDS
 
 logger = logging.getLogger(__name__)
 
-def get_user_carts(request):
-    if request.user.is_authenticated:
-        return Cart.objects.filter(user=request.user)
-    else:
-        return Cart.objects.filter(session_key=request.session.session_key)
-
 
 class CreateOrderView(FormView):
     template_name = 'orders/create_order.html'
@@ -73,6 +70,7 @@ class CreateOrderView(FormView):
                             insufficient.append(f"{names.get(pid, 'Товар')}:\nдоступно {have}, в корзине {need}")
 
                     if insufficient:
+                        CHECKOUT.labels("insufficient_stock").inc()
                         messages.error(
                             self.request,
                             "Недостаточно товара на складе:\n" + "\n".join(insufficient)
@@ -137,13 +135,16 @@ class CreateOrderView(FormView):
                         self.request.session['allowed_orders'] = allowed
                         self.request.session.modified = True
 
+                    CHECKOUT.labels("success").inc()
                     messages.success(self.request, 'Заказ успешно оформлен!')
                     return redirect('orders:order_success', order_uuid=order.uuid)
                 else:
+                    CHECKOUT.labels("empty_cart").inc()
                     messages.error(self.request, 'Ваша корзина пуста')
                     return redirect('orders:create_order')
 
         except Exception as e:
+            CHECKOUT.labels("error").inc()
             messages.error(self.request, f'Ошибка при оформлении заказа: {str(e)}')
             return redirect('orders:create_order')
 
@@ -201,13 +202,19 @@ class OrderSuccessView(TemplateView):
 
 
 # nova poshta поиск отделений
+NP_API_URL = "https://api.novaposhta.ua/v2.0/json/"
+NP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+NP_RETRIES = 3
+NP_BACKOFF = 0.5
+
+
 def _np_session():
     """Requests session with retries for Nova Poshta API calls."""
     s = requests.Session()
     retries = Retry(
-        total=3,
-        backoff_factor=0.5,
-        status_forcelist=[429, 500, 502, 503, 504],
+        total=NP_RETRIES,
+        backoff_factor=NP_BACKOFF,
+        status_forcelist=list(NP_RETRY_STATUSES),
         allowed_methods=["POST"],
         raise_on_status=False,
     )
@@ -216,13 +223,63 @@ def _np_session():
     s.mount("http://", adapter)
     return s
 
-def search_city(request):
+
+def _np_post(payload, timeout):
+    """POST to the Nova Poshta API; returns parsed JSON ({} on HTTP error) and records latency/errors."""
+    method = payload.get("calledMethod", "unknown")
+    started = time.perf_counter()
+    try:
+        resp = _np_session().post(NP_API_URL, json=payload, timeout=timeout)
+        data_json = resp.json() if resp.ok else {}
+    except Exception:
+        NOVA_POSHTA_ERRORS.labels(method, "exception").inc()
+        raise
+    finally:
+        NOVA_POSHTA_SECONDS.labels(method).observe(time.perf_counter() - started)
+    if not resp.ok:
+        NOVA_POSHTA_ERRORS.labels(method, "http").inc()
+    elif not data_json.get("success"):
+        NOVA_POSHTA_ERRORS.labels(method, "api").inc()
+    return data_json
+
+def _np_async_client(timeout):
+    """httpx client for the async views; the transport retries failed connects."""
+    return httpx.AsyncClient(timeout=timeout, transport=httpx.AsyncHTTPTransport(retries=NP_RETRIES))
+
+
+async def _np_apost(payload, timeout):
+    """Async twin of _np_post: same retry policy on 429/5xx, metrics and return value."""
+    method = payload.get("calledMethod", "unknown")
+    started = time.perf_counter()
+    try:
+        async with _np_async_client(timeout) as client:
+            for attempt in range(NP_RETRIES + 1):
+                resp = await client.post(NP_API_URL, json=payload)
+                if resp.status_code not in NP_RETRY_STATUSES or attempt == NP_RETRIES:
+                    break
+                await asyncio.sleep(NP_BACKOFF * 2 ** attempt)
+        data_json = resp.json() if resp.is_success else {}
+    except Exception:
+        NOVA_POSHTA_ERRORS.labels(method, "exception").inc()
+        raise
+    finally:
+        NOVA_POSHTA_SECONDS.labels(method).observe(time.perf_counter() - started)
+    if not resp.is_success:
+        NOVA_POSHTA_ERRORS.labels(method, "http").inc()
+    elif not data_json.get("success"):
+        NOVA_POSHTA_ERRORS.labels(method, "api").inc()
+    return data_json
+
+
+# search_city / get_warehouses are async: the NP API may take seconds, and under ASGI
+# the wait no longer holds a worker thread
+async def search_city(request):
     q = request.GET.get('q', '')[:100]
     if len(q) < 2:
         return JsonResponse([], safe=False)
     key = settings.NOVA_POSHTA_API_KEY or ''
     cache_key = f"np:city:{q.lower()}"
-    cached = cache.get(cache_key)
+    cached = await cache.aget(cache_key)
     if cached is not None:
         return JsonResponse(cached, safe=False)
     payload = {
@@ -236,11 +293,7 @@ def search_city(request):
         }
     }
     try:
-        session = _np_session()
-        resp = session.post(
-            "https://api.novaposhta.ua/v2.0/json/", json=payload, timeout=6
-        )
-        data_json = resp.json() if resp.ok else {}
+        data_json = await _np_apost(payload, timeout=6)
         if data_json.get('success'):
             data = data_json.get('data', [])
             results = [
@@ -251,7 +304,7 @@ def search_city(request):
                 for x in data
                 for item in x.get('Addresses', [])
             ]
-            cache.set(cache_key, results, 300)
+            await cache.aset(cache_key, results, 300)
             return JsonResponse(results, safe=False)
         return JsonResponse([], safe=False)
     except Exception as e:
@@ -260,14 +313,16 @@ def search_city(request):
         return JsonResponse([], safe=False)
 
 
-@require_GET
-def get_warehouses(request):
+async def get_warehouses(request):
+    # require_GET doesn't wrap coroutines before Django 5.0
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
     settlement_ref = request.GET.get("settlement_ref")
     if not settlement_ref:
         return JsonResponse({"success": False, "warehouses": []})
     key = settings.NOVA_POSHTA_API_KEY or ''
     cache_key = f"np:wh:{settlement_ref}"
-    cached = cache.get(cache_key)
+    cached = await cache.aget(cache_key)
     if cached is not None:
         return JsonResponse(cached)
 
@@ -280,18 +335,14 @@ def get_warehouses(request):
         }
     }
     try:
-        session = _np_session()
-        resp = session.post(
-            "https://api.novaposhta.ua/v2.0/json/", json=payload, timeout=12
-        )
-        data_json = resp.json() if resp.ok else {}
+        data_json = await _np_apost(payload, timeout=12)
         if data_json.get("success"):
             warehouses = [
                 w.get("Description", "")
                 for w in data_json.get("data", [])
             ]
             result = {"success": True, "warehouses": warehouses}
-            cache.set(cache_key, result, 300)
+            await cache.aset(cache_key, result, 300)
             return JsonResponse(result)
     except Exception as e:
         logger.warning("NP get_warehouses failed (ref=%s): %s", settlement_ref, e)
@@ -308,11 +359,7 @@ def get_warehouse_description(ref):
         }
     }
     try:
-        session = _np_session()
-        res_resp = session.post(
-            "https://api.novaposhta.ua/v2.0/json/", json=payload, timeout=12
-        )
-        res = res_resp.json() if res_resp.ok else {}
+        res = _np_post(payload, timeout=12)
         if res.get("success") and res.get("data"):
             return res["data"][0].get("Description", ref)
     except Exception as e:
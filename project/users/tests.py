@@ -1,3 +1,16 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from common.testing import LOCMEM_CACHES, QueryBudgetMixin, seed_catalog
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProfileQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_catalog()
+
+    def test_profile(self):
+        self.client.force_login(self.data["users"][0])
+        with self.assertQueryBudget(4):
+            self.assertEqual(self.client.get(reverse("user:profile")).status_code, 200)